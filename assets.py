@@ -0,0 +1,222 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, only .gz files are made without it
+    brotli = None
+
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+# directories under static/ which are made by build steps, they are not fingerprinted again
+GENERATED_DIRS = (DIST_DIR,)
+# third party files, e.g. CKEditor's skin css, use classes which templates don't have
+NO_PURGE_DIRS = ("vendor/",)
+COMPRESSIBLE = (".css", ".js", ".svg", ".ico", ".json", ".txt", ".html", ".map", ".xml")
+# precompressed variants by Accept-Encoding preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class AssetManifest:
+    """Maps static filenames to fingerprinted ones, e.g. css/styles.css -> dist/css/styles.0a1b2c3d4e5f.css"""
+
+    def __init__(self, files=None):
+        self.files = files or {}
+        self.version = hashlib.sha1(json.dumps(self.files, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def get(self, filename):
+        return self.files.get(filename)
+
+    @classmethod
+    def load(cls, static_dir):
+        try:
+            with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)) as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return cls()
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(filename, data):
+    stem, ext = os.path.splitext(filename)
+    return "{}.{}{}".format(stem, fingerprint(data), ext)
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_compressed(path, data):
+    """Writes gzip and, if brotli is installed, brotli variants next to path."""
+
+    with open(path + ".gz", "wb") as f:
+        with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    if brotli is not None:
+        write_file(path + ".br", brotli.compress(data, quality=11))
+
+
+def static_files(static_dir):
+    """Relative paths of source files in static/ with / separators."""
+
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [name for name in dirs if name not in GENERATED_DIRS]
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/")
+
+
+def build_assets(static_dir, purge_css_with=None, log=print):
+    """Copies every static file to static/dist with a content hash in its name.
+
+    Text files get .gz/.br siblings. `purge_css_with` is a set of words used by
+    templates and scripts, if it is given unused css rules are dropped first.
+    Returns the new AssetManifest."""
+
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    files = {}
+    for filename in static_files(static_dir):
+        with open(os.path.join(static_dir, filename), "rb") as f:
+            data = f.read()
+
+        if purge_css_with is not None and filename.endswith(".css") and not filename.startswith(NO_PURGE_DIRS):
+            purged = purge_css(data.decode("utf-8"), purge_css_with).encode("utf-8")
+            log("{}: {} -> {} bytes after purge".format(filename, len(data), len(purged)))
+            data = purged
+
+        target = "{}/{}".format(DIST_DIR, hashed_name(filename, data))
+        target_path = os.path.join(static_dir, target)
+        if not os.path.exists(target_path):
+            write_file(target_path, data)
+            if filename.endswith(COMPRESSIBLE):
+                write_compressed(target_path, data)
+        files[filename] = target
+
+    remove_stale(dist_dir, set(files.values()))
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w") as f:
+        json.dump(files, f, indent=1, sort_keys=True)
+    log("{} static file(s) fingerprinted into {}".format(len(files), dist_dir))
+    return AssetManifest(files)
+
+
+def remove_stale(dist_dir, current):
+    """Deletes fingerprinted files of old builds."""
+
+    static_dir = os.path.dirname(dist_dir)
+    for root, dirs, files in os.walk(dist_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            base = relative[:-3] if relative.endswith((".gz", ".br")) else relative
+            if name != MANIFEST_NAME and base not in current:
+                os.remove(path)
+
+
+def negotiate(accept_encodings, path):
+    """Best precompressed variant of path the client accepts: (encoding, path) or (None, path)."""
+
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] and os.path.exists(path + suffix):
+            return encoding, path + suffix
+    return None, path
+
+
+# CSS purging
+# Class and id names are looked up in the words of templates and scripts. It is rough but
+# safe: a word anywhere in a template keeps the rule. Classes which only Bootstrap's own
+# javascript adds are kept by SAFELIST.
+SAFELIST = {"show", "showing", "hide", "collapsing", "collapse", "fade", "active", "disabled",
+            "modal-open", "modal-backdrop", "was-validated", "is-valid", "is-invalid"}
+SAFE_PREFIXES = ("tooltip", "popover", "carousel", "dropdown", "bs-", "navbar", "modal")
+
+_word_re = re.compile(r"[A-Za-z0-9_-]+")
+_selector_name_re = re.compile(r"[.#](-?[_a-zA-Z][_a-zA-Z0-9-]*)")
+
+
+def used_words(*directories):
+    """Every word in html/js files of the directories."""
+
+    words = set()
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if name not in GENERATED_DIRS]
+            for name in files:
+                if name.endswith((".html", ".js")):
+                    with open(os.path.join(root, name), encoding="utf-8") as f:
+                        words.update(_word_re.findall(f.read()))
+    return words
+
+
+def selector_is_used(selector, words):
+    for name in _selector_name_re.findall(selector):
+        if name in words or name in SAFELIST or name.startswith(SAFE_PREFIXES):
+            continue
+        return False
+    return True
+
+
+def _css_blocks(css):
+    """Splits css into (prelude, body) pairs of top level blocks. Comments are dropped,
+    a statement like @charset has body None."""
+
+    css = re.sub(r"/\*(?!!).*?\*/", "", css, flags=re.S)  # /*! license */ comments stay
+    blocks = []
+    i = 0
+    while i < len(css):
+        brace = css.find("{", i)
+        semicolon = css.find(";", i)
+        if brace == -1:
+            rest = css[i:].strip()
+            if rest:
+                blocks.append((rest, None))
+            break
+        if semicolon != -1 and semicolon < brace and css[i:semicolon].strip().startswith("@"):
+            blocks.append((css[i:semicolon + 1].strip(), None))
+            i = semicolon + 1
+            continue
+        depth = 0
+        j = brace
+        while j < len(css):
+            if css[j] == "{":
+                depth += 1
+            elif css[j] == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+            j += 1
+        blocks.append((css[i:brace].strip(), css[brace + 1:j]))
+        i = j + 1
+    return blocks
+
+
+def purge_css(css, words):
+    """Drops css rules whose selectors all use a class/id not found in words."""
+
+    output = []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            output.append(prelude)
+        elif prelude.startswith(("@media", "@supports")):
+            inner = purge_css(body, words)
+            if inner.strip():
+                output.append("{}{{{}}}".format(prelude, inner))
+        elif prelude.startswith("@"):
+            output.append("{}{{{}}}".format(prelude, body))
+        else:
+            # keep license comments which stay in front of the selector
+            comments = re.findall(r"/\*!.*?\*/", prelude, flags=re.S)
+            selector_text = re.sub(r"/\*!.*?\*/", "", prelude, flags=re.S).strip()
+            selectors = [selector for selector in selector_text.split(",") if selector_is_used(selector, words)]
+            output.extend(comments)
+            if selectors:
+                output.append("{}{{{}}}".format(",".join(selector.strip() for selector in selectors), body.strip()))
+    return "\n".join(output)
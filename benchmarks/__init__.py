@@ -0,0 +1 @@
+"""Benchmarks of ozyalhan.com, run them with `python -m benchmarks.<name>`."""
@@ -0,0 +1,217 @@
+"""Mixed HTTP load on a local server from several client processes.
+
+    python -m benchmarks.bench_http --blogs 2000 --clients 8 --seconds 20 --save-baseline http.json
+    python -m benchmarks.bench_http --url http://127.0.0.1:8000 --database ozy_blog.db --clients 8
+
+Without --url the app is served by a threaded werkzeug server in its own process on a
+freshly seeded database, and queries per request are counted there. With --url an
+already running server (e.g. gunicorn on the seeded ozy_blog.db) is loaded; --database
+must then be its sqlite file, queries are not reported.
+
+Each client process picks scenarios by their weight in workload.SCENARIOS until the
+time is over. Prints JSON, with --baseline exits 1 on regressions."""
+import argparse
+import http.client
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import corpus, workload  # noqa: E402
+
+
+ROUTE_HEADER = "X-Bench-Route"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(database, port, no_page_cache, stop, stats):
+    """Server process: the app with a query counter around it, until stop is set."""
+
+    from werkzeug.serving import make_server
+    from werkzeug.wsgi import ClosingIterator
+
+    blog = corpus.load_app(database, no_page_cache=no_page_cache)
+    counter = workload.QueryCounter(blog.db.engine)
+    totals = {}
+
+    def counting_app(environ, start_response):
+        counter.reset()
+        route = environ.get("HTTP_" + ROUTE_HEADER.upper().replace("-", "_"), "")
+
+        def record():  # after the body is sent, streamed pages query while they are sent
+            requests, queries = totals.get(route, (0, 0))
+            totals[route] = (requests + 1, queries + counter.value)
+
+        return ClosingIterator(blog.app.wsgi_app(environ, start_response), [record])
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log
+    server = make_server("127.0.0.1", port, counting_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stop.wait()
+    server.shutdown()
+    blog.password_hasher.shutdown()
+    blog.image_pipeline.shutdown()
+    stats.put(totals)
+
+
+def wait_for(host, port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("server didn't start on {}:{}".format(host, port))
+
+
+def send(host, port, method, path, form=None, cookie=None, route=""):
+    """One request on a new connection: (status, headers)."""
+
+    headers = {ROUTE_HEADER: route}
+    body = None
+    if form is not None:
+        body = urlencode(form)
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    if cookie:
+        headers["Cookie"] = cookie
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status, response.getheaders()
+    finally:
+        connection.close()
+
+
+def session_cookie(headers):
+    for name, value in headers:
+        if name.lower() == "set-cookie" and value.startswith("session="):
+            return value.split(";", 1)[0]
+    return None
+
+
+def client(host, port, info, database, names, deadline, worker, seed, results):
+    """Load process; keeps the cookie of its first login for logged in scenarios."""
+
+    work = workload.Workload(info, database, worker=worker + 1, seed=seed)
+    method, path, form = work.request("login")
+    status, headers = send(host, port, method, path, form, route="login")
+    cookie = session_cookie(headers)
+
+    rng = random.Random(seed * 7919 + worker)
+    weights = [workload.SCENARIOS[name] for name in names]
+    latencies = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        spec = work.request(name)
+        if spec is None:
+            continue
+        method, path, form = spec
+        started = time.perf_counter()
+        try:
+            status, headers = send(host, port, method, path, form,
+                                   cookie=cookie if workload.needs_login(name) else None, route=name)
+        except OSError:
+            status = 599
+        latencies[name].append(time.perf_counter() - started)
+        if status >= 400:
+            errors[name] += 1
+    results.put((latencies, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load a running server instead of starting one")
+    parser.add_argument("--database", help="a seeded sqlite file, default is a new temporary one")
+    corpus.add_arguments(parser)
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--no-page-cache", action="store_true")
+    workload.add_arguments(parser)
+    args = parser.parse_args()
+    names = workload.scenario_names(args)
+    if args.url and not args.database:
+        parser.error("--url needs --database, the sqlite file of that server")
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="bench-http-"), "bench.db")
+    if not args.database:
+        seeder = multiprocessing.Process(target=seed_database, args=(database, args))
+        seeder.start()
+        seeder.join()
+    info = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=read_corpus_info, args=(database, info))
+    reader.start()
+    info = info.get()
+    reader.join()
+
+    server = stop = stats = None
+    if args.url:
+        host, port = urlsplit(args.url).hostname, urlsplit(args.url).port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        stop, stats = multiprocessing.Event(), multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(database, port, args.no_page_cache, stop, stats))
+        server.start()
+    wait_for(host, port)
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + args.seconds
+    clients = [multiprocessing.Process(target=client, args=(host, port, info, database, names, deadline,
+                                                            worker, args.seed, results))
+               for worker in range(args.clients)]
+    for process in clients:
+        process.start()
+    collected = [results.get() for _ in clients]
+    for process in clients:
+        process.join()
+
+    totals = {}
+    if server is not None:
+        stop.set()
+        totals = stats.get()
+        server.join()
+
+    routes = {}
+    for name in names:
+        latencies = [latency for values, errors in collected for latency in values[name]]
+        if not latencies:
+            continue
+        requests, queries = totals.get(name, (0, None))
+        routes[name] = workload.summarize(latencies, args.seconds, sum(errors[name] for values, errors in collected),
+                                          None if queries is None else queries * len(latencies) / max(1, requests))
+    total = sum(route["requests"] for route in routes.values())
+    report = {"mode": "http", "url": args.url or "http://{}:{}".format(host, port), "clients": args.clients,
+              "seconds": args.seconds, "page_cache": not args.no_page_cache, "requests": total,
+              "throughput": round(total / args.seconds, 1), "routes": routes}
+    sys.exit(workload.finish(report, args))
+
+
+def seed_database(database, args):
+    blog = corpus.load_app(database)
+    corpus.seed_corpus(blog, users=args.users, counts=corpus.counts_of(args), seed=args.seed,
+                       log=lambda message: print(message, file=sys.stderr))
+
+
+def read_corpus_info(database, queue):
+    queue.put(corpus.corpus_info(corpus.load_app(database)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Password hashing throughput for several sha256_crypt rounds.
+
+    python -m benchmarks.bench_passwords --rounds 5000 100000 535000 --workers 4
+
+For every rounds value it measures hash/verify per second on one thread and
+through PasswordHasher's process pool with many request threads, and prints JSON."""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, hash_password, verify_password  # noqa: E402
+
+
+def measure(function, count, threads=1):
+    started = time.perf_counter()
+    if threads == 1:
+        for _ in range(count):
+            function()
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(function) for _ in range(count)]:
+                future.result()
+    elapsed = time.perf_counter() - started
+    return {"count": count, "seconds": round(elapsed, 4), "per_second": round(count / elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[5000, 50000, 535000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--threads", type=int, default=16, help="request threads calling the hasher")
+    parser.add_argument("--count", type=int, default=20)
+    args = parser.parse_args()
+
+    results = []
+    for rounds in args.rounds:
+        hasher = PasswordHasher(rounds=rounds, workers=args.workers, max_waiting=args.threads)
+        hashed = hash_password("correct horse", rounds)
+        try:
+            hasher.hash("warm up")  # starts the pool processes
+            results.append({
+                "rounds": rounds,
+                "hash_inline": measure(lambda: hash_password("correct horse", rounds), args.count),
+                "verify_inline": measure(lambda: verify_password("correct horse", hashed, rounds), args.count),
+                "hash_pool": measure(lambda: hasher.hash("correct horse"), args.count, args.threads),
+                "verify_pool": measure(lambda: hasher.verify("correct horse", hashed), args.count, args.threads),
+            })
+        finally:
+            hasher.shutdown()
+
+    print(json.dumps({"workers": args.workers, "threads": args.threads, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
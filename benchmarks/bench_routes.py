@@ -0,0 +1,81 @@
+"""Latency and queries per request of every route through the Flask test client.
+
+    python -m benchmarks.bench_routes --blogs 2000 --requests 200 --save-baseline baseline.json
+    python -m benchmarks.bench_routes --blogs 2000 --requests 200 --baseline baseline.json
+
+A corpus is seeded in a temporary database unless --database is given. Each scenario
+runs --requests times one after the other, so the numbers are the cost of the route
+itself without a web server. Prints JSON, with --baseline exits 1 on regressions."""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import corpus, workload  # noqa: E402
+
+
+def log_in(client):
+    method, path, form = workload.Workload({}, None).request("login")
+    response = client.post(path, data=form)
+    if response.status_code != 302:
+        raise SystemExit("benchmark user can't log in, seed the database with benchmarks.corpus")
+
+
+def run_scenario(client, work, counter, name, requests, warmup):
+    latencies, errors, queries = [], 0, 0
+    for i in range(warmup + requests):
+        spec = work.request(name)
+        if spec is None:
+            continue
+        method, path, form = spec
+        counter.reset()
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        response.get_data()  # streamed pages render here
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+        queries += counter.value
+    return workload.summarize(latencies, sum(latencies), errors, queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", help="a seeded sqlite file, default is a new temporary one")
+    corpus.add_arguments(parser)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--no-page-cache", action="store_true", help="measure rendering, not the page cache")
+    workload.add_arguments(parser)
+    args = parser.parse_args()
+    names = workload.scenario_names(args)
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="bench-routes-"), "bench.db")
+    blog = corpus.load_app(database, no_page_cache=args.no_page_cache)
+    if not args.database:
+        corpus.seed_corpus(blog, users=args.users, counts=corpus.counts_of(args), seed=args.seed,
+                           log=lambda message: print(message, file=sys.stderr))
+    info = corpus.corpus_info(blog)
+    counter = workload.QueryCounter(blog.db.engine)
+
+    anonymous, member = blog.app.test_client(), blog.app.test_client()
+    log_in(member)
+    work = workload.Workload(info, database, seed=args.seed)
+    routes = {}
+    for name in names:
+        client = member if workload.needs_login(name) else anonymous
+        routes[name] = run_scenario(client, work, counter, name, args.requests, args.warmup)
+
+    report = {"mode": "test_client", "database": database, "page_cache": not args.no_page_cache,
+              "requests_per_route": args.requests, "routes": routes}
+    sys.exit(workload.finish(report, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Read throughput of SQLite while writes are in flight, default journal vs the WAL profile.
+
+    python -m benchmarks.bench_sqlite_concurrency --posts 5000 --readers 4 --seconds 5
+
+Reader processes run the listing and detail queries of the site, one writer process
+commits an edit and a new post in a loop. Prints JSON per mode."""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import sqlite_pragmas  # noqa: E402
+
+
+# SQLite defaults, as the app had before config.py; busy_timeout is set so readers wait instead of failing
+DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": 5000}
+
+LISTING = "SELECT id, title, author, publish_date FROM blogs ORDER BY publish_date DESC, id DESC LIMIT 21"
+DETAIL = "SELECT id, title, author, content, publish_date FROM blogs WHERE id = ?"
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    for name, value in pragmas.items():
+        connection.execute("PRAGMA {} = {}".format(name, value))
+    return connection
+
+
+def create_database(path, posts, pragmas):
+    connection = connect(path, pragmas)
+    connection.executescript("""
+        CREATE TABLE blogs (id INTEGER PRIMARY KEY, title VARCHAR(40) NOT NULL, author VARCHAR(40) NOT NULL,
+                            content TEXT NOT NULL, publish_date DATETIME NOT NULL);
+        CREATE INDEX ix_blogs_publish_date ON blogs (publish_date, id);
+    """)
+    body = "<p>" + "lorem ipsum dolor sit amet " * 80 + "</p>"
+    connection.execute("BEGIN")
+    connection.executemany(
+        "INSERT INTO blogs (title, author, content, publish_date) VALUES (?, 'ozyalhan', ?, datetime('now', ?))",
+        (("Post {}".format(i), body, "-{} minutes".format(posts - i)) for i in range(posts)))
+    connection.execute("COMMIT")
+    connection.close()
+
+
+def reader(path, pragmas, posts, deadline, results):
+    connection = connect(path, pragmas)
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.execute(LISTING).fetchall()
+            connection.execute(DETAIL, (random.randint(1, posts),)).fetchall()
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(("reader", latencies, errors))
+
+
+def writer(path, pragmas, posts, deadline, results):
+    connection = connect(path, pragmas)
+    commits, errors = 0, 0
+    while time.time() < deadline:
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("UPDATE blogs SET title = ? WHERE id = ?",
+                               ("Edited {}".format(commits), random.randint(1, posts)))
+            connection.execute("INSERT INTO blogs (title, author, content, publish_date) "
+                               "VALUES ('New', 'ozyalhan', '<p>new</p>', datetime('now'))")
+            connection.execute("COMMIT")
+            commits += 1
+        except sqlite3.OperationalError:
+            errors += 1
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+    results.put(("writer", commits, errors))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_mode(name, pragmas, args):
+    directory = tempfile.mkdtemp(prefix="bench-sqlite-")
+    path = os.path.join(directory, "bench.db")
+    create_database(path, args.posts, pragmas)
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + args.seconds
+    processes = [multiprocessing.Process(target=reader, args=(path, pragmas, args.posts, deadline, results))
+                 for _ in range(args.readers)]
+    if not args.no_writer:
+        processes.append(multiprocessing.Process(target=writer, args=(path, pragmas, args.posts, deadline, results)))
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [latency for kind, values, errors in collected if kind == "reader" for latency in values]
+    writes = sum(values for kind, values, errors in collected if kind == "writer")
+    return {
+        "mode": name,
+        "pragmas": pragmas,
+        "reads_per_second": round(len(latencies) / args.seconds, 1),
+        "read_ms": {"p50": ms(percentile(latencies, 0.50)), "p95": ms(percentile(latencies, 0.95)),
+                    "p99": ms(percentile(latencies, 0.99))},
+        "read_errors": sum(errors for kind, values, errors in collected if kind == "reader"),
+        "writes_per_second": round(writes / args.seconds, 1),
+        "write_errors": sum(errors for kind, values, errors in collected if kind == "writer"),
+    }
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--no-writer", action="store_true", help="only readers, for a baseline")
+    args = parser.parse_args()
+
+    modes = [("default", DEFAULT_PRAGMAS), ("production", sqlite_pragmas())]
+    print(json.dumps([run_mode(name, pragmas, args) for name, pragmas in modes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
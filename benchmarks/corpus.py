@@ -0,0 +1,178 @@
+"""Synthetic corpus of users, blogs, diaries and projects for benchmarks.
+
+    python -m benchmarks.corpus --database ozy_blog.db --users 20 --blogs 5000 --diaries 2000 --projects 500
+
+Posts have realistic sizes: lengths are log-normal around a 600 word article, some
+posts have code blocks and images like the real ones. Rows are rendered like saved
+posts and inserted with executemany; feed fragments, the search index and related
+posts are made at the end, so benchmarks measure the paths a real site takes."""
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_PASSWORD = "benchmark-password"
+BENCH_USER = "bench0"
+
+WORDS = ("python flask sqlite query index cache page render template request response session "
+         "error bug diary project server client thread process worker memory latency throughput "
+         "database table column row cursor transaction commit lock journal write read benchmark "
+         "deploy nginx gunicorn docker linux ubuntu bash script test debug trace profile log "
+         "the a an of to in and for with on is was it this that we you they from by as at be "
+         "build release version feature refactor function class method module package import "
+         "search result title content author date post blog edit delete add user login password").split()
+
+# every post is about two of these, so related posts have something to find
+TOPICS = ("migrations pagination keyset fts5 tokenizer pillow avif webp pygments lexer ckeditor bootstrap "
+          "jquery smtp mailer cron scheduler websocket redis celery alembic pytest fixtures coverage "
+          "nginx-conf systemd letsencrypt certbot unicode emoji markdown sitemap").split()
+
+CODE = '''<pre class="prettyprint lang-py">
+@app.route("/blogs")
+def blogs():
+    page = paginate_posts(Blogs)
+    return render_template("blogs.html", blogs=page.items, page=page)
+</pre>'''
+IMAGE = '<p><img src="/static/assets/img/profile.jpg" alt="screenshot"></p>'
+
+
+def sentence(rng, words, topics=()):
+    text = " ".join(rng.choice(topics) if topics and rng.random() < 0.1 else rng.choice(WORDS)
+                    for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def post_content(rng, mean_words=600, topics=()):
+    """HTML body of a post, log-normal length between 50 and 8000 words."""
+
+    words = int(min(8000, max(50, rng.lognormvariate(math.log(mean_words), 0.6))))
+    parts = []
+    while words > 0:
+        paragraph = min(words, rng.randint(40, 120))
+        parts.append("<p>{}</p>".format(" ".join(sentence(rng, 10, topics)
+                                                 for _ in range(max(1, paragraph // 10)))))
+        words -= paragraph
+        if rng.random() < 0.08:
+            parts.append(CODE)
+        elif rng.random() < 0.03:
+            parts.append(IMAGE)
+    return "\n".join(parts)
+
+
+def post_title(rng, topics=()):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 4))] + list(topics[:1])
+    return " ".join(words).title()[:40]
+
+
+def load_app(database_path, no_page_cache=False):
+    """Imports blog.py on the given sqlite file with login throttling off and migrates it.
+
+    Settings are read from the environment at import time, so this must run before
+    anything else imports blog."""
+
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(database_path)
+    for name in ("LOGIN_IP_BURST", "LOGIN_EMAIL_BURST"):
+        os.environ.setdefault(name, "1000000000")
+    if no_page_cache:
+        os.environ["PAGE_CACHE_MAX_ENTRIES"] = "0"
+    import blog
+
+    blog.migrate_database()
+    return blog
+
+
+def seed_corpus(blog, users=10, counts=None, seed=1, days=3 * 365, log=print):
+    """Inserts users and posts, counts is {kind: number of posts}. The first user is
+    BENCH_USER with BENCH_PASSWORD, every user has the same password hash."""
+
+    from content import render_content
+    from passwords import hash_password
+
+    rng = random.Random(seed)
+    counts = counts or {}
+    password = hash_password(BENCH_PASSWORD, blog.password_hasher.rounds)
+    start = blog.db.session.query(blog.db.func.count(blog.Users.id)).scalar()
+    user_rows = [{"fullname": "Bench User {}".format(i), "username": "bench{}".format(i),
+                  "email": "bench{}@benchmark.example.com".format(i), "password": password}
+                 for i in range(start, start + users)]
+    authors = [row["username"] for row in user_rows] or [BENCH_USER]
+
+    now = datetime.utcnow()
+    with blog.db.engine.begin() as connection:
+        if user_rows:
+            connection.execute(blog.Users.__table__.insert(), user_rows)
+        for kind, count in counts.items():
+            table = blog.POST_MODELS[kind].__table__
+            last_id = connection.execute(blog.select([blog.db.func.max(table.c.id)])).scalar() or 0
+            batch = []
+            for i in range(count):
+                published = now - timedelta(seconds=rng.randint(0, days * 86400))
+                topics = rng.sample(TOPICS, 2)
+                content = post_content(rng, topics=topics)
+                rendered = render_content(content)
+                batch.append({"title": post_title(rng, topics), "author": rng.choice(authors),
+                              "content": content, "publish_date": published, "last_modified": published,
+                              "content_format": "html", "content_html": rendered.html,
+                              "content_css": rendered.css, "excerpt": rendered.excerpt,
+                              "word_count": rendered.word_count, "reading_time": rendered.reading_time})
+                if len(batch) == 1000:
+                    connection.execute(table.insert(), batch)
+                    batch = []
+            if batch:
+                connection.execute(table.insert(), batch)
+            blog.feeds.store_entries_after(connection, kind, table.name, last_id)
+            blog.touch_content_version(connection, kind)
+            log("{} {} posts".format(count, kind))
+
+        blog.fts.create_search_index(connection)
+        blog.fts.rebuild_search_index(connection, blog.POST_TABLES)
+        blog.related.rebuild_related(connection, blog.related_corpus, blog.POST_TABLES,
+                                     blog.app.config["RELATED_POSTS"])
+    blog.page_cache.clear()
+    blog.title_index.reload()
+    log("{} users, search index and related posts rebuilt".format(len(user_rows)))
+
+
+def corpus_info(blog):
+    """Ids, cursors and words the workloads pick requests from."""
+
+    from pagination import encode_cursor
+
+    info = {"ids": {}, "cursors": {}, "words": ["python", "sqlite", "flask", "cache", "deploy"]}
+    for kind, model in blog.POST_MODELS.items():
+        rows = blog.db.session.query(model.id, model.publish_date).order_by(model.id).all()
+        info["ids"][kind] = [row.id for row in rows]
+        info["cursors"][kind] = [encode_cursor(row) for row in rows[::max(1, len(rows) // 50)]]
+    blog.db.session.remove()
+    return info
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--blogs", type=int, default=2000)
+    parser.add_argument("--diaries", type=int, default=1000)
+    parser.add_argument("--projects", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def counts_of(args):
+    return {"blog": args.blogs, "diary": args.diaries, "project": args.projects}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=os.path.join(ROOT, "ozy_blog.db"))
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    blog = load_app(args.database)
+    seed_corpus(blog, users=args.users, counts=counts_of(args), seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
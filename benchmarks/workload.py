@@ -0,0 +1,197 @@
+"""Requests of the route benchmarks, latency statistics and the baseline comparison."""
+import json
+import random
+import sqlite3
+import threading
+
+from benchmarks.corpus import BENCH_PASSWORD, BENCH_USER, post_content, post_title
+
+
+TABLES = {"blog": "blogs", "diary": "diaries", "project": "projects"}
+LISTING_PATHS = {kind: "/" + table for kind, table in TABLES.items()}
+ADD_PATHS = {"blog": "/addblog", "diary": "/adddiary", "project": "/addproject"}
+
+# name -> weight in the mixed HTTP load, reads are most of the traffic
+SCENARIOS = {
+    "index": 10, "about": 2,
+    "blogs": 10, "blogs_deep": 3, "diaries": 5, "projects": 3,
+    "blog": 20, "diary": 8, "project": 5,
+    "search": 6, "dashboard": 2, "login": 1,
+    "add_blog": 1, "edit_blog": 1, "delete_blog": 1,
+    "add_diary": 1, "edit_diary": 1, "delete_diary": 1,
+    "add_project": 1, "edit_project": 1, "delete_project": 1,
+}
+LOGGED_IN = ("dashboard", "add_", "edit_", "delete_")
+
+
+class Workload:
+    """Picks the request of a scenario: (method, path, form data).
+
+    Posts made by add_* scenarios get a title with the worker name, delete_* scenarios
+    delete those again, so a run doesn't eat the corpus. They are looked up in the
+    sqlite file directly, outside the timed part."""
+
+    def __init__(self, info, database_path, worker=0, seed=1):
+        self.info = info
+        self.database_path = database_path
+        self.tag = "bench w{} ".format(worker)
+        self.rng = random.Random(seed * 1000 + worker)
+        self._added = 0
+
+    def request(self, name):
+        rng = self.rng
+        if name == "index":
+            return "GET", "/", None
+        if name == "about":
+            return "GET", "/about", None
+        if name in ("blogs", "diaries", "projects"):
+            return "GET", "/" + name, None
+        if name == "blogs_deep":
+            cursors = self.info["cursors"]["blog"]
+            return "GET", "/blogs?after={}".format(rng.choice(cursors)) if cursors else "/blogs", None
+        if name in ("blog", "diary", "project"):
+            ids = self.info["ids"][name]
+            return "GET", "/{}/{}".format(name, rng.choice(ids) if ids else 1), None
+        if name == "search":
+            return "GET", "/search?q={}".format(rng.choice(self.info["words"])), None
+        if name == "dashboard":
+            return "GET", "/dashboard", None
+        if name == "login":
+            return "POST", "/login", {"useremail": "{}@benchmark.example.com".format(BENCH_USER),
+                                      "userpassword": BENCH_PASSWORD}
+
+        action, kind = name.split("_")
+        if action == "add":
+            self._added += 1
+            return "POST", ADD_PATHS[kind], {"title": "{}{}".format(self.tag, self._added)[:40],
+                                             "content": post_content(rng)}
+        if action == "edit":
+            ids = self.info["ids"][kind]
+            return "POST", "/edit-{}/{}".format(kind, rng.choice(ids) if ids else 1), {
+                "title": post_title(rng), "content": post_content(rng)}
+        if action == "delete":
+            post_id = self.added_post(kind)
+            if post_id is None:
+                return None
+            return "GET", "/delete-{}/{}".format(kind, post_id), None
+        raise ValueError(name)
+
+    def added_post(self, kind):
+        connection = sqlite3.connect(self.database_path, timeout=30)
+        try:
+            row = connection.execute(
+                "SELECT id FROM {} WHERE author = ? AND title LIKE ? ORDER BY id DESC LIMIT 1".format(TABLES[kind]),
+                (BENCH_USER, self.tag + "%")).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+
+
+def needs_login(name):
+    return name.startswith(LOGGED_IN)
+
+
+class QueryCounter:
+    """Counts SQL statements run on an engine, per thread."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self._local.count = self.value + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def value(self):
+        return getattr(self._local, "count", 0)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def summarize(latencies, seconds, errors=0, queries=None):
+    """Statistics of one route; queries is the number of SQL statements of all requests."""
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "throughput": round(len(latencies) / seconds, 1) if seconds else None,
+        "queries_per_request": round(queries / len(latencies), 2) if queries is not None and latencies else None,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Regressions of report against baseline as strings.
+
+    A route regresses when its p95 is more than `tolerance` slower, its throughput is
+    that much lower, or it runs more queries per request. Routes missing from either
+    report are skipped."""
+
+    regressions = []
+    for name, old in baseline.get("routes", {}).items():
+        new = report.get("routes", {}).get(name)
+        if new is None:
+            continue
+        if old.get("p95_ms") and new.get("p95_ms") and new["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append("{}: p95 {} ms -> {} ms".format(name, old["p95_ms"], new["p95_ms"]))
+        if old.get("throughput") and new.get("throughput") is not None \
+                and new["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append("{}: throughput {} -> {} req/s".format(name, old["throughput"], new["throughput"]))
+        if old.get("queries_per_request") is not None and new.get("queries_per_request") is not None \
+                and new["queries_per_request"] > old["queries_per_request"] + 0.01:
+            regressions.append("{}: queries/request {} -> {}".format(
+                name, old["queries_per_request"], new["queries_per_request"]))
+        if new.get("errors") and not old.get("errors"):
+            regressions.append("{}: {} errors".format(name, new["errors"]))
+    return regressions
+
+
+def add_arguments(parser):
+    parser.add_argument("--routes", help="comma separated scenario names, default all: " + ",".join(SCENARIOS))
+    parser.add_argument("--output", help="write the JSON report to this file too")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the report as the baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with a stored baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+
+
+def scenario_names(args):
+    if not args.routes:
+        return list(SCENARIOS)
+    names = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit("unknown scenarios: " + ", ".join(unknown))
+    return names
+
+
+def finish(report, args):
+    """Prints the report, saves it and compares it with the baseline. Returns the exit code."""
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        status = 1 if report["regressions"] else 0
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+    return status
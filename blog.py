@@ -1,19 +1,202 @@
-from flask import Flask, render_template, redirect, request, url_for, flash, session, logging
+from flask import Flask, render_template, redirect, request, url_for, flash, session, logging, make_response, \
+    send_from_directory, send_file, abort, Response, stream_with_context, g, has_request_context, \
+    before_render_template, template_rendered, jsonify, get_flashed_messages
+from flask.signals import signals_available
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import exc
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import exc, event, text, inspect, select, bindparam
+from sqlalchemy.orm import sessionmaker, load_only, defer
 from wtforms import Form, StringField, TextAreaField, PasswordField, validators
-from passlib.hash import sha256_crypt
 from functools import wraps
+from werkzeug.http import is_resource_modified
+from markupsafe import Markup
+import atexit
+import hashlib
+import hmac
+import mimetypes
+import os
+import sqlite3
+import sys
+import time
+import zipfile
 from datetime import datetime
+import click
 from forms import ContactForm
+from config import Config
+from pagination import keyset_paginate, keyset_query, feed_paginate, feed_query
+import search as fts
+import feeds
+import migrations
+import static_export
+import bulk
+from content import render_content
+import assets
+import bundles
+import images
+from passwords import PasswordHasher, HasherBusy
+from ratelimit import RateLimiter, MemoryBuckets, SQLiteBuckets
+from cache import PageCache
+from metrics import RequestMetrics, RequestTimer, slow_request_report
+from jobs import JobQueue, PermanentJobError, Workers
+from counters import ViewCounter
+import counters
+import mail
+import related
+from suggest import TitleIndex
 
 app = Flask(__name__)
-app.secret_key = "ozyalhan-web-dev-project"  # required for flashing
+# Settings come from environment variables, see config.py
+app.config.from_object(Config)
+app.secret_key = app.config["SECRET_KEY"]  # required for flashing
+
+
+class BlogSQLAlchemy(SQLAlchemy):
+    def create_engine(self, sa_url, engine_opts):
+        """The app's engines get the pragmas and query timing; other engines in the
+        process (a migration test, a script) are left alone."""
+
+        engine = super().create_engine(sa_url, engine_opts)
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        event.listen(engine, "before_cursor_execute", _query_started)
+        event.listen(engine, "after_cursor_execute", _query_finished)
+        return engine
+
 
 # Setup for the ORM SQAlchemy
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////Users/ozgur/Desktop/ozyalhan/ozy_blog.db'
-db = SQLAlchemy(app)
+db = BlogSQLAlchemy(app)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL, synchronous, cache and mmap sizes etc. for every new SQLite connection of the app."""
+
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config["SQLITE_PRAGMAS"].items():
+        cursor.execute("PRAGMA {} = {}".format(name, value))
+    cursor.close()
+
+
+def templates_version():
+    """Newest modification time of templates, a part of ETags so new html is not answered with 304"""
+
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    return str(max(os.path.getmtime(os.path.join(root, name))
+                   for root, dirs, files in os.walk(template_dir) for name in files))
+
+
+app.config.setdefault("ETAG_VERSION", templates_version())
+
+# Fingerprinted static files made by `flask build-assets`, url_for("static", ...) uses them when they exist
+asset_manifest = assets.AssetManifest.load(app.static_folder)
+# Page scoped css/js bundles made by `flask build-assets` from `flask vendor-assets` files,
+# pages get the CDN files instead while they aren't built
+asset_bundles = bundles.Bundles(app.static_folder)
+
+# Resized copies of static images, made on first request, see responsive_image
+image_pipeline = images.ImagePipeline(app.static_folder,
+                                      app.config["IMAGE_CACHE_DIR"] or os.path.join(app.instance_path, "images"),
+                                      workers=app.config["IMAGE_WORKERS"])
+
+# Password hashing runs in a process pool, PASSWORD_HASH_ROUNDS can be changed any time:
+# old hashes are hashed again with the new rounds when their users login.
+password_hasher = PasswordHasher(rounds=app.config["PASSWORD_HASH_ROUNDS"],
+                                 workers=app.config["PASSWORD_HASH_WORKERS"],
+                                 max_waiting=app.config["PASSWORD_HASH_MAX_WAITING"])
+
+# Login throttling, runs before any query or hashing. Buckets are in memory of each process
+# unless RATE_LIMIT_STORAGE is a path of an sqlite file which all workers share.
+rate_limit_storage = SQLiteBuckets(app.config["RATE_LIMIT_STORAGE"]) if app.config["RATE_LIMIT_STORAGE"] \
+    else MemoryBuckets()
+login_ip_limiter = RateLimiter(rate_limit_storage, app.config["LOGIN_IP_BURST"],
+                               app.config["LOGIN_IP_PER_MINUTE"], prefix="login-ip:")
+login_email_limiter = RateLimiter(rate_limit_storage, app.config["LOGIN_EMAIL_BURST"],
+                                  app.config["LOGIN_EMAIL_PER_MINUTE"], prefix="login-email:")
+
+# Rendered public pages for anonymous visitors, see cached_page
+page_cache = PageCache(max_entries=app.config["PAGE_CACHE_MAX_ENTRIES"],
+                       max_bytes=app.config["PAGE_CACHE_MAX_BYTES"],
+                       ttl=app.config["PAGE_CACHE_TTL"])
+
+# Latency, SQL and template time per endpoint, served at /metrics in Prometheus format
+request_metrics = RequestMetrics()
+
+# Slow side effects (mail) run as jobs after the response, see the job handlers below
+job_queue = JobQueue(app.config["JOB_QUEUE_DATABASE"] or os.path.join(app.instance_path, "jobs.db"),
+                     max_attempts=app.config["JOB_MAX_ATTEMPTS"], retry_delay=app.config["JOB_RETRY_DELAY"])
+job_workers = Workers(job_queue, threads=app.config["JOB_WORKERS"], context=app.app_context)
+
+
+@app.after_request
+def count_view(response):
+    """Views of post pages, cached and 304 answers too. Written by view_counter later.
+    Only pages of posts that exist have an ETag (post_page_last_modified), so made up
+    ids like /blog/99999999999999999999999 are not counted."""
+
+    if app.config["COUNT_VIEWS"] and request.method == "GET" and request.endpoint in POST_MODELS \
+            and response.status_code in (200, 304) and "ETag" in response.headers:
+        try:
+            view_counter.hit(request.endpoint, int(request.view_args["id"]))
+        except ValueError:
+            pass
+    return response
+
+
+@app.before_request
+def start_request_timer():
+    if app.config["METRICS_ENABLED"]:
+        g.request_timer = RequestTimer(time.perf_counter(), keep_statements=app.config["SLOW_REQUEST_MS"] > 0)
+
+
+@app.after_request
+def keep_response_status(response):
+    timer = g.get("request_timer")
+    if timer is not None:
+        timer.status = response.status_code
+    return response
+
+
+@app.teardown_request
+def observe_request(error=None):
+    """Runs when the response is sent, for streamed pages after the last row too."""
+
+    timer = g.pop("request_timer", None)
+    if timer is None:
+        return
+    seconds = time.perf_counter() - timer.started
+    endpoint = request.endpoint or "unmatched"
+    request_metrics.observe(endpoint, request.method, timer, seconds)
+    slow_ms = app.config["SLOW_REQUEST_MS"]
+    if slow_ms and seconds * 1000 >= slow_ms:
+        app.logger.warning(slow_request_report(request.method, request.full_path, endpoint, seconds, timer))
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and "request_timer" in g:
+        context._query_started = time.perf_counter()
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is not None and has_request_context():
+        timer = g.get("request_timer")
+        if timer is not None:
+            timer.query(statement, time.perf_counter() - started)
+
+
+# Template time needs Flask's signals, they work when blinker is installed
+if signals_available:
+    @before_render_template.connect_via(app)
+    def _template_started(sender, template, context, **extra):
+        timer = g.get("request_timer")
+        if timer is not None:
+            timer.template_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def _template_finished(sender, template, context, **extra):
+        timer = g.get("request_timer")
+        if timer is not None and timer.template_started is not None:
+            timer.template_seconds += time.perf_counter() - timer.template_started
+            timer.template_started = None
 
 
 # User login decorator, we will control pages with it.
@@ -29,13 +212,273 @@ def login_required(f):
     return decorated_function
 
 
+# Public page cache decorator. Tags can use view arguments like "blog:{id}",
+# post_changed() drops the pages with the tags of a changed post.
+def cached_page(*tags):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # logged in users see other navbar and flashed messages are one time, so render them
+            if request.method != "GET" or "logged_in" in session or "_flashes" in session:
+                return f(*args, **kwargs)
+
+            # feeds and sitemaps use the host of the request when SITE_URL isn't set, a page
+            # made for one Host header must not be served for another
+            key = request.host + request.full_path
+            page = page_cache.get(key)
+            if page is not None:
+                response = make_response(page.body, page.status)
+                response.content_type = page.content_type
+                response.headers.extend(page.headers)
+                response.headers["X-Cache"] = "HIT"
+                return response.make_conditional(request)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                page_cache.set(key, response.get_data(), response.status_code, response.content_type,
+                               [tag.format(**kwargs) for tag in tags],
+                               [(name, value) for name, value in response.headers
+                                if name in CACHED_HEADERS])
+                response.headers["X-Cache"] = "MISS"
+            return response
+        return decorated_function
+    return decorator
+
+
+# Conditional GET. last_modified_of gets the view arguments and returns datetime of the
+# last change (or None if it can't be known), ETag is made from it and the request path.
+def conditional_page(last_modified_of):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != "GET" or "_flashes" in session:
+                return f(*args, **kwargs)
+
+            last_modified = last_modified_of(**kwargs)
+            if last_modified is None:
+                return f(*args, **kwargs)
+
+            etag = page_etag(last_modified)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True  # always ask again, it costs only a 304
+            return response
+        return decorated_function
+    return decorator
+
+
+def page_etag(last_modified):
+    parts = (app.config["ETAG_VERSION"], asset_manifest.version, request.full_path, "logged_in" in session,
+             last_modified.isoformat())
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+# validators saved with a cached page, so cache hits can answer conditional requests too
+CACHED_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
+
+@app.url_defaults
+def fingerprinted_static_url(endpoint, values):
+    """url_for("static", filename="css/styles.css") -> /static/dist/css/styles.<hash>.css"""
+
+    if endpoint == "static" and "filename" in values:
+        values["filename"] = asset_manifest.get(values["filename"]) or values["filename"]
+
+
+def static_file(filename):
+    """Static files. Fingerprinted ones never change, so they are cached forever
+    and sent precompressed when the client accepts br/gzip."""
+
+    if not filename.startswith(assets.DIST_DIR + "/"):
+        return app.send_static_file(filename)
+
+    path = os.path.join(app.static_folder, filename)
+    encoding, variant = assets.negotiate(request.accept_encodings, path)
+    response = send_from_directory(app.static_folder, os.path.relpath(variant, app.static_folder),
+                                   mimetype=mimetypes.guess_type(filename)[0])
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response
+
+
+app.view_functions["static"] = static_file
+
+
+def image_size_url(filename):
+    """url_for_size(width, fmt) function of a static image for images.picture_html"""
+
+    info = image_pipeline.source_info(filename)
+
+    def url_for_size(width, fmt):
+        return url_for("image", filename=filename, width=width, fmt=fmt, v=info.digest)
+    return url_for_size
+
+
+@app.template_global()
+def responsive_image(filename, sizes="100vw", widths=images.WIDTHS, **attributes):
+    """<picture> of a static image with WebP/AVIF/JPEG copies in several widths.
+    Use class_ for the class attribute."""
+
+    if "class_" in attributes:
+        attributes["class"] = attributes.pop("class_")
+    src = url_for("static", filename=filename)
+    if image_pipeline.source_info(filename) is None:
+        return Markup(images.picture_html(image_pipeline, filename, src, None, attributes))
+    return Markup(images.picture_html(image_pipeline, filename, src, image_size_url(filename),
+                                      attributes, sizes=sizes, widths=widths))
+
+
+@app.template_global()
+def bundle_tags(name, kind):
+    """Tags of a bundle in bundles.BUNDLES: css, js (deferred) or preload"""
+
+    return Markup(asset_bundles.tags(name, kind, lambda filename: url_for("static", filename=filename)))
+
+
+@app.template_filter()
+def responsive_content(content):
+    """Post content with responsive <picture>s for its images from /static"""
+
+    return images.rewrite_img_tags(content, app.static_url_path, image_pipeline, image_size_url)
+
+
+@app.route("/img/<int:width>/<fmt>/<path:filename>")
+def image(width, fmt, filename):
+    """Resized copy of a static image, it is made at the first request."""
+
+    try:
+        path = image_pipeline.derivative(filename, width, fmt)
+    except images.DerivativeFailed as e:
+        # the page still shows the image, only not resized
+        app.logger.warning("%s, the original is served", e)
+        return app.send_static_file(filename)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=images.FORMATS[fmt][1], conditional=True)
+    info = image_pipeline.source_info(filename)
+    if request.args.get("v") == info.digest:
+        # url has the hash of the source, so it never shows another image
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
+
+
+# kind of post -> listing endpoint
+LISTINGS = {"blog": "blogs", "diary": "diaries", "project": "projects"}
+# names of the kinds in the merged feed of index and dashboard
+KIND_LABELS = {"blog": "Blog", "diary": "Error&Bug Diary", "project": "Project"}
+
+
+def post_changed(kind, id):
+    """Called after a post is added, edited or deleted."""
+
+    page_cache.invalidate("{}:{}".format(kind, id), LISTINGS[kind], "search", "index", "feeds")
+    job_queue.enqueue("update_related", {"kind": kind, "id": int(id)})
+    title = db.session.query(POST_MODELS[kind].title).filter_by(id=id).scalar()
+    if title is None:
+        title_index.remove(kind, int(id))
+    else:
+        title_index.put(kind, int(id), title)
+
+
+def posts_changed_by_command():
+    """Called by CLI commands after they changed many posts. The page cache and the title
+    index are in the memory of the app's processes, not of the command, so they can't be
+    updated from here: cached pages expire after PAGE_CACHE_TTL and titles are loaded again
+    after SUGGEST_RELOAD_SECONDS. Related posts are computed again by a job."""
+
+    job_queue.enqueue("rebuild_related")
+
+
+def page_size():
+    """Page size of listings, from ?per_page= or config. Returns int."""
+
+    per_page = request.args.get("per_page", app.config["POSTS_PER_PAGE"], type=int)
+    return max(1, min(per_page, app.config["MAX_POSTS_PER_PAGE"]))
+
+
+# Columns which listing pages really show, content is only needed on detail pages.
+LIST_COLUMNS = ("id", "title", "author", "publish_date", "excerpt", "reading_time")
+
+
+def list_query(model):
+    """Query of model without loading post bodies, for listings/dashboard/search."""
+
+    return model.query.options(load_only(*LIST_COLUMNS))
+
+
+def paginate_posts(model, stream=False):
+    """Keyset pagination for listing pages with ?after= and ?before= cursors."""
+
+    return keyset_paginate(list_query(model), model, after=request.args.get("after"),
+                           before=request.args.get("before"), per_page=page_size(), stream=stream)
+
+
+def paginate_feed(where=None, stream=False):
+    """Newest posts of every kind in one list, keyset paginated with ?after=/?before=.
+    With stream the rows are read while the page renders, see stream_template."""
+
+    return feed_paginate(db.session, POST_MODELS, LIST_COLUMNS, where=where, after=request.args.get("after"),
+                         before=request.args.get("before"), per_page=page_size(), stream=stream)
+
+
+def stream_template(template_name, **context):
+    """Sends the template while it renders: layout head goes at once, then the rows as they
+    come from the database. Rows should be LazyRows, so they are never all in memory."""
+
+    app.update_template_context(context)
+    # the session cookie goes out before the body, so flashes are taken from it now;
+    # get_flashed_messages() in the template gets them from the request context then
+    get_flashed_messages()
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(app.config["STREAM_BUFFER_SIZE"])
+    return Response(stream_with_context(timed_stream(stream)), mimetype="text/html")
+
+
+def timed_stream(stream):
+    """Template time of a streamed page for request metrics, without the queries it runs
+    while rendering. Flask's template signals are not sent for streams."""
+
+    timer = g.get("request_timer")
+    if timer is None:
+        yield from stream
+        return
+    chunks = iter(stream)
+    while True:
+        started, query_seconds = time.perf_counter(), timer.query_seconds
+        chunk = next(chunks, None)
+        timer.template_seconds += time.perf_counter() - started - (timer.query_seconds - query_seconds)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def render_listing(template_name, model, name):
+    """Listing page, streamed when STREAM_LISTINGS is on. Streamed pages are not cached."""
+
+    if app.config["STREAM_LISTINGS"]:
+        page = paginate_posts(model, stream=True)
+        return stream_template(template_name, page=page, **{name: page.items})
+    page = paginate_posts(model)
+    return render_template(template_name, page=page, **{name: page.items})
+
+
 class Users(db.Model):
     """ create the initial users table"""
     id = db.Column(db.Integer, primary_key=True)
     fullname = db.Column(db.String(40), nullable=False)
     username = db.Column(db.String(40), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(64), nullable=False)
+    password = db.Column(db.String(128), nullable=False)
 
 
 class RegisterForm(Form):
@@ -62,11 +505,6 @@ def register():
         fullname = form.username.data
         username = form.username.data
         email = form.email.data
-        password = sha256_crypt.encrypt(
-            form.password.data)  # Security Modified
-
-        user = Users(fullname=fullname, username=username,
-                     email=email, password=password)
 
         # Control that email or username used before
         cu = control_username_exist(username)
@@ -84,6 +522,14 @@ def register():
                 "Your email used before. Please try another one.", 'warning')
             return redirect(url_for("register"))
         else:
+            try:
+                password = password_hasher.hash(form.password.data)  # Security Modified
+            except HasherBusy:
+                flash("Server is busy now, please try again in a few seconds.", "warning")
+                return render_template("register.html", form=form), 503
+
+            user = Users(fullname=fullname, username=username,
+                         email=email, password=password)
             try:
                 db.session.add(user)
                 db.session.commit()
@@ -118,49 +564,58 @@ def control_email_exist(email):
         return True
 
 
-def return_password_hashed(email):
-    """Controls the password in login page for match. Returns boolean. True is desired one"""
-
-    # check that email is wrong, if wrong it will return empty string, if it is true it will return hashed_password value
-    user_data = Users.query.filter_by(email=email).first()
-    if user_data is None:
-        return ""
-    else:
-        hashed_password = user_data.password
-        return hashed_password
-
-
 @ app.route("/login", methods=["POST", "GET"])
 def login():
     if request.method == "POST":
         useremail = request.form["useremail"]
-        ce = control_email_exist(useremail)  # true or false
-
-        # if useremail is correct, then check the password.
-        if(ce):
-            userpassword = request.form["userpassword"]
-            # in any case of situation userpassword musnt be empty so this control is required.
-            if userpassword != "":
-                checked_userpassword = return_password_hashed(useremail)
-                if sha256_crypt.verify(userpassword, checked_userpassword):
-                    flash("Logined succesfully.", "success")
-
-                    # Session Starts Here
-                    session["logged_in"] = True
-
-                    # Reach username from db
-                    user_info = Users.query.filter_by(email=useremail).first()
-                    username = user_info.username
-
-                    session["username"] = username
-
-                    return redirect(url_for("index"))
-                else:
-                    flash("Your password is incorrect.", "danger")
-                    return redirect(url_for("login"))
-        else:
+        userpassword = request.form["userpassword"]
+
+        # too many attempts from this address or for this account
+        allowed, retry_after = login_ip_limiter.take(request.remote_addr or "")
+        if allowed:
+            allowed, retry_after = login_email_limiter.take(useremail.strip().lower())
+        if not allowed:
+            flash("Too many login attempts, please try again in {} seconds.".format(retry_after), "danger")
+            response = make_response(render_template("login.html"), 429)
+            response.headers["Retry-After"] = str(retry_after)
+            return response
+
+        # in any case of situation userpassword musnt be empty so this control is required.
+        if userpassword == "":
+            flash("Please write your password.", "danger")
+            return redirect(url_for("login"))
+
+        # one query for email control, password hash and username
+        user = Users.query.filter_by(email=useremail).first()
+        if user is None:
             flash("There is no user with this email.", "danger")
             return redirect(url_for("login"))
+
+        try:
+            matched, new_hash = password_hasher.verify(userpassword, user.password)
+        except HasherBusy:
+            flash("Server is busy now, please try again in a few seconds.", "warning")
+            return render_template("login.html"), 503
+
+        if not matched:
+            flash("Your password is incorrect.", "danger")
+            return redirect(url_for("login"))
+
+        # password is right but hashed with old rounds, save it with the current ones
+        if new_hash is not None:
+            user.password = new_hash
+            try:
+                db.session.commit()
+            except exc.SQLAlchemyError:
+                db.session.rollback()
+
+        flash("Logined succesfully.", "success")
+
+        # Session Starts Here
+        session["logged_in"] = True
+        session["username"] = user.username
+
+        return redirect(url_for("index"))
     else:
         return render_template("login.html")
 
@@ -174,12 +629,28 @@ def logout():
 
 class Blogs(db.Model):
     """ create the initial blog table"""
+    __table_args__ = (
+        db.Index("ix_blogs_publish_date", "publish_date", "id"),
+        db.Index("ix_blogs_author_publish_date", "author", "publish_date", "id"),
+        db.Index("ix_blogs_views", "views"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(40), nullable=False)
     author = db.Column(db.String(40), nullable=False)
     content = db.Column(db.Text, nullable=False)
     publish_date = db.Column(
         db.DateTime, nullable=False, default=datetime.utcnow)
+    last_modified = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # rendered from content on every write, see render_post
+    content_format = db.Column(db.String(10), nullable=False, default="html")
+    content_html = db.Column(db.Text)
+    content_css = db.Column(db.Text)  # styles of the code highlighting in content_html
+    excerpt = db.Column(db.String(300))
+    word_count = db.Column(db.Integer)
+    reading_time = db.Column(db.Integer)
+    views = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # see view_counter
 
 
 # Blog Form
@@ -206,6 +677,7 @@ def addblog():
         try:
             db.session.add(blog_post)
             db.session.commit()
+            post_changed("blog", blog_post.id)
         except exc.SQLAlchemyError as e:
             flash(
                 "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -227,21 +699,10 @@ def dashboard():
 
     # blog_posts = Blogs.query.filter_by(author=session["username"]).first()
 
-    blog_posts = Blogs.query.filter_by(author=session["username"]).all()
-    diary_posts = Diaries.query.filter_by(author=session["username"]).all()
-    project_posts = Projects.query.filter_by(author=session["username"]).all()
-
-    # blog_posts = Blogs.querry.all()
+    # posts of the author of every kind, newest first, one page at a time
+    page = paginate_feed(lambda model: model.author == session["username"], stream=True)
 
-    if blog_posts != "" or diary_posts != "" or project_posts != "":
-
-        # For Debugging only
-        # flash("{}".format(blog_posts), "success")
-        # return render_template("index.html")
-
-        return render_template("dashboard.html", blogs=blog_posts, diaries=diary_posts, projects=project_posts)
-
-    return render_template("dashboard.html")
+    return stream_template("dashboard.html", page=page, posts=page.items, labels=KIND_LABELS)
 
 
 # BUG-1
@@ -289,6 +750,7 @@ def edit_blog(id):
 
         try:
             db.session.commit()
+            post_changed("blog", id)
         except exc.SQLAlchemyError as e:
             flash(
                 "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -307,12 +769,13 @@ def edit_blog(id):
 def delete_blog(id):
     """Delete Blog PostOperation"""
 
-    blog_delete = Blogs.query.filter_by(
+    blog_delete = list_query(Blogs).filter_by(
         id=id, author=session["username"]).first()
 
     try:
         db.session.delete(blog_delete)
         db.session.commit()
+        post_changed("blog", id)
     except exc.SQLAlchemyError as e:
         flash(
             "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -324,27 +787,22 @@ def delete_blog(id):
 
 
 @ app.route("/blogs")
+@cached_page("blogs")
+@conditional_page(lambda: listing_last_modified("blog"))
 def blogs():
     """Shows all blogs with title and author username to public"""
 
-    blogs = Blogs.query.all()
-
-    if blogs != "":  # veritabanında makale var
-        # tek makale için fect one tümü için fetch all liste içinde sözlükler
-
-        return render_template("blogs.html", blogs=blogs)
-
-    else:
-        return render_template("blogs.html")
-
-    return render_template("blogs.html")
+    return render_listing("blogs.html", Blogs, "blogs")
 
 
 @app.route("/blog/<string:id>")
+@cached_page("blog:{id}")
+@conditional_page(lambda id: post_page_last_modified(Blogs, id))
 def blog(id):
     """Blog Detail Function"""
 
-    blog = Blogs.query.filter_by(id=id).first()
+    # the raw body isn't needed, the rendered one is shown
+    blog = Blogs.query.options(defer(Blogs.content)).filter_by(id=id).first()
 
     if blog != "":
         return render_template("blog.html", blog=blog)
@@ -353,33 +811,36 @@ def blog(id):
 
 
 @ app.route("/")
+@cached_page("index")
 def index():
-    """Main Page/Index Page Function"""
-    return render_template("index.html")
+    """Main Page/Index Page Function, with the latest posts of every kind"""
+    page = paginate_feed()
+    return render_template("index.html", page=page, posts=page.items, labels=KIND_LABELS)
 
 
 @ app.route("/about")
+@cached_page("about")
 def about():
     return render_template("/about.html")
 
 
 @app.route('/contact', methods=['GET', 'POST'])
+@cached_page("contact")
 def contact():
-    form = ContactForm()
+    form = ContactForm(request.form)
 
     if request.method == 'POST':
         if form.validate() == False:
             flash('All fields are required.')
             return render_template('contact.html', form=form)
         else:
-            #         msg = Message(form.subject.data, sender='contact@example.com',
-            #                       recipients=['your_email@example.com'])
-            #         msg.body = """
-            #   From: %s <%s>
-            #   %s
-            #   """ % (form.name.data, form.email.data, form.message.data)
-            #         mail.send(msg)
-
+            # sent by a job worker, the visitor doesn't wait for the SMTP server
+            job_queue.enqueue("send_mail", {
+                "recipients": [app.config["CONTACT_RECIPIENT"]],
+                "subject": "ozyalhan.com: " + form.subject.data,
+                "body": "From: {} <{}>\n\n{}".format(form.name.data, form.email.data, form.message.data),
+                "reply_to": [form.name.data, form.email.data],
+            })
             return render_template('contact.html', success=True)
 
     elif request.method == 'GET':
@@ -394,27 +855,34 @@ def search_blog():
         return redirect(url_for("index"))
     else:
         keyword = request.form.get("keyword")
-
-        search = "%{}%".format(keyword)
-
-        blogs = Blogs.query.filter(Blogs.title.like(search)).all()
-
-        if blogs == "":
-            flash("No result", "warning")
-            return redirect(url_for("blogs"))
-        else:
-            return render_template("blogs.html", blogs=blogs)
+        return redirect(url_for("search", q=keyword, kind="blog"))
 
 
 ########
 class Diaries(db.Model):
     """ create the initial diary table"""
+    __table_args__ = (
+        db.Index("ix_diaries_publish_date", "publish_date", "id"),
+        db.Index("ix_diaries_author_publish_date", "author", "publish_date", "id"),
+        db.Index("ix_diaries_views", "views"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(40), nullable=False)
     author = db.Column(db.String(40), nullable=False)
     content = db.Column(db.Text, nullable=False)
     publish_date = db.Column(
         db.DateTime, nullable=False, default=datetime.utcnow)
+    last_modified = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # rendered from content on every write, see render_post
+    content_format = db.Column(db.String(10), nullable=False, default="html")
+    content_html = db.Column(db.Text)
+    content_css = db.Column(db.Text)  # styles of the code highlighting in content_html
+    excerpt = db.Column(db.String(300))
+    word_count = db.Column(db.Integer)
+    reading_time = db.Column(db.Integer)
+    views = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # see view_counter
 
 
 # Diary Form
@@ -441,6 +909,7 @@ def adddiary():
         try:
             db.session.add(diary_post)
             db.session.commit()
+            post_changed("diary", diary_post.id)
         except exc.SQLAlchemyError as e:
             flash(
                 "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -488,6 +957,7 @@ def edit_diary(id):
 
         try:
             db.session.commit()
+            post_changed("diary", id)
         except exc.SQLAlchemyError as e:
             flash(
                 "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -506,12 +976,13 @@ def edit_diary(id):
 def delete_diary(id):
     """Delete Diary PostOperation"""
 
-    diary_delete = Diaries.query.filter_by(
+    diary_delete = list_query(Diaries).filter_by(
         id=id, author=session["username"]).first()
 
     try:
         db.session.delete(diary_delete)
         db.session.commit()
+        post_changed("diary", id)
     except exc.SQLAlchemyError as e:
         flash(
             "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -523,27 +994,22 @@ def delete_diary(id):
 
 
 @ app.route("/diaries")
+@cached_page("diaries")
+@conditional_page(lambda: listing_last_modified("diary"))
 def diaries():
     """Shows all diaries with title and author username to public"""
 
-    diaries = Diaries.query.all()
-
-    if diaries != "":  # veritabanında makale var
-        # tek makale için fect one tümü için fetch all liste içinde sözlükler
-
-        return render_template("diaries.html", diaries=diaries)
-
-    else:
-        return render_template("diaries.html")
-
-    return render_template("diaries.html")
+    return render_listing("diaries.html", Diaries, "diaries")
 
 
 @app.route("/diary/<string:id>")
+@cached_page("diary:{id}")
+@conditional_page(lambda id: post_page_last_modified(Diaries, id))
 def diary(id):
     """Diary Detail Function"""
 
-    diary = Diaries.query.filter_by(id=id).first()
+    # the raw body isn't needed, the rendered one is shown
+    diary = Diaries.query.options(defer(Diaries.content)).filter_by(id=id).first()
 
     if diary != "":
         return render_template("diary.html", diary=diary)
@@ -560,28 +1026,35 @@ def search_diary():
         return redirect(url_for("index"))
     else:
         keyword = request.form.get("keyword")
-
-        search = "%{}%".format(keyword)
-
-        diaries = Diaries.query.filter(Diaries.title.like(search)).all()
-
-        if diaries == "":
-            flash("No result", "warning")
-            return redirect(url_for("diaries"))
-        else:
-            return render_template("diaries.html", diaries=diaries)
+        return redirect(url_for("search", q=keyword, kind="diary"))
 
 ########
 
 
 class Projects(db.Model):
     """ create the initial project table"""
+    __table_args__ = (
+        db.Index("ix_projects_publish_date", "publish_date", "id"),
+        db.Index("ix_projects_author_publish_date", "author", "publish_date", "id"),
+        db.Index("ix_projects_views", "views"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(40), nullable=False)
     author = db.Column(db.String(40), nullable=False)
     content = db.Column(db.Text, nullable=False)
     publish_date = db.Column(
         db.DateTime, nullable=False, default=datetime.utcnow)
+    last_modified = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # rendered from content on every write, see render_post
+    content_format = db.Column(db.String(10), nullable=False, default="html")
+    content_html = db.Column(db.Text)
+    content_css = db.Column(db.Text)  # styles of the code highlighting in content_html
+    excerpt = db.Column(db.String(300))
+    word_count = db.Column(db.Integer)
+    reading_time = db.Column(db.Integer)
+    views = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # see view_counter
 
 
 # Project Form
@@ -608,6 +1081,7 @@ def addproject():
         try:
             db.session.add(project_post)
             db.session.commit()
+            post_changed("project", project_post.id)
         except exc.SQLAlchemyError as e:
             flash(
                 "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -655,6 +1129,7 @@ def edit_project(id):
 
         try:
             db.session.commit()
+            post_changed("project", id)
         except exc.SQLAlchemyError as e:
             flash(
                 "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -673,12 +1148,13 @@ def edit_project(id):
 def delete_project(id):
     """Delete Project PostOperation"""
 
-    project_delete = Projects.query.filter_by(
+    project_delete = list_query(Projects).filter_by(
         id=id, author=session["username"]).first()
 
     try:
         db.session.delete(project_delete)
         db.session.commit()
+        post_changed("project", id)
     except exc.SQLAlchemyError as e:
         flash(
             "Please send error message bellow to ozguryasaralhan@gmail.com\n{}".format(e), "warning")
@@ -690,27 +1166,22 @@ def delete_project(id):
 
 
 @ app.route("/projects")
+@cached_page("projects")
+@conditional_page(lambda: listing_last_modified("project"))
 def projects():
     """Shows all projects with title and author username to public"""
 
-    projects = Projects.query.all()
-
-    if projects != "":  # veritabanında makale var
-        # tek makale için fect one tümü için fetch all liste içinde sözlükler
-
-        return render_template("projects.html", projects=projects)
-
-    else:
-        return render_template("projects.html")
-
-    return render_template("projects.html")
+    return render_listing("projects.html", Projects, "projects")
 
 
 @app.route("/project/<string:id>")
+@cached_page("project:{id}")
+@conditional_page(lambda id: post_page_last_modified(Projects, id))
 def project(id):
     """Project Detail Function"""
 
-    project = Projects.query.filter_by(id=id).first()
+    # the raw body isn't needed, the rendered one is shown
+    project = Projects.query.options(defer(Projects.content)).filter_by(id=id).first()
 
     if project != "":
         return render_template("project.html", project=project)
@@ -727,23 +1198,615 @@ def search_project():
         return redirect(url_for("index"))
     else:
         keyword = request.form.get("keyword")
+        return redirect(url_for("search", q=keyword, kind="project"))
 
-        search = "%{}%".format(keyword)
+########
 
-        projects = Projects.query.filter(Projects.title.like(search)).all()
 
-        if projects == "":
-            flash("No result", "warning")
-            return redirect(url_for("projects"))
-        else:
-            return render_template("projects.html", projects=projects)
+# Search
+# kind name -> model, kind names are also endpoint names of detail pages
+POST_MODELS = {"blog": Blogs, "diary": Diaries, "project": Projects}
+POST_TABLES = {kind: model.__tablename__ for kind, model in POST_MODELS.items()}
 
-########
+
+def post_kind(model):
+    for kind, post_model in POST_MODELS.items():
+        if post_model is model:
+            return kind
+
+
+def migrate_database():
+    """Creates missing tables and brings an old database to the latest schema."""
+
+    db.create_all()
+    applied = migrations.migrate(db.engine, log=app.logger.info)
+    if migrations.RELATED_POSTS_VERSION in applied:
+        job_queue.enqueue("rebuild_related")
+
+
+class ContentVersions(db.Model):
+    """Last change time of every post kind, deletes included. Listings use it for conditional GET."""
+    kind = db.Column(db.String(20), primary_key=True)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+
+def post_last_modified(model, id):
+    """last_modified of one post without loading it, None if there is no post."""
+
+    return db.session.query(model.last_modified).filter_by(id=id).scalar()
+
+
+def post_page_last_modified(model, id):
+    """Last change of a post page: the post or its related posts list, which jobs write later."""
+
+    last_modified = post_last_modified(model, id)
+    if last_modified is None:
+        return None
+    related_changed = related.related_changed_at(db.session.connection(), post_kind(model), id)
+    return max(last_modified, related_changed) if related_changed is not None else last_modified
+
+
+def listing_last_modified(kind):
+    return db.session.query(ContentVersions.changed_at).filter_by(kind=kind).scalar()
+
+
+def touch_content_version(connection, kind):
+    connection.execute(text(
+        "INSERT INTO content_versions (kind, changed_at) VALUES (:kind, :changed_at) "
+        "ON CONFLICT (kind) DO UPDATE SET changed_at = excluded.changed_at"),
+        {"kind": kind, "changed_at": datetime.utcnow()})
+
+
+def _touch_content_version(mapper, connection, target):
+    touch_content_version(connection, post_kind(type(target)))
+
+
+for _model in POST_MODELS.values():
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _touch_content_version)
+
+
+# Sanitized html, excerpt etc. are made when a post is written, views only read them
+def render_post(mapper, connection, target):
+    if target.content_html is None or inspect(target).attrs.content.history.has_changes() \
+            or inspect(target).attrs.content_format.history.has_changes():
+        rendered = render_content(target.content, target.content_format or "html")
+        target.content_html = rendered.html
+        target.content_css = rendered.css
+        target.excerpt = rendered.excerpt
+        target.word_count = rendered.word_count
+        target.reading_time = rendered.reading_time
+
+
+for _model in POST_MODELS.values():
+    event.listen(_model, "before_insert", render_post)
+    event.listen(_model, "before_update", render_post)
+
+
+@app.template_global()
+def post_html(post):
+    """Sanitized html of a post, rows older than the content columns are rendered now."""
+
+    if post.content_html is not None:
+        return post.content_html
+    return render_content(post.content, post.content_format or "html").html
+
+
+# Keep search index same with posts, it is written in the same transaction with post
+def _index_post(mapper, connection, target):
+    fts.index_post(connection, post_kind(type(target)), target)
+
+
+def _unindex_post(mapper, connection, target):
+    fts.remove_post(connection, post_kind(type(target)), target.id)
+
+
+for _model in POST_MODELS.values():
+    event.listen(_model, "after_insert", _index_post)
+    event.listen(_model, "after_update", _index_post)
+    event.listen(_model, "after_delete", _unindex_post)
+
+
+# Feed and sitemap fragments of a post are made again only when the post changes
+def _store_feed_entry(mapper, connection, target):
+    feeds.store_entry(connection, post_kind(type(target)), target)
+
+
+def _remove_feed_entry(mapper, connection, target):
+    feeds.remove_entry(connection, post_kind(type(target)), target.id)
+
+
+def _rename_popular(mapper, connection, target):
+    if inspect(target).attrs.title.history.has_changes():
+        counters.rename_popular(connection, post_kind(type(target)), target.id, target.title)
+
+
+def _remove_popular(mapper, connection, target):
+    counters.remove_popular(connection, post_kind(type(target)), target.id)
+
+
+for _model in POST_MODELS.values():
+    event.listen(_model, "after_update", _rename_popular)
+    event.listen(_model, "after_delete", _remove_popular)
+    event.listen(_model, "after_insert", _store_feed_entry)
+    event.listen(_model, "after_update", _store_feed_entry)
+    event.listen(_model, "after_delete", _remove_feed_entry)
+
+
+@app.before_first_request
+def prepare_database():
+    migrate_database()
+
+
+@app.before_first_request
+def load_title_index():
+    title_index.reload()
+
+
+@app.before_first_request
+def start_job_workers():
+    if app.config["JOB_WORKERS"] > 0:
+        job_workers.start()
+
+
+@job_queue.handler("send_mail")
+def send_mail_job(payload):
+    try:
+        message = mail.make_message(app.config["MAIL_SENDER"], payload["recipients"], payload["subject"],
+                                    payload["body"], reply_to=payload.get("reply_to"))
+    except ValueError as e:  # a header with a line break, it won't be any better next time
+        raise PermanentJobError("malformed mail header: {}".format(e))
+    mail.send_message(message, host=app.config["MAIL_SERVER"], port=app.config["MAIL_PORT"],
+                      username=app.config["MAIL_USERNAME"], password=app.config["MAIL_PASSWORD"],
+                      use_tls=app.config["MAIL_USE_TLS"], use_ssl=app.config["MAIL_USE_SSL"])
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics of this process, with "Authorization: Bearer <METRICS_TOKEN>". Without a
+    token it is 404 unless the app runs in debug mode."""
+
+    token = app.config["METRICS_TOKEN"]
+    if not app.config["METRICS_ENABLED"] or not (token or app.debug):
+        abort(404)  # public only on a debug server
+    # constant time, so the token can't be guessed byte by byte from response times
+    if token and not hmac.compare_digest(request.headers.get("Authorization", "").encode(),
+                                         ("Bearer " + token).encode()):
+        abort(401)
+    response = make_response(request_metrics.prometheus())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route("/search")
+@cached_page("search")
+def search():
+    """Full text search in blogs, diaries and projects. ?kind= limits it to one type."""
+
+    keyword = request.args.get("q", "")
+    kind = request.args.get("kind")
+    kinds = [kind] if kind in POST_MODELS else None
+    page = max(1, request.args.get("page", 1, type=int))
+
+    results = fts.search(db.session, keyword, kinds=kinds,
+                         page=page, per_page=page_size())
+
+    if keyword and not results.hits:
+        flash("No result", "warning")
+
+    return render_template("search.html", results=results, keyword=keyword, kind=kind)
+
+
+def write_views(counts):
+    with db.engine.begin() as connection:
+        counters.add_views(connection, POST_TABLES, counts)
+        counters.update_popular(connection, POST_TABLES, app.config["POPULAR_POSTS"])
+
+
+def load_popular_posts():
+    with db.engine.connect() as connection:
+        return counters.popular_posts(connection, app.config["POPULAR_POSTS"])
+
+
+# Views are added up in memory and written in one transaction every VIEW_FLUSH_SECONDS,
+# readers don't take SQLite's write lock. What is left is written when the process exits.
+view_counter = ViewCounter(write_views, load_popular_posts, interval=app.config["VIEW_FLUSH_SECONDS"],
+                           context=app.app_context)
+atexit.register(view_counter.stop)
+
+
+@app.template_global()
+def popular_posts():
+    """Most read posts as of the last flush of view counts, no query per page"""
+
+    return view_counter.top()
+
+
+# Related posts are computed by jobs after a post changes and kept in a table, detail
+# pages only read their rows. Term counts of posts stay in related_corpus between jobs.
+related_corpus = related.Corpus()
+
+
+@job_queue.handler("update_related")
+def update_related_job(payload):
+    with db.engine.begin() as connection:
+        changed = related.update_related(connection, related_corpus, POST_TABLES, payload["kind"], payload["id"],
+                                         app.config["RELATED_POSTS"])
+    page_cache.invalidate(*("{}:{}".format(kind, id) for kind, id in changed))
+
+
+@job_queue.handler("rebuild_related")
+def rebuild_related_job(payload):
+    with db.engine.begin() as connection:
+        related.rebuild_related(connection, related_corpus, POST_TABLES, app.config["RELATED_POSTS"])
+    page_cache.clear()
+
+
+def load_titles():
+    with db.engine.connect() as connection:
+        for kind, table in POST_TABLES.items():
+            for id, title in connection.execute(text("SELECT id, title FROM {}".format(table))):
+                yield kind, id, title
+
+
+# Titles of posts for /suggest, in memory of every process. Changes of other processes
+# arrive when it is loaded again after SUGGEST_RELOAD_SECONDS.
+title_index = TitleIndex(load_titles, max_age=app.config["SUGGEST_RELOAD_SECONDS"])
+
+
+@app.route("/suggest")
+def suggest():
+    """Titles starting with ?q= (or with a word starting with it) as JSON, for search as you type.
+    ?kind= limits it to one type."""
+
+    kind = request.args.get("kind")
+    suggestions = title_index.search(request.args.get("q", "")[:64], kinds=[kind] if kind in POST_MODELS else None,
+                                     limit=app.config["SUGGEST_LIMIT"])
+    response = jsonify([{"title": suggestion.title, "kind": suggestion.kind,
+                         "url": url_for(suggestion.kind, id=suggestion.id)} for suggestion in suggestions])
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.template_global()
+def related_posts(kind, id):
+    """Stored related posts of a post, best first"""
+
+    with db.engine.connect() as connection:
+        return related.related_posts(connection, kind, id, app.config["RELATED_POSTS"])
+
+
+def site_url():
+    return app.config["SITE_URL"] or request.url_root
+
+
+def feeds_last_modified(kind=None):
+    """Last change of posts of a kind, of any kind without it"""
+
+    if kind is not None:
+        return listing_last_modified(kind)
+    return db.session.query(db.func.max(ContentVersions.changed_at)).scalar()
+
+
+def xml_response(document, content_type):
+    response = make_response(document)
+    response.headers["Content-Type"] = content_type + "; charset=utf-8"
+    return response
+
+
+FEED_KINDS = {listing: kind for kind, listing in LISTINGS.items()}
+FEED_TITLES = {None: "ozyalhan.com", "blog": "ozyalhan.com Blog", "diary": "ozyalhan.com Error&Bug Diary",
+               "project": "ozyalhan.com Projects"}
+
+
+@app.route("/feed.<any(atom, rss):fmt>")
+@app.route("/<any(blogs, diaries, projects):listing>/feed.<any(atom, rss):fmt>")
+@cached_page("feeds")
+@conditional_page(lambda fmt, listing=None: feeds_last_modified(FEED_KINDS.get(listing)))
+def feed(fmt, listing=None):
+    """Atom/RSS of the newest posts of a listing or of every kind, joined from stored fragments"""
+
+    kind = FEED_KINDS.get(listing)
+    connection = db.session.connection()
+    fragments = feeds.latest_fragments(connection, fmt, kind, limit=app.config["FEED_ENTRIES"])
+    document = feeds.feed_document(fmt, site_url(), FEED_TITLES[kind], request.path,
+                                   "/" + listing if listing else "/", feeds_last_modified(kind) or datetime.utcnow(),
+                                   fragments)
+    return xml_response(document, feeds.FEED_CONTENT_TYPES[fmt])
+
+
+SITEMAP_PAGES = ("/", "/about", "/contact", "/blogs", "/diaries", "/projects")
+
+
+@app.route("/sitemap.xml")
+@cached_page("feeds")
+@conditional_page(lambda: feeds_last_modified())
+def sitemap():
+    """Every public page, a sitemap index of parts when there are more than SITEMAP_MAX_URLS"""
+
+    connection = db.session.connection()
+    size = app.config["SITEMAP_MAX_URLS"]
+    if feeds.entry_count(connection) + len(SITEMAP_PAGES) <= size:
+        document = feeds.sitemap_document(site_url(), SITEMAP_PAGES, feeds.all_sitemap_fragments(connection))
+    else:
+        parts = [("/sitemap-pages.xml", None)]
+        parts += [("/sitemap-{}-{}.xml".format(part.kind, part.bucket), part.lastmod)
+                  for part in feeds.sitemap_parts(connection, size)]
+        document = feeds.sitemap_index_document(site_url(), parts)
+    return xml_response(document, "application/xml")
+
+
+@app.route("/sitemap-pages.xml")
+@cached_page("feeds")
+def sitemap_pages():
+    return xml_response(feeds.sitemap_document(site_url(), SITEMAP_PAGES, []), "application/xml")
+
+
+@app.route("/sitemap-<any(blog, diary, project):kind>-<int:bucket>.xml")
+@cached_page("feeds")
+@conditional_page(lambda kind, bucket: feeds_last_modified(kind))
+def sitemap_part(kind, bucket):
+    fragments = feeds.sitemap_part_fragments(db.session.connection(), kind, bucket, app.config["SITEMAP_MAX_URLS"])
+    if not fragments:
+        abort(404)
+    return xml_response(feeds.sitemap_document(site_url(), (), fragments), "application/xml")
+
+
+@app.cli.command("rebuild-feeds")
+def rebuild_feeds_command():
+    """Makes the feed and sitemap fragments of all posts again."""
+
+    with db.engine.begin() as connection:
+        feeds.create_feed_table(connection)
+        feeds.rebuild_feed_entries(connection, POST_TABLES)
+
+
+@app.cli.command("rebuild-related")
+def rebuild_related_command():
+    """Computes the related posts of all posts again."""
+
+    with db.engine.begin() as connection:
+        related.create_related_table(connection)
+        count = related.rebuild_related(connection, related_corpus, POST_TABLES, app.config["RELATED_POSTS"])
+    click.echo("Related posts of {} posts".format(count))
+
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Indexes all posts again."""
+
+    with db.engine.begin() as connection:
+        fts.create_search_index(connection)
+        fts.rebuild_search_index(connection, POST_TABLES)
+
+
+@app.cli.command("migrate-db")
+def migrate_db_command():
+    """Creates tables and applies pending schema migrations."""
+
+    db.create_all()
+    applied = migrations.migrate(db.engine, log=click.echo)
+    click.echo("Database is at version {}, {} migration(s) applied.".format(
+        migrations.latest_version(), len(applied)))
+
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    """EXPLAIN QUERY PLAN of hot queries, fails if one of them scans a whole table."""
+
+    author = "ozyalhan"
+    cursor = "20201231000000000000-10"
+    failed = False
+    for kind, model in POST_MODELS.items():
+        # (name, query, should it be an index range search instead of an index scan)
+        queries = [
+            ("{} listing".format(kind), keyset_query(list_query(model), model), False),
+            ("{} listing deep page".format(kind), keyset_query(list_query(model), model, after=cursor), True),
+            ("{} listing back".format(kind), keyset_query(list_query(model), model, before=cursor), True),
+            ("{} dashboard".format(kind), list_query(model).filter_by(author=author)
+             .order_by(model.publish_date.desc(), model.id.desc()), True),
+            ("{} delete".format(kind), list_query(model).filter_by(id=1, author=author), True),
+        ]
+        if kind == "project":  # once, the feed reads every kind
+            queries += [
+                ("feed", feed_query(POST_MODELS, LIST_COLUMNS), False),
+                ("feed deep page", feed_query(POST_MODELS, LIST_COLUMNS, after=cursor + "-blog"), True),
+                ("feed back", feed_query(POST_MODELS, LIST_COLUMNS, before=cursor + "-blog"), True),
+                ("feed dashboard", feed_query(POST_MODELS, LIST_COLUMNS, where=lambda m: m.author == author), True),
+            ]
+        for name, query, must_search in queries:
+            plan = migrations.explain_query_plan(db.session.connection(), query)
+            problems = migrations.plan_problems(plan, must_search)
+            failed = failed or bool(problems)
+            click.echo("{:<30} {:<4} {}".format(name, "FAIL" if problems else "ok", " | ".join(plan)))
+    if failed:
+        raise SystemExit(1)
+
+
+def public_pages():
+    """Paths of public pages with a version string which changes with the page."""
+
+    version = app.config["ETAG_VERSION"]
+    pages = {path: version for path in ("/", "/about", "/contact")}
+    pages["/"] = "{}|{}".format(version, max(str(listing_last_modified(kind)) for kind in POST_MODELS))
+    for kind in POST_MODELS:
+        changed_at = listing_last_modified(kind)
+        pages["/" + LISTINGS[kind]] = "{}|{}".format(version, changed_at)
+        # like post_page_last_modified: the post and its related posts list, which jobs write later
+        rows = db.session.execute(text(
+            "SELECT post.id, post.last_modified, versions.changed_at FROM {} AS post LEFT JOIN {} AS versions "
+            "ON versions.kind = :kind AND versions.post_id = post.id".format(POST_TABLES[kind],
+                                                                             related.VERSIONS_TABLE)), {"kind": kind})
+        for id, last_modified, related_changed in rows:
+            pages["/{}/{}".format(kind, id)] = "{}|{}|{}".format(version, last_modified, related_changed)
+    return pages
+
+
+@app.cli.command("export-static")
+@click.argument("out_dir", default="build")
+@click.option("--workers", type=int, default=None, help="Render processes, default is CPU count.")
+@click.option("--full", is_flag=True, help="Render every page again, not only the changed ones.")
+def export_static_command(out_dir, workers, full):
+    """Writes public pages and static files as a static site into OUT_DIR.
+
+    Only the first page of listings is exported, older pages (?after=) still need the app."""
+
+    migrate_database()
+    rendered, deleted, failed = static_export.export_site(
+        public_pages(), out_dir, app.static_folder, module_name=__name__,
+        workers=workers, full=full)
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command("render-content")
+@click.option("--all", "render_all", is_flag=True, help="Render every post again, e.g. after sanitizer rules changed.")
+@click.option("--batch-size", type=int, default=500)
+def render_content_command(render_all, batch_size):
+    """Fills rendered html, code css, excerpt, word count and reading time of posts written before them."""
+
+    migrate_database()
+    for kind, model in POST_MODELS.items():
+        table = model.__table__
+        update = table.update().where(table.c.id == bindparam("post_id")).values(
+            content_html=bindparam("new_html"), content_css=bindparam("new_css"), excerpt=bindparam("new_excerpt"),
+            word_count=bindparam("new_word_count"), reading_time=bindparam("new_reading_time"))
+        last_id, count = 0, 0
+        while True:
+            condition = table.c.id > last_id
+            if not render_all:
+                condition = condition & table.c.content_html.is_(None)
+            with db.engine.begin() as connection:
+                rows = connection.execute(select([table.c.id, table.c.content, table.c.content_format])
+                                          .where(condition).order_by(table.c.id).limit(batch_size)).fetchall()
+                if not rows:
+                    break
+                values = []
+                for row in rows:
+                    rendered = render_content(row.content, row.content_format)
+                    values.append({"post_id": row.id, "new_html": rendered.html, "new_css": rendered.css,
+                                   "new_excerpt": rendered.excerpt,
+                                   "new_word_count": rendered.word_count,
+                                   "new_reading_time": rendered.reading_time})
+                connection.execute(update, values)
+                feeds.store_entries_after(connection, kind, table.name, last_id, until_id=rows[-1].id)
+                fts.index_posts_after(connection, kind, table.name, last_id, until_id=rows[-1].id)
+                touch_content_version(connection, kind)
+            last_id = rows[-1].id
+            count += len(rows)
+        if count:
+            posts_changed_by_command()
+        click.echo("{} {} posts rendered".format(count, kind))
+
+
+@app.cli.command("import-posts")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--kind", type=click.Choice(sorted(POST_MODELS)), default="blog",
+              help="Kind of records which don't have one.")
+@click.option("--author", help="Author of records which don't have one.")
+@click.option("--batch-size", type=int, default=5000, help="Rows per insert and transaction.")
+def import_posts_command(paths, kind, author, batch_size):
+    """Imports posts from JSONL files (- is stdin), Markdown files and directories of them.
+
+    A JSONL line is {"kind": "blog", "title": ..., "content": ..., "author": ..., "publish_date": ...},
+    as export-data writes them. Markdown files may start with a front matter block of
+    title, author, kind and publish_date. A running app shows the new posts on cached pages
+    and in title suggestions after PAGE_CACHE_TTL and SUGGEST_RELOAD_SECONDS."""
+
+    migrate_database()
+    with db.engine.connect() as connection:
+        counts, skipped = bulk.import_posts(
+            connection, bulk.read_sources(paths), {kind: model.__table__ for kind, model in POST_MODELS.items()},
+            default_kind=kind, default_author=author, batch_size=batch_size,
+            touch_kind=touch_content_version, log=click.echo)
+    if any(counts.values()):
+        posts_changed_by_command()
+    click.echo("Imported {}, skipped {}".format(
+        ", ".join("{} {}".format(count, changed) for changed, count in counts.items()), skipped))
+
+
+@app.cli.command("export-data")
+@click.argument("out", default="-")
+def export_data_command(out):
+    """Writes all posts and users (without passwords) as JSON lines into OUT, default stdout."""
+
+    tables = {kind: model.__table__ for kind, model in POST_MODELS.items()}
+    f = sys.stdout if out == "-" else open(out, "w", encoding="utf-8")
+    try:
+        with db.engine.connect() as connection:
+            counts = bulk.export_jsonl(connection, f, tables, Users.__table__)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    click.echo("Exported " + ", ".join("{} {}".format(count, kind) for kind, count in counts.items()), err=True)
+
+
+@app.cli.command("build-assets")
+@click.option("--purge-css", is_flag=True, help="Drop css rules which templates and scripts don't use.")
+def build_assets_command(purge_css):
+    """Builds bundles, fingerprints and precompresses static files into static/dist."""
+
+    global asset_manifest
+    bundles.build_bundles(app.static_folder, app.static_url_path)
+    asset_bundles.refresh()
+    words = assets.used_words(os.path.join(app.root_path, app.template_folder), app.static_folder) \
+        if purge_css else None
+    asset_manifest = assets.build_assets(app.static_folder, purge_css_with=words)
+
+
+@app.cli.command("vendor-assets")
+@click.option("--force", is_flag=True, help="Download files again even if they are there.")
+@click.option("--ckeditor-integrity", help="sha384-... of the CKEditor zip when bundles.py doesn't pin it.")
+@click.option("--print-integrity", is_flag=True, help="Print the integrity of the downloaded archives, unpack nothing.")
+def vendor_assets_command(force, ckeditor_integrity, print_integrity):
+    """Downloads jQuery, Popper, Bootstrap and CKEditor into static/vendor, checking their integrity."""
+
+    try:
+        bundles.vendor_assets(app.static_folder, force=force, print_integrity=print_integrity,
+                              archive_integrity={"vendor/ckeditor": ckeditor_integrity})
+    except (OSError, zipfile.BadZipFile, bundles.IntegrityError) as e:
+        raise click.ClickException(str(e))
+    click.echo("Run `flask build-assets` to bundle them.")
+
+
+@app.cli.command("run-jobs")
+@click.option("--threads", type=int, default=1, show_default=True)
+@click.option("--once", is_flag=True, help="Run the due jobs and exit.")
+def run_jobs_command(threads, once):
+    """Runs background jobs, for web processes started with JOB_WORKERS=0."""
+
+    if once:
+        counts = job_queue.run_pending(app.app_context)
+        click.echo(", ".join("{} {}".format(count, status) for status, count in counts.items()) or "No due jobs")
+        return
+    workers = Workers(job_queue, threads=threads, context=app.app_context)
+    workers.start()
+    click.echo("Running jobs with {} thread(s), Ctrl+C stops".format(threads))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        workers.stop()
+
+
+@app.cli.command("jobs")
+@click.option("--retry-dead", is_flag=True, help="Queue dead letters again.")
+def jobs_command(retry_dead):
+    """Counts of jobs by status and the last dead letters."""
+
+    if retry_dead:
+        click.echo("{} dead job(s) queued again".format(job_queue.retry_dead()))
+    for status, count in sorted(job_queue.stats().items()):
+        click.echo("{}: {}".format(status, count))
+    for job_id, kind, attempts, finished, error in job_queue.dead_letters():
+        last_line = (error or "").strip().splitlines()[-1:] or [""]
+        click.echo("dead {} {} after {} attempt(s): {}".format(job_id, kind, attempts, last_line[0]))
 
 
 if __name__ == "__main__":
     # db.drop_all()  # sometimes I need destroy all DATA
-    db.create_all()  # firstly create db,other times doesnt create again.
+    migrate_database()  # firstly create db, other times only applies new migrations.
     app.run(debug=True)
 
     # class Contact_info(db.Model):
@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+import feeds
+import search as fts
+
+from content import CONTENT_FORMATS, render_content
+
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+USER_EXPORT_COLUMNS = ("id", "fullname", "username", "email")  # never the password hash
+
+
+class BadRecord(ValueError):
+    """A record of an import file which can't be a post."""
+
+
+# Reading sources, every reader yields (where, record dict) so errors can say the line or file
+
+def read_jsonl(path):
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            where = "{}:{}".format(path, number)
+            try:
+                yield where, json.loads(line)
+            except ValueError as e:
+                yield where, BadRecord("invalid JSON: {}".format(e))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+_front_matter_re = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.S)
+_heading_re = re.compile(r"\A#\s+(.+)\n?")
+
+
+def read_markdown(path):
+    """A Markdown file as a record. An optional front matter block gives title, author,
+    kind and publish_date; without a title the first # heading or the file name is used."""
+
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    record = {}
+    match = _front_matter_re.match(source)
+    if match:
+        for line in match.group(1).splitlines():
+            name, _, value = line.partition(":")
+            if value.strip():
+                record[name.strip().lower()] = value.strip().strip("\"'")
+        source = source[match.end():]
+    source = source.lstrip()
+    match = _heading_re.match(source)
+    if match and "title" not in record:
+        record["title"] = match.group(1).strip()
+        source = source[match.end():]
+    record.setdefault("title", os.path.splitext(os.path.basename(path))[0].replace("-", " ").replace("_", " "))
+    record["content"] = source
+    record.setdefault("content_format", "markdown")
+    return record
+
+
+def read_sources(paths):
+    """Records of .jsonl files (- is stdin), Markdown files and directories of them."""
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(MARKDOWN_EXTENSIONS):
+                        yield os.path.join(root, name), read_markdown(os.path.join(root, name))
+        elif path.lower().endswith(MARKDOWN_EXTENSIONS):
+            yield path, read_markdown(path)
+        else:
+            yield from read_jsonl(path)
+
+
+def parse_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "").replace("T", " "))
+    except ValueError:
+        raise BadRecord("invalid date {!r}".format(value))
+
+
+def post_row(record, kinds, default_kind, default_author):
+    """(kind, row for the posts table) of an import record."""
+
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise BadRecord("a record must be a JSON object")
+    kind = record.get("kind") or default_kind
+    if kind not in kinds:
+        raise BadRecord("unknown kind {!r}".format(kind))
+    title = (record.get("title") or "").strip()
+    content = record.get("content") or ""
+    author = record.get("author") or default_author
+    if not title or not content.strip():
+        raise BadRecord("title and content are required")
+    if not author:
+        raise BadRecord("author is missing, give one with --author")
+    content_format = record.get("content_format") or "html"
+    if content_format not in CONTENT_FORMATS:
+        raise BadRecord("unknown content_format {!r}".format(content_format))
+    publish_date = parse_date(record.get("publish_date")) or datetime.utcnow()
+    last_modified = parse_date(record.get("last_modified")) or publish_date
+    rendered = render_content(content, content_format)
+    return kind, {"title": title[:40], "author": author, "content": content, "content_format": content_format,
+                  "content_html": rendered.html, "content_css": rendered.css, "excerpt": rendered.excerpt,
+                  "word_count": rendered.word_count, "reading_time": rendered.reading_time,
+                  "publish_date": publish_date, "last_modified": last_modified}
+
+
+def import_posts(connection, records, tables, default_kind="blog", default_author=None,
+                 batch_size=5000, touch_kind=None, log=print):
+    """Inserts records as posts, `batch_size` rows of a kind per executemany and transaction.
+
+    `tables` is {kind: Table}. Each batch is indexed for search with one INSERT ... SELECT
+    of the new ids, gets its feed fragments and touch_kind(connection, kind) runs in the
+    same transaction. Records
+    are read while they are inserted, so memory doesn't depend on the size of the import.
+    Bad records are logged and skipped. Returns ({kind: inserted}, skipped)."""
+
+    counts = dict.fromkeys(tables, 0)
+    batches = {kind: [] for kind in tables}
+    skipped = 0
+
+    dbapi_connection = connection.connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None  # BEGIN IMMEDIATE is sent explicitly
+    try:
+        for where, record in records:
+            if isinstance(record, dict) and record.get("kind") == "user":
+                skipped += 1  # exported users have no password, they can't be imported
+                continue
+            try:
+                kind, row = post_row(record, tables, default_kind, default_author)
+            except BadRecord as e:
+                log("{}: skipped, {}".format(where, e))
+                skipped += 1
+                continue
+            batch = batches[kind]
+            batch.append(row)
+            if len(batch) >= batch_size:
+                counts[kind] += _write_batch(connection, kind, tables[kind], batch, touch_kind)
+                log("{} {} posts imported".format(counts[kind], kind))
+                batch.clear()
+        for kind, batch in batches.items():
+            if batch:
+                counts[kind] += _write_batch(connection, kind, tables[kind], batch, touch_kind)
+    finally:
+        dbapi_connection.isolation_level = isolation_level
+    return counts, skipped
+
+
+def _write_batch(connection, kind, table, rows, touch_kind):
+    transaction = connection.begin()
+    try:
+        connection.execute(text("BEGIN IMMEDIATE"))
+        last_id = connection.execute(text("SELECT coalesce(max(id), 0) FROM {}".format(table.name))).scalar()
+        connection.execute(table.insert(), rows)
+        fts.index_posts_after(connection, kind, table.name, last_id)
+        feeds.store_entries_after(connection, kind, table.name, last_id)
+        if touch_kind is not None:
+            touch_kind(connection, kind)
+        transaction.commit()
+    except Exception:
+        transaction.rollback()
+        raise
+    return len(rows)
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def export_jsonl(connection, out, tables, users_table, batch_size=1000):
+    """Writes every post and user as a JSON line to out, ordered by id.
+
+    Post lines have the kind of the post, user lines have kind "user" and no password.
+    Rows are fetched `batch_size` at a time. Returns {kind: rows written}."""
+
+    counts = {}
+    sources = [(kind, table, list(table.c)) for kind, table in tables.items()]
+    sources.append(("user", users_table, [users_table.c[name] for name in USER_EXPORT_COLUMNS]))
+    for kind, table, columns in sources:
+        result = connection.execution_options(stream_results=True).execute(
+            select(columns).order_by(table.c.id))
+        counts[kind] = 0
+        rows = result.fetchmany(batch_size)
+        while rows:
+            for row in rows:
+                record = {"kind": kind}
+                record.update(zip(row.keys(), row))
+                out.write(json.dumps(record, default=_json_value, ensure_ascii=False) + "\n")
+            counts[kind] += len(rows)
+            rows = result.fetchmany(batch_size)
+    return counts
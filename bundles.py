@@ -0,0 +1,236 @@
+import base64
+import hashlib
+import io
+import os
+import re
+import urllib.request
+import zipfile
+from html import escape
+
+
+BUNDLE_DIR = "bundles"
+VENDOR_DIR = "vendor"
+
+# Vendored copies of the CDN files: static path -> (CDN url, subresource integrity).
+# Downloads are checked against the integrity, the same url and hash are used when a
+# page falls back to the CDN because the bundles aren't built.
+VENDOR_FILES = {
+    "vendor/jquery/jquery.slim.min.js": (
+        "https://code.jquery.com/jquery-3.5.1.slim.min.js",
+        "sha384-DfXdz2htPH0lsSSs5nCTpuj/zy4C+OGpamoFVy38MVBnE+IbbVYUew+OrCXaRkfj"),
+    "vendor/popper/popper.min.js": (
+        "https://cdn.jsdelivr.net/npm/popper.js@1.16.1/dist/umd/popper.min.js",
+        "sha384-9/reFTGAW83EW2RDu2S0VKaIzap3H66lZH81PoYlFhbGU+6BZp6G7niu735Sk7lN"),
+    "vendor/bootstrap/bootstrap.min.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@4.5.3/dist/js/bootstrap.min.js",
+        "sha384-w1Q4orYjBQndcko6MimVbzY0tgp4pWB4lZ7lr30WKz0vr/aWKhXdBNmNb5D92v7s"),
+    "vendor/bootstrap/bootstrap.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@4.5.3/dist/css/bootstrap.min.css",
+        "sha384-TX8t27EcRE3e/ihU7zmQxVncDAy5uIKz4rEkgIXeMed4M0jlfIDPvg6uqKI2xXr2"),
+}
+
+# CKEditor loads its config, language, skin and plugin files next to ckeditor.js, so the
+# whole release is unpacked into vendor/ckeditor. An archive is only unpacked when it
+# matches its integrity: CKEDITOR_INTEGRITY, or the one given to `flask vendor-assets
+# --ckeditor-integrity` (`--print-integrity` shows the hash of a download to check it
+# against the release before pinning it here).
+CKEDITOR_VERSION = "4.15.0"
+CKEDITOR_INTEGRITY = None
+VENDOR_ARCHIVES = {
+    "vendor/ckeditor": (
+        "https://download.cksource.com/CKEditor/CKEditor/CKEditor%20{0}/ckeditor_{0}_standard.zip".format(
+            CKEDITOR_VERSION),
+        CKEDITOR_INTEGRITY, "ckeditor/"),
+}
+CDN_FILES = dict(VENDOR_FILES)
+CDN_FILES["vendor/ckeditor/ckeditor.js"] = (
+    "https://cdn.ckeditor.com/{}/standard/ckeditor.js".format(CKEDITOR_VERSION), None)
+
+# bundle -> {"js"/"css": static files concatenated in this order}
+BUNDLES = {
+    # every page: navbar collapse needs bootstrap's javascript, which needs jQuery and Popper
+    "base": {
+        "css": ["vendor/bootstrap/bootstrap.min.css"],
+        "js": ["vendor/jquery/jquery.slim.min.js", "vendor/popper/popper.min.js",
+               "vendor/bootstrap/bootstrap.min.js"],
+    },
+    # add/edit pages only
+    "editor": {
+        "js": ["vendor/ckeditor/ckeditor.js", "js/editor.js"],
+    },
+    # listing and search pages, suggestions under the search box
+    "search": {
+        "js": ["js/autocomplete.js"],
+    },
+}
+# javascript put in front of a bundle, {static} is the static url path
+PRELUDES = {
+    "editor": 'window.CKEDITOR_BASEPATH = "{static}/vendor/ckeditor/"',
+}
+
+
+class IntegrityError(Exception):
+    """A download doesn't match its subresource integrity."""
+
+
+def integrity_of(data, algorithm="sha384"):
+    return "{}-{}".format(algorithm, base64.b64encode(hashlib.new(algorithm, data).digest()).decode("ascii"))
+
+
+def download(url, integrity=None, timeout=60):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        data = response.read()
+    if integrity is not None:
+        actual = integrity_of(data, integrity.split("-", 1)[0])
+        if actual != integrity:
+            raise IntegrityError("{}: expected {}, got {}".format(url, integrity, actual))
+    return data
+
+
+def vendor_assets(static_dir, force=False, archive_integrity=None, print_integrity=False, log=print):
+    """Downloads the CDN files into static/vendor. Files which are there and still match
+    their integrity are not downloaded again unless force is given.
+
+    archive_integrity is {directory: integrity} of archives whose integrity isn't pinned
+    in VENDOR_ARCHIVES. An archive without one is skipped with a warning, pages load its
+    files from the CDN then. With print_integrity archives are downloaded and their hash
+    printed, not unpacked."""
+
+    for filename, (url, integrity) in sorted(VENDOR_FILES.items()):
+        path = os.path.join(static_dir, filename)
+        if not force and os.path.exists(path):
+            with open(path, "rb") as f:
+                if integrity_of(f.read(), integrity.split("-", 1)[0]) == integrity:
+                    continue
+        data = download(url, integrity)
+        _write(path, data)
+        log("{}: {} bytes from {}".format(filename, len(data), url))
+
+    for directory, (url, integrity, prefix) in sorted(VENDOR_ARCHIVES.items()):
+        integrity = integrity or (archive_integrity or {}).get(directory)
+        if print_integrity:
+            log("{}: {}".format(url, integrity_of(download(url))))
+            continue
+        target = os.path.join(static_dir, directory)
+        if not force and os.path.isdir(target):
+            continue
+        if integrity is None:
+            log("Warning: {} is skipped, no integrity is pinned for {}. Pass it with --ckeditor-integrity "
+                "(see --print-integrity).".format(directory, url))
+            continue
+        data = download(url, integrity)
+        count = unpack(data, prefix, target)
+        log("{}: {} files from {}".format(directory, count, url))
+
+
+def unpack(data, prefix, target):
+    """Extracts the members of a zip under prefix into target, returns their count."""
+
+    count = 0
+    root = os.path.realpath(target)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or not member.filename.startswith(prefix):
+                continue
+            path = os.path.realpath(os.path.join(root, member.filename[len(prefix):]))
+            if not path.startswith(root + os.sep):
+                continue  # ../ in a member name
+            _write(path, archive.read(member))
+            count += 1
+    return count
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+_js_line_comment_re = re.compile(r"^\s*//.*$")
+_css_comment_re = re.compile(r"/\*(?!!).*?\*/", re.S)
+_css_space_re = re.compile(r"\s*([{};,>])\s*")  # not ":", "a :hover" isn't "a:hover"
+
+
+def minify_js(source):
+    """Drops indentation, blank lines and whole line // comments. Rough but safe for our
+    scripts, anything in a multi line string or template literal would be changed too."""
+
+    lines = (line.strip() for line in source.splitlines())
+    return "\n".join(line for line in lines if line and not _js_line_comment_re.match(line))
+
+
+def minify_css(source):
+    css = _css_comment_re.sub("", source)
+    css = _css_space_re.sub(r"\1", " ".join(css.split()))
+    return css.replace(";}", "}")
+
+
+def bundle_path(name, kind):
+    return "{}/{}.{}".format(BUNDLE_DIR, name, kind)
+
+
+def build_bundles(static_dir, static_url_path="/static", log=print):
+    """Writes static/bundles/<name>.js/.css from the files of BUNDLES, our own files are
+    minified, vendored ones are used as they are. Bundles whose files aren't all there (vendor-assets didn't run)
+    are skipped, pages load those files from the CDN then. Returns built bundle paths."""
+
+    built = []
+    for name, kinds in sorted(BUNDLES.items()):
+        for kind, sources in sorted(kinds.items()):
+            missing = [source for source in sources if not os.path.exists(os.path.join(static_dir, source))]
+            if missing:
+                log("{}: skipped, {} missing".format(bundle_path(name, kind), ", ".join(missing)))
+                continue
+            parts = []
+            if kind == "js" and name in PRELUDES:
+                parts.append(PRELUDES[name].format(static=static_url_path.rstrip("/")))
+            for source in sources:
+                with open(os.path.join(static_dir, source), encoding="utf-8") as f:
+                    text = f.read()
+                if not source.startswith(VENDOR_DIR + "/") and ".min." not in source:
+                    text = minify_js(text) if kind == "js" else minify_css(text)
+                parts.append(text.strip())
+            # a file which doesn't end with ; can't run into the next one
+            data = (";\n" if kind == "js" else "\n").join(parts) + "\n"
+            _write(os.path.join(static_dir, bundle_path(name, kind)), data.encode("utf-8"))
+            log("{}: {} files, {} bytes".format(bundle_path(name, kind), len(sources), len(data)))
+            built.append(bundle_path(name, kind))
+    return built
+
+
+class Bundles:
+    """<link>/<script> tags of bundles for templates: the built bundle when it exists,
+    else its files one by one, from the CDN when they aren't vendored."""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.refresh()
+
+    def refresh(self):
+        files = {bundle_path(name, kind) for name, kinds in BUNDLES.items() for kind in kinds}
+        files.update(source for kinds in BUNDLES.values() for sources in kinds.values() for source in sources)
+        self.present = {filename for filename in files if os.path.exists(os.path.join(self.static_dir, filename))}
+
+    def sources(self, name, kind, static_url):
+        """[(url, integrity)] of a bundle"""
+
+        if bundle_path(name, kind) in self.present:
+            return [(static_url(bundle_path(name, kind)), None)]
+        return [(static_url(source), None) if source in self.present or source not in CDN_FILES
+                else CDN_FILES[source] for source in BUNDLES[name].get(kind, ())]
+
+    def tags(self, name, kind, static_url):
+        """kind is css, js (deferred scripts) or preload (hints for the scripts)"""
+
+        if kind == "css":
+            return "\n".join('<link rel="stylesheet" href="{}"{}>'.format(escape(url), _sri(integrity))
+                             for url, integrity in self.sources(name, "css", static_url))
+        if kind == "preload":
+            return "\n".join('<link rel="preload" as="script" href="{}"{}>'.format(escape(url), _sri(integrity))
+                             for url, integrity in self.sources(name, "js", static_url))
+        return "\n".join('<script defer src="{}"{}></script>'.format(escape(url), _sri(integrity))
+                         for url, integrity in self.sources(name, "js", static_url))
+
+
+def _sri(integrity):
+    return ' integrity="{}" crossorigin="anonymous"'.format(integrity) if integrity else ""
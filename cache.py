@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+CachedPage = namedtuple("CachedPage", "body status content_type tags headers size expires")
+
+
+class PageCache:
+    """In-process LRU cache of rendered pages with a TTL and size limits.
+
+    Every page is saved with tags (e.g. "blog:5", "blogs", "search"), so a write
+    can drop only the pages it affects. Each worker process has its own cache,
+    TTL is the upper limit of a stale page in the other workers."""
+
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._tags = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            if page.expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def set(self, key, body, status=200, content_type="text/html; charset=utf-8", tags=(), headers=()):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        page = CachedPage(body, status, content_type, tuple(tags), tuple(headers), size,
+                          time.monotonic() + self.ttl)
+        with self._lock:
+            if key in self._pages:
+                self._remove(key)
+            self._pages[key] = page
+            self._size += size
+            for tag in page.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            # least recently used pages go first
+            while len(self._pages) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._pages)))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._tags.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    def _remove(self, key):
+        page = self._pages.pop(key, None)
+        if page is None:
+            return
+        self._size -= page.size
+        for tag in page.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
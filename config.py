@@ -0,0 +1,136 @@
+import os
+
+from sqlalchemy.pool import QueuePool
+
+
+def env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def sqlite_pragmas():
+    """PRAGMAs run on every new SQLite connection.
+
+    WAL lets readers go on while the dashboard commits, synchronous=NORMAL is safe
+    with WAL and saves an fsync per commit, busy_timeout makes a writer wait for the
+    lock instead of failing at once."""
+
+    return {
+        "journal_mode": env("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": env("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "cache_size": env_int("SQLITE_CACHE_SIZE", -16000),  # negative is KiB, 16 MB
+        "mmap_size": env_int("SQLITE_MMAP_SIZE", 128 * 1024 * 1024),
+        "temp_store": env("SQLITE_TEMP_STORE", "MEMORY"),
+    }
+
+
+def engine_options(database_uri):
+    """Connection pool of a worker process. Each request thread holds one connection
+    at most, so pool size is about the threads of a worker."""
+
+    if not database_uri.startswith("sqlite"):
+        return {"pool_size": env_int("DB_POOL_SIZE", 5), "pool_recycle": 3600, "pool_pre_ping": True}
+    if database_uri in ("sqlite://", "sqlite:///:memory:"):
+        return {}
+    return {
+        "poolclass": QueuePool,
+        "pool_size": env_int("DB_POOL_SIZE", 5),
+        "max_overflow": env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": env_int("DB_POOL_TIMEOUT", 30),
+        # a pooled connection moves between request threads, one thread uses it at a time
+        "connect_args": {"check_same_thread": False,
+                         "timeout": env_int("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000.0},
+    }
+
+
+class Config:
+    """Settings of the app, every one of them can be changed by an environment variable."""
+
+    SECRET_KEY = env("SECRET_KEY", "ozyalhan-web-dev-project")
+
+    # relative sqlite paths are relative to this directory
+    SQLALCHEMY_DATABASE_URI = env("DATABASE_URL", "sqlite:///ozy_blog.db")
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = sqlite_pragmas()
+
+    # Listing pages (blogs, diaries, projects) page size, ?per_page= can change it until MAX_POSTS_PER_PAGE
+    POSTS_PER_PAGE = env_int("POSTS_PER_PAGE", 20)
+    MAX_POSTS_PER_PAGE = env_int("MAX_POSTS_PER_PAGE", 100)
+    # Send listing pages while they render (they aren't cached then), dashboard is always streamed
+    STREAM_LISTINGS = env("STREAM_LISTINGS", "0") == "1"
+    STREAM_BUFFER_SIZE = env_int("STREAM_BUFFER_SIZE", 8)  # template chunks per write
+
+    # Rendered public pages for anonymous visitors
+    PAGE_CACHE_MAX_ENTRIES = env_int("PAGE_CACHE_MAX_ENTRIES", 512)
+    PAGE_CACHE_MAX_BYTES = env_int("PAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+    PAGE_CACHE_TTL = env_int("PAGE_CACHE_TTL", 300)
+
+    # Resized images, the default directory is instance/images
+    IMAGE_CACHE_DIR = env("IMAGE_CACHE_DIR")
+    IMAGE_WORKERS = env_int("IMAGE_WORKERS", 2)
+
+    # Password hashing, changing rounds hashes old passwords again at their next login
+    PASSWORD_HASH_ROUNDS = env_int("PASSWORD_HASH_ROUNDS", 535000)
+    PASSWORD_HASH_WORKERS = env_int("PASSWORD_HASH_WORKERS", 2)
+    PASSWORD_HASH_MAX_WAITING = env_int("PASSWORD_HASH_MAX_WAITING", 16)
+
+    # Login throttling, an sqlite file path in RATE_LIMIT_STORAGE shares buckets between workers
+    RATE_LIMIT_STORAGE = env("RATE_LIMIT_STORAGE")
+    LOGIN_IP_BURST = env_int("LOGIN_IP_BURST", 20)
+    LOGIN_IP_PER_MINUTE = env_float("LOGIN_IP_PER_MINUTE", 10)
+    LOGIN_EMAIL_BURST = env_int("LOGIN_EMAIL_BURST", 5)
+    LOGIN_EMAIL_PER_MINUTE = env_float("LOGIN_EMAIL_PER_MINUTE", 2)
+
+    # Request metrics at /metrics, only with METRICS_TOKEN (or in debug mode); requests slower than
+    # SLOW_REQUEST_MS are logged with their SQL, 0 turns the log off
+    METRICS_ENABLED = env("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = env("METRICS_TOKEN")
+    SLOW_REQUEST_MS = env_int("SLOW_REQUEST_MS", 0)
+
+    # Feeds and sitemaps, links are absolute: SITE_URL e.g. https://ozyalhan.com, the host of
+    # the request when it isn't set (set it in production). Sitemaps with more urls are split
+    # under a sitemap index
+    SITE_URL = env("SITE_URL")
+    FEED_ENTRIES = env_int("FEED_ENTRIES", 20)
+    SITEMAP_MAX_URLS = env_int("SITEMAP_MAX_URLS", 50000)
+
+    # Views of post pages are counted in memory and written every VIEW_FLUSH_SECONDS,
+    # POPULAR_POSTS most read posts are shown on the index page
+    COUNT_VIEWS = env("COUNT_VIEWS", "1") == "1"
+    VIEW_FLUSH_SECONDS = env_int("VIEW_FLUSH_SECONDS", 10)
+    POPULAR_POSTS = env_int("POPULAR_POSTS", 5)
+
+    # RELATED_POSTS most similar posts (tf-idf of title and text) are shown under a post,
+    # computed by jobs when posts change. Run `flask rebuild-related` after changing it.
+    RELATED_POSTS = env_int("RELATED_POSTS", 5)
+
+    # /suggest answers from titles in memory, SUGGEST_LIMIT of them; other processes'
+    # changes show up when the titles are loaded again after SUGGEST_RELOAD_SECONDS
+    SUGGEST_LIMIT = env_int("SUGGEST_LIMIT", 8)
+    SUGGEST_RELOAD_SECONDS = env_int("SUGGEST_RELOAD_SECONDS", 300)
+
+    # Background jobs (contact mail, ...), the default file is instance/jobs.db. JOB_WORKERS
+    # threads run in every web process, with 0 run `flask run-jobs` as a separate process
+    JOB_QUEUE_DATABASE = env("JOB_QUEUE_DATABASE")
+    JOB_WORKERS = env_int("JOB_WORKERS", 1)
+    JOB_MAX_ATTEMPTS = env_int("JOB_MAX_ATTEMPTS", 5)
+    JOB_RETRY_DELAY = env_int("JOB_RETRY_DELAY", 30)  # seconds before the first retry, doubled each time
+
+    # Mail of the contact form, sent by the job workers
+    MAIL_SERVER = env("MAIL_SERVER", "localhost")
+    MAIL_PORT = env_int("MAIL_PORT", 25)
+    MAIL_USERNAME = env("MAIL_USERNAME")
+    MAIL_PASSWORD = env("MAIL_PASSWORD")
+    MAIL_USE_TLS = env("MAIL_USE_TLS", "0") == "1"
+    MAIL_USE_SSL = env("MAIL_USE_SSL", "0") == "1"
+    MAIL_SENDER = env("MAIL_SENDER", "contact@ozyalhan.com")
+    CONTACT_RECIPIENT = env("CONTACT_RECIPIENT", "ozguryasaralhan@gmail.com")
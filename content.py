@@ -0,0 +1,184 @@
+import math
+import re
+from collections import namedtuple
+from html import escape
+from html.parser import HTMLParser
+
+from highlight import highlight_code_blocks
+from search import html_to_text
+
+try:
+    import markdown
+except ImportError:  # without it a small converter handles paragraphs, headings and code blocks
+    markdown = None
+
+
+CONTENT_FORMATS = ("html", "markdown")
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+
+# What CKEditor makes, everything else is dropped
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "caption", "cite", "code", "dd", "del", "div", "dl", "dt",
+    "em", "figcaption", "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins", "kbd",
+    "li", "mark", "ol", "p", "pre", "q", "s", "samp", "small", "span", "strike", "strong", "sub", "sup",
+    "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "*": {"class", "title", "lang", "dir"},
+    "a": {"href", "name", "target", "rel"},
+    "img": {"src", "alt", "width", "height"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan", "scope"},
+    "ol": {"start", "type"},
+    "blockquote": {"cite"},
+    "q": {"cite"},
+}
+URL_ATTRIBUTES = {"href", "src", "cite"}
+URL_SCHEMES = {"http", "https", "mailto"}
+# dropped with everything in them
+DROP_WITH_CONTENT = {"script", "style", "iframe", "object", "embed", "noscript", "template", "svg", "math",
+                     "textarea", "select", "frameset", "head", "title"}
+VOID_TAGS = {"br", "hr", "img"}
+
+RenderedContent = namedtuple("RenderedContent", "html css excerpt word_count reading_time")
+
+_scheme_re = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+_heading_re = re.compile(r"(#{1,6})\s+(.*)")
+
+
+def safe_url(url):
+    """url if it is relative or http(s)/mailto, else None. javascript: etc. are dropped."""
+
+    compact = "".join(ch for ch in url if ch > " ")
+    match = _scheme_re.match(compact)
+    if match and match.group(1).lower() not in URL_SCHEMES:
+        return None
+    return url.strip()
+
+
+class Sanitizer(HTMLParser):
+    """Rebuilds html with allowed tags and attributes only, text is escaped again and
+    unclosed tags are closed at the end."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.open_tags = []
+        self.dropping = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping:
+            if tag in DROP_WITH_CONTENT:
+                self.dropping.append(tag)
+            return
+        if tag in DROP_WITH_CONTENT:
+            self.dropping.append(tag)
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES["*"] | ALLOWED_ATTRIBUTES.get(tag, set())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES:
+                value = safe_url(value)
+                if value is None:
+                    continue
+            parts.append('{}="{}"'.format(name, escape(value)))
+        if tag == "a" and dict(attrs).get("target") == "_blank" and "rel" not in dict(attrs):
+            parts.append('rel="noopener noreferrer"')
+        self.output.append("<{}>".format(" ".join(parts)))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag and not self.dropping:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            if tag == self.dropping[-1]:
+                self.dropping.pop()
+            return
+        if tag not in self.open_tags:
+            return
+        # close tags which were left open inside this one
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append("</{}>".format(open_tag))
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.output.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.output.append("</{}>".format(self.open_tags.pop()))
+        return "".join(self.output)
+
+
+def sanitize_html(html):
+    sanitizer = Sanitizer()
+    sanitizer.feed(html or "")
+    return sanitizer.close()
+
+
+def markdown_to_html(source):
+    if markdown is not None:
+        return markdown.markdown(source, extensions=["fenced_code", "tables"])
+
+    html, paragraph, code, language = [], [], None, ""
+
+    def end_paragraph():
+        if paragraph:
+            html.append("<p>{}</p>".format(escape(" ".join(" ".join(paragraph).split()))))
+            paragraph.clear()
+
+    for line in source.splitlines():
+        if code is not None:
+            if line.strip().startswith("```"):
+                html.append('<pre class="prettyprint{}">{}</pre>'.format(language, escape("\n".join(code))))
+                code = None
+            else:
+                code.append(line)
+        elif line.strip().startswith("```"):
+            end_paragraph()
+            code, language = [], line.strip()[3:].strip()
+            language = " lang-" + language if language else ""
+        elif not line.strip():
+            end_paragraph()
+        elif _heading_re.match(line) and not paragraph:
+            match = _heading_re.match(line)
+            html.append("<h{0}>{1}</h{0}>".format(len(match.group(1)), escape(match.group(2).strip())))
+        else:
+            paragraph.append(line)
+    end_paragraph()
+    if code is not None:
+        html.append('<pre class="prettyprint{}">{}</pre>'.format(language, escape("\n".join(code))))
+    return "\n".join(html)
+
+
+def excerpt_of(text, length=EXCERPT_LENGTH):
+    if len(text) <= length:
+        return text
+    cut = text[:length + 1].rsplit(" ", 1)[0] if " " in text[:length + 1] else text[:length]
+    return cut.rstrip(" ,.;:-") + "…"
+
+
+def render_content(source, content_format="html"):
+    """Sanitized html with highlighted code blocks, the css of those blocks, plain text
+    excerpt, word count and reading time (minutes) of a post body."""
+
+    html = markdown_to_html(source or "") if content_format == "markdown" else source
+    html = sanitize_html(html)
+    # text before highlighting, its token spans would split code into more words
+    text = html_to_text(html)
+    html, css = highlight_code_blocks(html)
+    words = len(text.split())
+    return RenderedContent(html, css, excerpt_of(text), words, max(1, int(math.ceil(words / WORDS_PER_MINUTE))))
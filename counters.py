@@ -0,0 +1,155 @@
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy import text
+
+
+POPULAR_TABLE = "popular_posts"
+
+PopularPost = namedtuple("PopularPost", "kind id title views")
+
+log = logging.getLogger(__name__)
+
+# errors of the counts themselves, not of the database; writing them again fails again
+UNWRITABLE = (OverflowError, TypeError, ValueError)
+
+
+class ViewCounter:
+    """Page views counted in memory and written every `interval` seconds in one transaction.
+
+    hit() only adds to a dict under a lock, so readers never wait for SQLite's writer.
+    `flush(counts)` gets {(kind, id): views} and writes them, if it fails the counts are
+    kept for the next time, unless they can't be written at all (UNWRITABLE). `load_popular()` is called after every flush and its result is
+    kept for templates, so showing popular posts costs no query. stop() writes what is
+    left, it is registered with atexit."""
+
+    def __init__(self, flush, load_popular, interval=10, max_pending=10000, context=None):
+        self.flush_function = flush
+        self.load_popular = load_popular
+        self.interval = interval
+        self.max_pending = max_pending
+        self.context = context
+        self.popular = None  # loaded at the first top() or flush
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def hit(self, kind, id):
+        with self._lock:
+            key = (kind, id)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            full = len(self._counts) >= self.max_pending
+            if self._thread is None:
+                self._start()
+        if full:
+            self._wakeup.set()
+
+    def top(self):
+        """Popular posts as they were at the last flush."""
+
+        if self.popular is None:
+            self.popular = self.load_popular()
+        return self.popular
+
+    def pending(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="view-counter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if not self._stopped.is_set():
+                self.flush()
+
+    def flush(self):
+        """Writes the counts collected so far and loads popular posts again. Returns how many
+        posts got views."""
+
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+            try:
+                if self.context is None:
+                    self._flush(counts)
+                else:
+                    with self.context():
+                        self._flush(counts)
+            except UNWRITABLE as e:
+                # a count SQLite can't take (an id out of its integer range) would fail every
+                # later flush too, so the batch is dropped
+                log.error("View counts of %d posts are dropped, they can't be written: %r", len(counts), e)
+                return 0
+            except Exception:
+                log.exception("View counts couldn't be written, they are kept for the next flush")
+                with self._lock:
+                    for key, views in counts.items():
+                        self._counts[key] = self._counts.get(key, 0) + views
+                return 0
+            return len(counts)
+
+    def _flush(self, counts):
+        if counts:
+            self.flush_function(counts)
+        self.popular = self.load_popular()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 5)
+        if self._counts:
+            self.flush()
+
+
+def create_popular_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS {} (kind VARCHAR(20) NOT NULL, post_id INTEGER NOT NULL, "
+        "title VARCHAR(40) NOT NULL, views INTEGER NOT NULL, PRIMARY KEY (kind, post_id))".format(POPULAR_TABLE)))
+
+
+def add_views(connection, tables, counts):
+    """views = views + n of every counted post, one executemany per table. Plain SQL, so
+    last_modified and the write hooks of posts are not touched by views."""
+
+    by_kind = {}
+    for (kind, id), views in counts.items():
+        by_kind.setdefault(kind, []).append({"id": id, "views": views})
+    for kind, rows in by_kind.items():
+        connection.execute(text("UPDATE {} SET views = views + :views WHERE id = :id".format(tables[kind])), rows)
+
+
+def update_popular(connection, tables, limit):
+    """Top `limit` posts of every kind by views into the popular table. Each part reads
+    `limit` rows of the views index of its table."""
+
+    parts = " UNION ALL ".join(
+        "SELECT * FROM (SELECT '{0}' AS kind, id, title, views FROM {1} WHERE views > 0 "
+        "ORDER BY views DESC LIMIT :limit)".format(kind, table) for kind, table in tables.items())
+    connection.execute(text("DELETE FROM {}".format(POPULAR_TABLE)))
+    connection.execute(text("INSERT INTO {} (kind, post_id, title, views) SELECT kind, id, title, views FROM ({}) "
+                            "ORDER BY views DESC LIMIT :limit".format(POPULAR_TABLE, parts)), {"limit": limit})
+
+
+def popular_posts(connection, limit):
+    rows = connection.execute(text("SELECT kind, post_id, title, views FROM {} ORDER BY views DESC, kind, post_id "
+                                   "LIMIT :limit".format(POPULAR_TABLE)), {"limit": limit})
+    return [PopularPost(*row) for row in rows]
+
+
+def rename_popular(connection, kind, post_id, title):
+    connection.execute(text("UPDATE {} SET title = :title WHERE kind = :kind AND post_id = :post_id"
+                            .format(POPULAR_TABLE)), {"kind": kind, "post_id": post_id, "title": title})
+
+
+def remove_popular(connection, kind, post_id):
+    connection.execute(text("DELETE FROM {} WHERE kind = :kind AND post_id = :post_id".format(POPULAR_TABLE)),
+                       {"kind": kind, "post_id": post_id})
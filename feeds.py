@@ -0,0 +1,208 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from sqlalchemy import text
+
+
+# Atom entry, RSS item and sitemap <url> of every post are kept in one table and made
+# again only by the write hooks of that post. Feeds and sitemaps join the fragments of
+# the newest entries, no post is rendered to serve them.
+FEED_TABLE = "feed_entries"
+
+# Fragments have paths, SITE is replaced by the site url when they are served, so
+# SITE_URL can change without rebuilding them. Control characters can't be in XML,
+# they are removed from the text, so SITE can't be in a post.
+SITE = "\x01"
+
+FEED_CONTENT_TYPES = {"atom": "application/atom+xml", "rss": "application/rss+xml"}
+
+SitemapPart = namedtuple("SitemapPart", "kind bucket lastmod")
+
+_invalid_xml_re = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _text(value):
+    return escape(_invalid_xml_re.sub("", value or ""))
+
+
+def _site(site_url):
+    """Site url as it is put in place of SITE, in text and in double quoted attributes."""
+
+    return escape(_invalid_xml_re.sub("", site_url.rstrip("/")), {'"': "&quot;"})
+
+
+def _as_datetime(value):
+    """Dates of rows read with text() queries are strings in SQLite."""
+
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def rfc3339(value):
+    return _as_datetime(value).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def rfc822(value):
+    return format_datetime(_as_datetime(value).replace(tzinfo=timezone.utc))
+
+
+def post_path(kind, post_id):
+    return "/{}/{}".format(kind, post_id)
+
+
+def entry_fragments(kind, post):
+    """{"atom", "rss", "sitemap"} fragments of a post row or object with id, title, author,
+    publish_date, last_modified, excerpt and content_html (or content)."""
+
+    link = SITE + post_path(kind, post.id)
+    updated = post.last_modified or post.publish_date
+    html = _text(getattr(post, "content_html", None) or post.content)
+    return {
+        "atom": "<entry><title>{title}</title><link href={link}/><id>{link_text}</id>"
+                "<published>{published}</published><updated>{updated}</updated>"
+                "<author><name>{author}</name></author><category term={kind}/>"
+                "<summary>{summary}</summary><content type=\"html\">{html}</content></entry>".format(
+                    title=_text(post.title), link=quoteattr(link), link_text=link, kind=quoteattr(kind),
+                    published=rfc3339(post.publish_date), updated=rfc3339(updated),
+                    author=_text(post.author), summary=_text(post.excerpt), html=html),
+        "rss": "<item><title>{title}</title><link>{link}</link><guid isPermaLink=\"true\">{link}</guid>"
+               "<pubDate>{published}</pubDate><category>{kind}</category>"
+               "<description>{html}</description></item>".format(
+                   title=_text(post.title), link=link, published=rfc822(post.publish_date), kind=kind, html=html),
+        "sitemap": "<url><loc>{}</loc><lastmod>{}</lastmod></url>".format(link, rfc3339(updated)),
+    }
+
+
+def create_feed_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS {} (kind VARCHAR(20) NOT NULL, post_id INTEGER NOT NULL, "
+        "publish_date DATETIME NOT NULL, updated DATETIME NOT NULL, atom TEXT NOT NULL, rss TEXT NOT NULL, "
+        "sitemap TEXT NOT NULL, PRIMARY KEY (kind, post_id))".format(FEED_TABLE)))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_{0}_publish_date ON {0} (publish_date, post_id)"
+                            .format(FEED_TABLE)))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_{0}_kind_publish_date ON {0} (kind, publish_date, post_id)"
+                            .format(FEED_TABLE)))
+
+
+def _entry_values(kind, post):
+    values = entry_fragments(kind, post)
+    values.update(kind=kind, post_id=post.id, publish_date=str(_as_datetime(post.publish_date)),
+                  updated=str(_as_datetime(post.last_modified or post.publish_date)))
+    return values
+
+
+_insert_sql = ("INSERT OR REPLACE INTO {} (kind, post_id, publish_date, updated, atom, rss, sitemap) "
+               "VALUES (:kind, :post_id, :publish_date, :updated, :atom, :rss, :sitemap)".format(FEED_TABLE))
+
+
+def store_entry(connection, kind, post):
+    """Makes the fragments of one post again, in the transaction which writes the post."""
+
+    connection.execute(text(_insert_sql), _entry_values(kind, post))
+
+
+def remove_entry(connection, kind, post_id):
+    connection.execute(text("DELETE FROM {} WHERE kind = :kind AND post_id = :post_id".format(FEED_TABLE)),
+                       {"kind": kind, "post_id": post_id})
+
+
+def store_entries_after(connection, kind, table, after_id=0, until_id=None, batch_size=500):
+    """Fragments of the posts of a table with after_id < id <= until_id, for imports and rebuilds."""
+
+    last_id = after_id
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, title, author, publish_date, last_modified, excerpt, content_html, content FROM {} "
+            "WHERE id > :after_id AND id <= :until_id ORDER BY id LIMIT :limit".format(table)),
+            {"after_id": last_id, "until_id": until_id if until_id is not None else 2 ** 63 - 1,
+             "limit": batch_size}).fetchall()
+        if not rows:
+            return
+        connection.execute(text(_insert_sql), [_entry_values(kind, row) for row in rows])
+        last_id = rows[-1].id
+
+
+def rebuild_feed_entries(connection, tables):
+    """Makes every fragment again. `tables` is {kind: table name}."""
+
+    connection.execute(text("DELETE FROM {}".format(FEED_TABLE)))
+    for kind, table in tables.items():
+        store_entries_after(connection, kind, table)
+
+
+def latest_fragments(connection, fmt, kind=None, limit=20):
+    """Newest fragments of a format ("atom" or "rss"), of one kind or all kinds."""
+
+    where = "WHERE kind = :kind " if kind else ""
+    return [row[0] for row in connection.execute(text(
+        "SELECT {} FROM {} {}ORDER BY publish_date DESC, post_id DESC LIMIT :limit".format(fmt, FEED_TABLE, where)),
+        {"kind": kind, "limit": limit})]
+
+
+def feed_document(fmt, site_url, title, self_path, page_path, updated, fragments):
+    """Atom or RSS document around entry fragments."""
+
+    site_url = site_url.rstrip("/")
+    if fmt == "atom":
+        head = ('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+                '<title>{}</title><id>{}</id><link rel="self" href={}/><link href={}/><updated>{}</updated>'.format(
+                    _text(title), _text(site_url + self_path), quoteattr(site_url + self_path),
+                    quoteattr(site_url + page_path), rfc3339(updated)))
+        tail = "</feed>\n"
+    else:
+        head = ('<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel><title>{}</title>'
+                '<link>{}</link><description>{}</description><lastBuildDate>{}</lastBuildDate>'.format(
+                    _text(title), _text(site_url + page_path), _text(title), rfc822(updated)))
+        tail = "</channel></rss>\n"
+    return head + "".join(fragments).replace(SITE, _site(site_url)) + tail
+
+
+def sitemap_document(site_url, paths, fragments):
+    """<urlset> of some paths without lastmod (e.g. /about) and post fragments."""
+
+    site_url = site_url.rstrip("/")
+    urls = "".join("<url><loc>{}</loc></url>".format(escape(site_url + path)) for path in paths)
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + urls + "".join(fragments).replace(SITE, _site(site_url)) + "</urlset>\n")
+
+
+def sitemap_index_document(site_url, parts):
+    """<sitemapindex> of (path, lastmod or None) pairs."""
+
+    site_url = site_url.rstrip("/")
+    items = []
+    for path, lastmod in parts:
+        lastmod = "<lastmod>{}</lastmod>".format(rfc3339(lastmod)) if lastmod else ""
+        items.append("<sitemap><loc>{}</loc>{}</sitemap>".format(escape(site_url + path), lastmod))
+    return ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + "".join(items) + "</sitemapindex>\n")
+
+
+def entry_count(connection):
+    return connection.execute(text("SELECT count(*) FROM {}".format(FEED_TABLE))).scalar()
+
+
+def all_sitemap_fragments(connection):
+    for row in connection.execute(text("SELECT sitemap FROM {} ORDER BY kind, post_id".format(FEED_TABLE))):
+        yield row[0]
+
+
+# Big sites: posts of a kind are split into parts by id, part n has ids from n * size to
+# (n + 1) * size - 1, so every part has at most `size` urls and keeps its url when posts
+# are added; a part is read by a primary key range.
+
+def sitemap_parts(connection, size):
+    rows = connection.execute(text(
+        "SELECT kind, post_id / :size AS bucket, max(updated) FROM {} GROUP BY kind, bucket ORDER BY kind, bucket"
+        .format(FEED_TABLE)), {"size": size})
+    return [SitemapPart(kind, bucket, _as_datetime(lastmod)) for kind, bucket, lastmod in rows]
+
+
+def sitemap_part_fragments(connection, kind, bucket, size):
+    return [row[0] for row in connection.execute(text(
+        "SELECT sitemap FROM {} WHERE kind = :kind AND post_id >= :start AND post_id < :end ORDER BY post_id"
+        .format(FEED_TABLE)), {"kind": kind, "start": bucket * size, "end": (bucket + 1) * size})]
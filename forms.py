@@ -1,12 +1,16 @@
 from wtforms import Form, TextField, TextAreaField, SubmitField, validators, ValidationError
 
 
+# the name and subject go into mail headers, where a line break would start a new header
+ONE_LINE = validators.Regexp(r"^[^\r\n]*\Z", message="Please use a single line.")
+
+
 class ContactForm(Form):
-    name = TextField("Name",  [validators.Required("Please enter your name.")])
+    name = TextField("Name",  [validators.Required("Please enter your name."), ONE_LINE])
     email = TextField("Email",  [validators.Required(
         "Please enter your email address."), validators.Email("Please enter your email address.")])
     subject = TextField(
-        "Subject",  [validators.Required("Please enter a subject.")])
+        "Subject",  [validators.Required("Please enter a subject."), ONE_LINE])
     message = TextAreaField(
         "Message",  [validators.Required("Please enter a message.")])
     submit = SubmitField("Send")
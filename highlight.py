@@ -0,0 +1,107 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from html import unescape
+
+try:
+    from pygments import highlight as pygments_highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name, guess_lexer
+    from pygments.lexers.special import TextLexer
+    from pygments.util import ClassNotFound
+except ImportError:  # without Pygments code blocks are shown as plain text
+    pygments_highlight = None
+
+
+STYLE = "default"
+CSS_CLASS = "highlight"
+CACHE_SIZE = 1024
+
+# code blocks of sanitized post html: <pre class="prettyprint lang-py">, <pre><code class="language-py">
+_pre_re = re.compile(r"<pre\b([^>]*)>(.*?)</pre>", re.S | re.I)
+_language_re = re.compile(r"\b(?:lang|language)-([\w+#.-]+)")
+_tag_re = re.compile(r"<[^>]*>")
+_class_re = re.compile(r'class="([\w-]+)"')
+_rule_re = re.compile(r"^\.{} \.([\w-]+) \{{".format(CSS_CLASS))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def lexer_for(language, code):
+    if language:
+        try:
+            return get_lexer_by_name(language)
+        except ClassNotFound:
+            pass
+    try:
+        return guess_lexer(code)
+    except ClassNotFound:
+        return TextLexer()
+
+
+def highlight_block(language, code):
+    """(html, token classes) of one code block, cached by the hash of language and code
+    so saving a post again doesn't highlight its unchanged blocks again."""
+
+    key = hashlib.sha1("{}\0{}".format(language, code).encode("utf-8")).hexdigest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    lexer = lexer_for(language, code)
+    if isinstance(lexer, TextLexer):
+        result = None, ()
+    else:
+        html = pygments_highlight(code, lexer, HtmlFormatter(nowrap=True)).rstrip("\n")
+        result = html, tuple(sorted(set(_class_re.findall(html))))
+
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def highlight_code_blocks(html):
+    """Highlights <pre> blocks of html with Pygments. Returns (html, css): css has the
+    style rules of the token types which the blocks use, nothing else."""
+
+    if pygments_highlight is None or "<pre" not in html:
+        return html, ""
+    used = set()
+
+    def replace(match):
+        language = _language_re.search(match.group(0))
+        code = unescape(_tag_re.sub("", match.group(2)))
+        highlighted, classes = highlight_block(language.group(1).lower() if language else "", code)
+        if highlighted is None:
+            return match.group(0)
+        used.update(classes)
+        return '<pre class="{}">{}</pre>'.format(CSS_CLASS, highlighted)
+
+    html = _pre_re.sub(replace, html)
+    return html, stylesheet(used) if used else ""
+
+
+@lru_cache()
+def style_rules(style=STYLE):
+    """[(token class or None for the block rule, css rule)] of a Pygments style."""
+
+    rules = []
+    for line in HtmlFormatter(style=style).get_style_defs("." + CSS_CLASS).splitlines():
+        match = _rule_re.match(line)
+        if match:
+            rules.append((match.group(1), line.split(" /*")[0]))
+        elif line.startswith(".{} {{".format(CSS_CLASS)):
+            rules.append((None, line))
+    return rules
+
+
+def stylesheet(classes, style=STYLE):
+    """Pygments css of the style reduced to the block rule and the given token classes."""
+
+    return "\n".join(rule for token, rule in style_rules(style) if token is None or token in classes)
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from html import escape, unescape
+
+try:
+    from PIL import Image, features
+    # broken or unknown files (UnidentifiedImageError is an OSError), images too big to open
+    IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+except ImportError:  # without Pillow images are served as they are
+    Image = None
+    IMAGE_ERRORS = (OSError, ValueError)
+
+
+WIDTHS = (320, 640, 960, 1280)
+# only these widths (and the width of the image) are made, other widths are 404 so
+# requests can't fill the disk with copies; templates can ask for any of them
+ALLOWED_WIDTHS = (160, 320, 480, 640, 960, 1280)
+# format -> (file extension, mime type, Pillow save options)
+FORMATS = {
+    "avif": ("avif", "image/avif", {"quality": 50}),
+    "webp": ("webp", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+log = logging.getLogger(__name__)
+
+
+class DerivativeFailed(Exception):
+    """A resized copy couldn't be made: the image is broken or resizing took too long."""
+
+
+def supported_formats():
+    """Output formats this Pillow can write, best one first."""
+
+    if Image is None:
+        return []
+    return [fmt for fmt in FORMATS if fmt == "jpeg" or features.check(fmt)]
+
+
+def render_derivative(source, target, width, fmt):
+    """Resizes source to width (never bigger than it is) and saves it as fmt. Runs in worker processes."""
+
+    extension, mime, options = FORMATS[fmt]
+    with Image.open(source) as image:
+        image.load()
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        tmp = "{}.{}.tmp".format(target, os.getpid())
+        image.save(tmp, format=fmt.upper(), **options)
+    os.replace(tmp, target)
+    return target
+
+
+class SourceInfo:
+    def __init__(self, digest, width, height):
+        self.digest = digest
+        self.width = width
+        self.height = height
+
+
+class ImagePipeline:
+    """Makes resized WebP/AVIF/JPEG copies of static images when they are first asked.
+
+    Copies are kept in cache_dir by the hash of the source file, so a changed image
+    gets new files and new urls. Resizing runs in a process pool."""
+
+    def __init__(self, static_dir, cache_dir, workers=2):
+        self.static_dir = static_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.formats = supported_formats()
+        self._sources = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def enabled(self):
+        return bool(self.formats)
+
+    def source_path(self, filename):
+        path = os.path.normpath(os.path.join(self.static_dir, filename))
+        if not path.startswith(os.path.normpath(self.static_dir) + os.sep):
+            return None
+        if not path.lower().endswith(SOURCE_EXTENSIONS) or not os.path.isfile(path):
+            return None
+        return path
+
+    def source_info(self, filename):
+        """Hash and size of a static image, None if it is not an image we can resize."""
+
+        path = self.source_path(filename)
+        if path is None or not self.enabled:
+            return None
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        info = self._sources.get(key)
+        if info is None:
+            try:
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:16]
+                with Image.open(path) as image:
+                    info = SourceInfo(digest, image.width, image.height)
+            except IMAGE_ERRORS as e:
+                log.warning("%s can't be resized, it is served as it is: %s", filename, e)
+                return None
+            self._sources[key] = info
+        return info
+
+    def widths(self, info, widths=WIDTHS):
+        """Widths smaller than the image and the image's own width, of ALLOWED_WIDTHS only."""
+
+        return [width for width in widths if width < info.width and width in ALLOWED_WIDTHS] + [info.width]
+
+    def derivative(self, filename, width, fmt, timeout=30):
+        """Path of the resized copy, renders it in the pool if it doesn't exist yet. None when
+        there is no such image or the width isn't one of self.widths(info, ALLOWED_WIDTHS).
+        Raises DerivativeFailed when rendering fails or takes longer than timeout seconds."""
+
+        info = self.source_info(filename)
+        if info is None or fmt not in self.formats or width not in self.widths(info, ALLOWED_WIDTHS):
+            return None
+        target = os.path.join(self.cache_dir, info.digest[:2],
+                              "{}-{}.{}".format(info.digest, width, FORMATS[fmt][0]))
+        if os.path.exists(target):
+            return target
+
+        with self._lock:
+            future = self._pending.get(target)
+            if future is None:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                future = self._pool.submit(render_derivative, self.source_path(filename), target, width, fmt)
+                self._pending[target] = future
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise DerivativeFailed("{} at {}px took longer than {}s to resize".format(filename, width, timeout))
+        except IMAGE_ERRORS + (BrokenExecutor,) as e:
+            raise DerivativeFailed("{} at {}px couldn't be resized: {}".format(filename, width, e))
+        finally:
+            with self._lock:
+                self._pending.pop(target, None)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+def srcset(url_for_size, widths, fmt):
+    return ", ".join("{} {}w".format(url_for_size(width, fmt), width) for width in widths)
+
+
+def picture_html(pipeline, filename, src, url_for_size, attributes, sizes="100vw", widths=WIDTHS):
+    """<picture> with avif/webp sources and a jpeg srcset for a static image.
+
+    `attributes` are the attributes of the <img> tag as a dict, `src` is its fallback
+    url and url_for_size(width, fmt) gives the url of a resized copy."""
+
+    info = pipeline.source_info(filename)
+    if info is None:
+        return "<img {}>".format(_attributes(dict(attributes, src=src)))
+
+    widths = pipeline.widths(info, widths)
+    attributes = dict(attributes, src=src, sizes=sizes, width=info.width, height=info.height,
+                      srcset=srcset(url_for_size, widths, "jpeg"))
+    attributes.setdefault("loading", "lazy")
+    attributes.setdefault("decoding", "async")
+    sources = "".join('<source type="{}" srcset="{}" sizes="{}">'.format(
+        FORMATS[fmt][1], escape(srcset(url_for_size, widths, fmt)), escape(sizes))
+        for fmt in pipeline.formats if fmt != "jpeg")
+    return "<picture>{}<img {}></picture>".format(sources, _attributes(attributes))
+
+
+def _attributes(attributes):
+    return " ".join('{}="{}"'.format(name, escape(str(value))) for name, value in attributes.items()
+                    if value is not None)
+
+
+_img_re = re.compile(r"<img\b([^>]*)>", re.I)
+_attribute_re = re.compile(r"""([\w:-]+)\s*=\s*("[^"]*"|'[^']*'|[^\s"'>]+)""")
+
+
+def rewrite_img_tags(html, static_url_path, pipeline, url_for_size_of, sizes="(min-width: 992px) 800px, 100vw"):
+    """Turns <img src="/static/..."> tags of post content into responsive <picture>s.
+
+    Images from other sites are left as they are. url_for_size_of(filename) returns
+    the url_for_size function of that static file."""
+
+    prefix = static_url_path.rstrip("/") + "/"
+
+    def replace(match):
+        attributes = {name.lower(): unescape(value.strip("\"'"))
+                      for name, value in _attribute_re.findall(match.group(1))}
+        src = attributes.get("src", "")
+        if not src.startswith(prefix) or "srcset" in attributes:
+            return match.group(0)
+        filename = src[len(prefix):]
+        if pipeline.source_info(filename) is None:
+            return match.group(0)
+        attributes.pop("src")
+        attributes.pop("width", None)
+        attributes.pop("height", None)
+        return picture_html(pipeline, filename, src, url_for_size_of(filename), attributes, sizes=sizes)
+
+    return _img_re.sub(replace, html or "")
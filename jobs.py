@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+Job = namedtuple("Job", "id kind payload attempts max_attempts")
+
+log = logging.getLogger(__name__)
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying can't help, the job goes to the dead letters at once."""
+
+
+class JobQueue:
+    """Durable jobs in an SQLite file, shared by every process which opens the file.
+
+    A job is claimed in a BEGIN IMMEDIATE transaction and leased for `lease_seconds`,
+    a job of a worker which died is claimed again after its lease. Failed jobs run again
+    after 2^attempts * retry_delay seconds (with jitter, at most max_retry_delay) until
+    max_attempts, then they stay as dead letters until `retry_dead`."""
+
+    def __init__(self, path, max_attempts=5, retry_delay=30, max_retry_delay=3600, lease_seconds=300,
+                 keep_done_seconds=7 * 24 * 3600, cleanup_every=1000):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lease_seconds = lease_seconds
+        self.keep_done_seconds = keep_done_seconds
+        self.cleanup_every = cleanup_every
+        self.handlers = {}
+        self.wakeup = threading.Event()  # set by enqueue, workers of this process start at once
+        self._local = threading.local()
+        self._finished = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+            "run_at REAL NOT NULL, locked_until REAL, last_error TEXT, created REAL NOT NULL, finished REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)")
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def handler(self, kind):
+        """Decorator of the function which runs jobs of a kind, it gets the payload."""
+
+        def decorator(f):
+            self.handlers[kind] = f
+            return f
+        return decorator
+
+    def enqueue(self, kind, payload=None, delay=0, max_attempts=None):
+        """Adds a job, payload must be JSON serializable. Returns the job id."""
+
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (kind, payload, status, max_attempts, run_at, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload), QUEUED, max_attempts or self.max_attempts, now + delay, now))
+        self.wakeup.set()
+        return cursor.lastrowid
+
+    def claim(self, now=None):
+        """Next due job, marked running and leased to the caller. None if nothing is due."""
+
+        now = time.time() if now is None else now
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT id, kind, payload, attempts, max_attempts FROM jobs "
+                "WHERE (status = ? AND run_at <= ?) OR (status = ? AND locked_until < ?) "
+                "ORDER BY run_at LIMIT 1", (QUEUED, now, RUNNING, now)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ? "
+                                   "WHERE id = ?", (RUNNING, now + self.lease_seconds, row[0]))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3] + 1, row[4])
+
+    def complete(self, job, now=None):
+        now = time.time() if now is None else now
+        connection = self._connect()
+        connection.execute("UPDATE jobs SET status = ?, locked_until = NULL, last_error = NULL, finished = ? "
+                           "WHERE id = ?", (DONE, now, job.id))
+        self._finished += 1
+        if self._finished % self.cleanup_every == 0:
+            connection.execute("DELETE FROM jobs WHERE status = ? AND finished < ?",
+                               (DONE, now - self.keep_done_seconds))
+
+    def fail(self, job, error, permanent=False, now=None):
+        """Schedules the job again with backoff or makes it a dead letter. Returns the new status."""
+
+        now = time.time() if now is None else now
+        if permanent or job.attempts >= job.max_attempts:
+            self._connect().execute("UPDATE jobs SET status = ?, locked_until = NULL, last_error = ?, finished = ? "
+                                    "WHERE id = ?", (DEAD, error, now, job.id))
+            return DEAD
+        self._connect().execute("UPDATE jobs SET status = ?, locked_until = NULL, last_error = ?, run_at = ? "
+                                "WHERE id = ?", (QUEUED, error, now + self.backoff(job.attempts), job.id))
+        return QUEUED
+
+    def backoff(self, attempts):
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)  # workers of many failed jobs don't retry in step
+
+    def run(self, job, context=None):
+        """Runs a claimed job with its handler, inside context() if it is given. Returns its new status."""
+
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            return self.fail(job, "no handler for {!r}".format(job.kind), permanent=True)
+        try:
+            if context is None:
+                handler(job.payload)
+            else:
+                with context():
+                    handler(job.payload)
+        except Exception as e:
+            status = self.fail(job, traceback.format_exc(limit=5), permanent=isinstance(e, PermanentJobError))
+            log.warning("Job %s %s failed (attempt %s of %s), %s: %s", job.id, job.kind, job.attempts,
+                        job.max_attempts, status, e)
+            return status
+        self.complete(job)
+        return DONE
+
+    def run_pending(self, context=None, limit=None):
+        """Runs due jobs until there are none (or `limit` ran). Returns {status: count}."""
+
+        counts = {}
+        while limit is None or sum(counts.values()) < limit:
+            job = self.claim()
+            if job is None:
+                break
+            status = self.run(job, context)
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def retry_dead(self, ids=None):
+        """Queues dead letters again with fresh attempts. Returns how many."""
+
+        sql = "UPDATE jobs SET status = ?, attempts = 0, run_at = ?, finished = NULL WHERE status = ?"
+        parameters = [QUEUED, time.time(), DEAD]
+        if ids:
+            sql += " AND id IN ({})".format(", ".join("?" * len(ids)))
+            parameters += list(ids)
+        count = self._connect().execute(sql, parameters).rowcount
+        self.wakeup.set()
+        return count
+
+    def stats(self):
+        """{status: count}"""
+
+        return dict(self._connect().execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall())
+
+    def dead_letters(self, limit=20):
+        return self._connect().execute(
+            "SELECT id, kind, attempts, finished, last_error FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+            (DEAD, limit)).fetchall()
+
+
+class Workers:
+    """Threads which run jobs of a queue, they look for due jobs every `poll_seconds`
+    or at once when this process enqueues one."""
+
+    def __init__(self, queue, threads=1, poll_seconds=5, context=None):
+        self.queue = queue
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self.context = context
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.threads):
+                thread = threading.Thread(target=self._run, name="job-worker-{}".format(number), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.queue.run_pending(self.context, limit=100)
+            except sqlite3.Error:
+                log.exception("Job queue is not available")
+                ran = None
+            if not ran:
+                self.queue.wakeup.wait(self.poll_seconds)
+                self.queue.wakeup.clear()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self.queue.wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stop.clear()
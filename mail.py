@@ -0,0 +1,40 @@
+import smtplib
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+
+from jobs import PermanentJobError
+
+
+def make_message(sender, recipients, subject, body, reply_to=None):
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = ", ".join(recipients)
+    message["Subject"] = subject
+    message["Message-ID"] = make_msgid()
+    if reply_to:
+        message["Reply-To"] = formataddr(reply_to) if isinstance(reply_to, (list, tuple)) else reply_to
+    message.set_content(body)
+    return message
+
+
+def send_message(message, host="localhost", port=25, username=None, password=None, use_tls=False,
+                 use_ssl=False, timeout=30):
+    """Sends with smtplib. 5xx answers of the server raise PermanentJobError, sending again
+    won't help; connection problems and 4xx raise smtplib/OSError errors and are retried."""
+
+    smtp_class = smtplib.SMTP_SSL if use_ssl else smtplib.SMTP
+    try:
+        with smtp_class(host, port, timeout=timeout) as smtp:
+            if use_tls and not use_ssl:
+                smtp.starttls()
+            if username:
+                smtp.login(username, password or "")
+            smtp.send_message(message)
+    except smtplib.SMTPRecipientsRefused as e:
+        if all(code >= 500 for code, _ in e.recipients.values()):
+            raise PermanentJobError(str(e))
+        raise
+    except smtplib.SMTPResponseException as e:
+        if e.smtp_code >= 500:
+            raise PermanentJobError("{} {}".format(e.smtp_code, e.smtp_error))
+        raise
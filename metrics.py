@@ -0,0 +1,150 @@
+import threading
+from bisect import bisect_left
+
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus style histogram: counts of observations per upper bound, sum and count."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteStats:
+    __slots__ = ("latency", "queries", "query_seconds", "template_seconds", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statuses = {}
+
+
+class RequestTimer:
+    """Measurements of one request, kept on flask.g while it runs."""
+
+    __slots__ = ("started", "queries", "query_seconds", "template_seconds", "template_started",
+                 "statements", "status")
+
+    def __init__(self, started, keep_statements):
+        self.started = started
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_started = None
+        # (seconds, sql) of the request for the slow request log, None when the log is off
+        self.statements = [] if keep_statements else None
+        self.status = 500
+
+    def query(self, statement, seconds, max_statements=50):
+        self.queries += 1
+        self.query_seconds += seconds
+        if self.statements is not None and len(self.statements) < max_statements:
+            self.statements.append((seconds, statement))
+
+
+class RequestMetrics:
+    """Latency and query histograms per (endpoint, method) of one process.
+
+    Each worker process has its own numbers, Prometheus adds them up when every worker
+    is scraped; with one scrape target the numbers are of the process which answered."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, timer, seconds):
+        key = (endpoint, method)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(timer.queries)
+            stats.query_seconds += timer.query_seconds
+            stats.template_seconds += timer.template_seconds
+            stats.statuses[timer.status] = stats.statuses.get(timer.status, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def prometheus(self):
+        """Text exposition format 0.0.4"""
+
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+            _histogram(lines, "http_request_duration_seconds", "Request latency by endpoint.",
+                       [(key, stats.latency) for key, stats in routes])
+            _histogram(lines, "db_queries_per_request", "SQL statements of a request by endpoint.",
+                       [(key, stats.queries) for key, stats in routes])
+            lines += ["# HELP http_requests_total Requests by endpoint and status.",
+                      "# TYPE http_requests_total counter"]
+            for key, stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append("http_requests_total{{{},status=\"{}\"}} {}".format(_labels(key), status, count))
+            _counter(lines, "db_query_duration_seconds_total", "Time spent in SQL statements by endpoint.",
+                     [(key, stats.query_seconds) for key, stats in routes])
+            _counter(lines, "template_render_seconds_total", "Time spent rendering templates by endpoint.",
+                     [(key, stats.template_seconds) for key, stats in routes])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key):
+    endpoint, method = key
+    return 'endpoint="{}",method="{}"'.format(endpoint.replace("\\", "\\\\").replace('"', '\\"'), method)
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram(lines, name, help, histograms):
+    lines += ["# HELP {} {}".format(name, help), "# TYPE {} histogram".format(name)]
+    for key, histogram in histograms:
+        labels = _labels(key)
+        for bound, count in histogram.cumulative():
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, _number(bound), count))
+        lines.append("{}_sum{{{}}} {}".format(name, labels, _number(histogram.sum)))
+        lines.append("{}_count{{{}}} {}".format(name, labels, histogram.count))
+
+
+def _counter(lines, name, help, values):
+    lines += ["# HELP {} {}".format(name, help), "# TYPE {} counter".format(name)]
+    for key, value in values:
+        lines.append("{}{{{}}} {}".format(name, _labels(key), _number(value)))
+
+
+def slow_request_report(method, path, endpoint, seconds, timer):
+    """Log message of a slow request with its SQL, slowest statements first."""
+
+    lines = ["Slow request {} {} ({}) {:.1f} ms: {} queries {:.1f} ms, templates {:.1f} ms".format(
+        method, path, endpoint, seconds * 1000, timer.queries, timer.query_seconds * 1000,
+        timer.template_seconds * 1000)]
+    for query_seconds, statement in sorted(timer.statements or (), key=lambda item: -item[0]):
+        lines.append("  {:.1f} ms  {}".format(query_seconds * 1000, " ".join(statement.split())))
+    return "\n".join(lines)
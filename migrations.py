@@ -0,0 +1,183 @@
+from sqlalchemy import text
+
+import counters
+import feeds
+import related
+import search as fts
+
+
+# Schema version of the database is kept in sqlite's PRAGMA user_version.
+# A fresh database is created by db.create_all() and then goes through the same
+# migrations, so every migration must be safe to run on a schema which already has it.
+MIGRATIONS = []
+
+POST_TABLES = {"blog": "blogs", "diary": "diaries", "project": "projects"}
+
+
+def migration(version, description):
+    """Registers an upgrade function of the given schema version."""
+
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return f
+    return decorator
+
+
+def current_version(connection):
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(engine, log=print):
+    """Applies pending migrations in order, each one in its own write transaction.
+
+    BEGIN IMMEDIATE takes the write lock before the version is read, so several
+    workers starting together don't run the same migration twice."""
+
+    applied = []
+    with engine.connect() as connection:
+        dbapi_connection = connection.connection
+        isolation_level = dbapi_connection.isolation_level
+        # pysqlite must not open transactions itself, we open them explicitly below
+        dbapi_connection.isolation_level = None
+        try:
+            for version, description, upgrade in MIGRATIONS:
+                transaction = connection.begin()
+                try:
+                    connection.execute(text("BEGIN IMMEDIATE"))
+                    if current_version(connection) >= version:
+                        transaction.rollback()
+                        continue
+                    upgrade(connection)
+                    connection.execute(text("PRAGMA user_version = {:d}".format(version)))
+                    transaction.commit()
+                except Exception:
+                    transaction.rollback()
+                    raise
+                applied.append(version)
+                log("Migrated database to version {}: {}".format(version, description))
+        finally:
+            dbapi_connection.isolation_level = isolation_level
+    return applied
+
+
+def column_exists(connection, table, column):
+    rows = connection.execute(text("PRAGMA table_info({})".format(table))).fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def add_column(connection, table, column, definition):
+    """ALTER TABLE ADD COLUMN which does nothing if the column is there."""
+
+    if not column_exists(connection, table, column):
+        connection.execute(text("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition)))
+
+
+@migration(1, "full text search index")
+def create_search_index(connection):
+    if fts.create_search_index(connection):
+        fts.rebuild_search_index(connection, POST_TABLES)
+
+
+@migration(2, "author and publish_date indexes of post tables")
+def create_post_indexes(connection):
+    for table in POST_TABLES.values():
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_{0}_publish_date ON {0} (publish_date, id)".format(table)))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_{0}_author_publish_date ON {0} (author, publish_date, id)"
+            .format(table)))
+
+
+@migration(3, "last_modified of posts and content_versions table")
+def add_last_modified(connection):
+    for table in POST_TABLES.values():
+        if not column_exists(connection, table, "last_modified"):
+            add_column(connection, table, "last_modified", "DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00'")
+            connection.execute(text("UPDATE {} SET last_modified = publish_date".format(table)))
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS content_versions ("
+        "kind VARCHAR(20) NOT NULL, changed_at DATETIME NOT NULL, PRIMARY KEY (kind))"))
+    connection.execute(text(
+        "INSERT OR IGNORE INTO content_versions (kind, changed_at) "
+        "SELECT kind, datetime('now') FROM (SELECT 'blog' AS kind UNION ALL SELECT 'diary' UNION ALL SELECT 'project')"))
+
+
+@migration(4, "rendered html, excerpt, word count and reading time of posts")
+def add_rendered_content(connection):
+    # filled by the write hooks of posts and `flask render-content` for old rows
+    for table in POST_TABLES.values():
+        add_column(connection, table, "content_format", "VARCHAR(10) NOT NULL DEFAULT 'html'")
+        add_column(connection, table, "content_html", "TEXT")
+        add_column(connection, table, "excerpt", "VARCHAR(300)")
+        add_column(connection, table, "word_count", "INTEGER")
+        add_column(connection, table, "reading_time", "INTEGER")
+
+
+@migration(5, "css of highlighted code blocks of posts")
+def add_content_css(connection):
+    for table in POST_TABLES.values():
+        add_column(connection, table, "content_css", "TEXT")
+
+
+@migration(6, "atom, rss and sitemap fragments of posts")
+def create_feed_entries(connection):
+    feeds.create_feed_table(connection)
+    feeds.rebuild_feed_entries(connection, POST_TABLES)
+
+
+@migration(7, "view counts of posts and popular posts table")
+def add_views(connection):
+    for table in POST_TABLES.values():
+        add_column(connection, table, "views", "INTEGER NOT NULL DEFAULT 0")
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_{0}_views ON {0} (views)".format(table)))
+    counters.create_popular_table(connection)
+
+
+# the lists of existing posts are not computed in the migration, which runs at startup,
+# the app enqueues a rebuild_related job after it (see migrate_database in blog.py)
+RELATED_POSTS_VERSION = 8
+
+
+@migration(RELATED_POSTS_VERSION, "related posts table")
+def create_related_posts(connection):
+    related.create_related_table(connection)
+
+
+@migration(9, "change times of related posts lists")
+def create_related_versions(connection):
+    related.create_related_table(connection)
+    connection.execute(text(
+        "INSERT OR IGNORE INTO {} (kind, post_id, changed_at) SELECT DISTINCT kind, post_id, datetime('now') "
+        "FROM {}".format(related.VERSIONS_TABLE, related.RELATED_TABLE)))
+
+
+def explain_query_plan(connection, query):
+    """EXPLAIN QUERY PLAN lines of an ORM query or a select, e.g. ['SEARCH blogs USING INDEX ...']"""
+
+    compiled = getattr(query, "statement", query).compile(dialect=connection.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + str(compiled), params)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def plan_problems(plan, must_search=False):
+    """Lines of a query plan which mean full table scan or sorting in a temp b-tree.
+
+    With must_search, walking a whole index (SCAN ... USING INDEX) is a problem too."""
+
+    problems = []
+    for line in plan:
+        if line.startswith("SCAN") and ("INDEX" not in line or must_search):
+            problems.append(line)
+        elif "TEMP B-TREE" in line:
+            problems.append(line)
+    return problems
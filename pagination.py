@@ -0,0 +1,243 @@
+from datetime import datetime
+
+from sqlalchemy import and_, column, desc, literal_column, or_, select, union_all
+
+
+CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+class Page:
+    """One page of a keyset paginated listing.
+
+    `next_cursor` and `prev_cursor` are None when there is nothing more to
+    read in that direction."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+class LazyRows:
+    """Rows of a query which are fetched while they are iterated (once).
+
+    `bool()` reads only the first row, so templates can still say {% if rows %}."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._first = []
+        self._empty = None
+
+    def __bool__(self):
+        if self._empty is None:
+            for row in self._rows:
+                self._first.append(row)
+                break
+            self._empty = not self._first
+        return not self._empty
+
+    def __iter__(self):
+        first, self._first = self._first, []
+        for row in first:
+            yield row
+        for row in self._rows:
+            self._empty = False
+            yield row
+
+
+class StreamingPage(Page):
+    """Page whose rows come from a database cursor while the template renders them.
+
+    rows is the result of a query for `per_page + 1` rows, encode gives the cursor of
+    a row. next_cursor is known after the rows are iterated, so the template must use it
+    below the rows. Only for newest first pages (no ?before=)."""
+
+    def __init__(self, rows, per_page, has_cursor, encode=None):
+        super().__init__(LazyRows(self._rows(rows, per_page, has_cursor, encode or encode_cursor)))
+
+    def _rows(self, rows, per_page, has_cursor, encode):
+        last = None
+        for count, row in enumerate(rows):
+            if count == 0 and has_cursor:
+                self.prev_cursor = encode(row)
+            if count == per_page:
+                self.next_cursor = encode(last)
+                break
+            last = row
+            yield row
+
+
+def encode_cursor(post):
+    """Cursor of a row is its publish date and id, e.g. 20201105134501000000-42"""
+
+    return "{}-{}".format(post.publish_date.strftime(CURSOR_DATE_FORMAT), post.id)
+
+
+def decode_cursor(cursor):
+    """Returns (publish_date, id) tuple or None for a broken/empty cursor."""
+
+    if not cursor:
+        return None
+    try:
+        date_part, id_part = cursor.split("-", 1)
+        return datetime.strptime(date_part, CURSOR_DATE_FORMAT), int(id_part)
+    except ValueError:
+        return None
+
+
+def keyset_query(query, model, after=None, before=None, limit=20):
+    """Adds cursor condition, order and limit to query for one page.
+
+    The condition is written as `publish_date <= d AND (publish_date < d OR id < i)`
+    so SQLite can use it as a range on the (publish_date, id) index and doesn't
+    walk over all the previous pages."""
+
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after)
+
+    if before_key is not None:
+        # going back: read the rows newer than cursor in oldest first order
+        date, id = before_key
+        return query.filter(model.publish_date >= date,
+                            or_(model.publish_date > date, model.id > id)) \
+            .order_by(model.publish_date.asc(), model.id.asc()).limit(limit)
+
+    if after_key is not None:
+        date, id = after_key
+        query = query.filter(model.publish_date <= date,
+                             or_(model.publish_date < date, model.id < id))
+
+    return query.order_by(model.publish_date.desc(), model.id.desc()).limit(limit)
+
+
+def keyset_paginate(query, model, after=None, before=None, per_page=20, stream=False):
+    """Newest first pagination over (publish_date, id).
+
+    Instead of OFFSET, every page starts right after the last row of the
+    previous one, so SQLite only reads `per_page + 1` rows no matter how deep
+    the reader goes. With stream, rows are read while they are rendered
+    (see StreamingPage)."""
+
+    going_back = decode_cursor(before) is not None
+    has_cursor = going_back or decode_cursor(after) is not None
+
+    if stream and not going_back:
+        return StreamingPage(keyset_query(query, model, after=after, limit=per_page + 1).yield_per(100),
+                             per_page, has_cursor)
+
+    rows = keyset_query(query, model, after=after, before=before, limit=per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if going_back:
+        rows.reverse()
+        next_cursor = encode_cursor(rows[-1]) if rows else None
+        prev_cursor = encode_cursor(rows[0]) if rows and has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1]) if rows and has_more else None
+        prev_cursor = encode_cursor(rows[0]) if rows and has_cursor else None
+    return Page(rows, next_cursor, prev_cursor)
+
+
+# Feed: newest posts of several tables in one list. The cursor has the kind too, e.g.
+# 20201105134501000000-42-blog, rows of different tables can have the same date and id.
+
+def encode_feed_cursor(row):
+    return "{}-{}-{}".format(row.publish_date.strftime(CURSOR_DATE_FORMAT), row.id, row.kind)
+
+
+def decode_feed_cursor(cursor):
+    """Returns (publish_date, id, kind) or None for a broken/empty cursor."""
+
+    if not cursor:
+        return None
+    try:
+        date_part, id_part, kind = cursor.split("-", 2)
+        return datetime.strptime(date_part, CURSOR_DATE_FORMAT), int(id_part), kind
+    except ValueError:
+        return None
+
+
+def _feed_condition(model, kind, key, older):
+    """Keyset condition of one table: its rows after (older) or before the cursor in
+    (publish_date, id, kind) order. The kind is the same for every row of a table, so it
+    only decides whether the cursor's own id is in or out."""
+
+    date, id, cursor_kind = key
+    if older:
+        id_condition = model.id <= id if kind < cursor_kind else model.id < id
+        return and_(model.publish_date <= date, or_(model.publish_date < date, id_condition))
+    id_condition = model.id >= id if kind > cursor_kind else model.id > id
+    return and_(model.publish_date >= date, or_(model.publish_date > date, id_condition))
+
+
+def feed_query(models, columns, where=None, after=None, before=None, limit=20):
+    """UNION ALL of one keyset query per model ({kind: model}), newest first.
+
+    Every part is read in (publish_date, id) index order and SQLite merges the parts
+    (MERGE (UNION ALL) in the query plan), so a page reads about `limit` rows of each
+    table however many posts there are. Rows have a kind column and `columns`.
+    `where(model)` gives an extra condition, e.g. the author."""
+
+    before_key = decode_feed_cursor(before)
+    key = before_key or decode_feed_cursor(after)
+    parts = []
+    for kind, model in models.items():
+        part = select([literal_column("'{}'".format(kind)).label("kind")] +
+                      [getattr(model, name).label(name) for name in columns])
+        if where is not None:
+            part = part.where(where(model))
+        if key is not None:
+            part = part.where(_feed_condition(model, kind, key, older=before_key is None))
+        parts.append(part)
+    order = [column("publish_date"), column("id"), column("kind")]
+    if before_key is None:
+        order = [desc(name) for name in order]
+    return union_all(*parts).order_by(*order).limit(limit)
+
+
+def feed_paginate(session, models, columns, where=None, after=None, before=None, per_page=20, stream=False):
+    """Page of feed_query rows, with ?after= and ?before= cursors and stream like
+    keyset_paginate."""
+
+    going_back = decode_feed_cursor(before) is not None
+    has_cursor = going_back or decode_feed_cursor(after) is not None
+
+    if stream and not going_back:
+        rows = _lazy_result(session, feed_query(models, columns, where, after=after, limit=per_page + 1))
+        return StreamingPage(rows, per_page, has_cursor, encode_feed_cursor)
+
+    rows = session.execute(feed_query(models, columns, where, after=after, before=before,
+                                      limit=per_page + 1)).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if going_back:
+        rows.reverse()
+        next_cursor = encode_feed_cursor(rows[-1]) if rows else None
+        prev_cursor = encode_feed_cursor(rows[0]) if rows and has_more else None
+    else:
+        next_cursor = encode_feed_cursor(rows[-1]) if rows and has_more else None
+        prev_cursor = encode_feed_cursor(rows[0]) if rows and has_cursor else None
+    return Page(rows, next_cursor, prev_cursor)
+
+
+def _lazy_result(session, statement):
+    """Rows of statement, which runs when the first row is read (a streamed page that is
+    never sent runs no query) and is closed when the reader stops."""
+
+    result = session.execute(statement)
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
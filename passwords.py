@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.hash import sha256_crypt
+
+
+DEFAULT_ROUNDS = sha256_crypt.default_rounds
+
+
+class HasherBusy(Exception):
+    """Too many hash jobs are waiting, the request should be rejected instead of queued."""
+
+
+def hash_password(secret, rounds):
+    return sha256_crypt.using(rounds=rounds).hash(secret)
+
+
+def hash_rounds(hashed):
+    return sha256_crypt.from_string(hashed).rounds
+
+
+def verify_password(secret, hashed, rounds):
+    """Returns (matched, new_hash). new_hash is not None when the password is right but
+    hashed with other rounds than the current policy."""
+
+    if not hashed or not sha256_crypt.identify(hashed):
+        return False, None
+    if not sha256_crypt.verify(secret, hashed):
+        return False, None
+    if hash_rounds(hashed) != rounds:
+        return True, hash_password(secret, rounds)
+    return True, None
+
+
+class PasswordHasher:
+    """Runs password hashing in a process pool, so it doesn't hold the request threads'
+    GIL. At most `workers + max_waiting` jobs are accepted, the others raise HasherBusy
+    after `wait_timeout` seconds."""
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=2, max_waiting=16, wait_timeout=5):
+        self.rounds = rounds
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(workers + max_waiting)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise HasherBusy()
+        try:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, secret):
+        return self._run(hash_password, secret, self.rounds)
+
+    def verify(self, secret, hashed):
+        """(matched, new_hash), see verify_password"""
+
+        return self._run(verify_password, secret, hashed, self.rounds)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
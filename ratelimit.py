@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBuckets:
+    """Token buckets of one process, key -> (tokens, updated) tuples in an LRU dict.
+
+    When there are more than max_keys, the least recently used keys are dropped; a
+    dropped bucket simply starts full again."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SQLiteBuckets:
+    """Token buckets in an SQLite file, so all worker processes share the counters.
+
+    Buckets idle longer than `idle_seconds` are full again anyway, they are deleted
+    from time to time."""
+
+    def __init__(self, path, idle_seconds=3600, cleanup_every=1000):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.cleanup_every = cleanup_every
+        self._local = threading.local()
+        self._calls = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID")
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate, now):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                               (key, tokens, now))
+            self._calls += 1
+            if self._calls % self.cleanup_every == 0:
+                connection.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_seconds,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+
+class RateLimiter:
+    """Token bucket limiter: `burst` requests at once, then `per_minute` requests a minute."""
+
+    def __init__(self, storage, burst, per_minute, prefix=""):
+        self.storage = storage
+        self.capacity = float(burst)
+        self.rate = per_minute / 60.0
+        self.prefix = prefix
+
+    def take(self, key):
+        """Returns (allowed, retry_after_seconds)."""
+
+        allowed, tokens = self.storage.take(self.prefix + key, self.capacity, self.rate, time.time())
+        if allowed:
+            return True, 0
+        if not self.rate:
+            return False, 60
+        return False, int((1 - tokens) / self.rate) + 1
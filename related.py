@@ -0,0 +1,277 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from sqlalchemy import text
+
+from search import html_to_text
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:  # without them the same vectors are dicts, fine for a few thousand posts
+    numpy = sparse = None
+
+
+RELATED_TABLE = "related_posts"
+# when the related list of a post was written last, pages of posts use it for conditional GET
+VERSIONS_TABLE = "related_versions"
+DEFAULT_COUNT = 5  # related posts of a post
+TITLE_WEIGHT = 3  # title words count as if they were in the body this many times
+MIN_TERM_LENGTH = 3
+MAX_DOCUMENT_FREQUENCY = 0.5  # words in more than half of the posts say nothing about them
+BATCH_CELLS = 20000000  # similarity values computed at once: rows of a batch * posts
+
+Related = namedtuple("Related", "kind id title score")
+
+_word_re = re.compile(r"\w+", re.UNICODE)
+
+STOP_WORDS = frozenset(
+    "the and for are but not you all any can had her was one our out day get has him his how man new now old see "
+    "two way who boy did its let put say she too use that with have this will your from they know want been good "
+    "much some time very when come here just like long make many more only over such take than them well were "
+    "what which while would there their these those into also then about after before being could should where "
+    "bir ve ile için gibi daha çok olan olarak ama veya bu şu".split())
+
+
+def terms_of(title, html):
+    """Term counts of a post, title words weighted by TITLE_WEIGHT."""
+
+    counts = Counter()
+    for text_, weight in ((title or "", TITLE_WEIGHT), (html_to_text(html), 1)):
+        for word in _word_re.findall(text_.lower()):
+            if len(word) >= MIN_TERM_LENGTH and word not in STOP_WORDS and not word.isdigit():
+                counts[word] += weight
+    return counts
+
+
+class Corpus:
+    """Term counts of every post, kept between updates: a post is tokenized again only
+    when its last_modified changed."""
+
+    def __init__(self):
+        self._terms = {}  # (kind, id) -> (last_modified, title, Counter)
+        self._lock = threading.Lock()
+
+    def load(self, connection, tables):
+        """[(kind, id)], [title], [Counter] of all posts."""
+
+        present = set()
+        with self._lock:
+            for kind, table in tables.items():
+                stale = []
+                for id, last_modified, title in connection.execute(
+                        text("SELECT id, last_modified, title FROM {}".format(table))):
+                    present.add((kind, id))
+                    entry = self._terms.get((kind, id))
+                    if entry is None or entry[0] != last_modified:
+                        stale.append(id)
+                for start in range(0, len(stale), 500):
+                    ids = ", ".join(str(int(id)) for id in stale[start:start + 500])
+                    for id, last_modified, title, html in connection.execute(text(
+                            "SELECT id, last_modified, title, coalesce(content_html, content) FROM {} "
+                            "WHERE id IN ({})".format(table, ids))):
+                        self._terms[(kind, id)] = (last_modified, title, terms_of(title, html))
+            for key in set(self._terms) - present:  # deleted
+                del self._terms[key]
+            keys = sorted(self._terms)
+            return keys, [self._terms[key][1] for key in keys], [self._terms[key][2] for key in keys]
+
+
+def tfidf(documents):
+    """(vocabulary {term: column}, rows) of L2 normalized tf-idf vectors, words in more than
+    MAX_DOCUMENT_FREQUENCY of the posts left out. With scipy the rows are a csr matrix, made
+    at once from the term counts; weighting and normalizing are operations on its arrays.
+    Without it a row is a {column: weight} dict."""
+
+    if sparse is None:
+        return _tfidf_dicts(documents)
+
+    count = len(documents)
+    term_ids = {}
+    indptr, indices, counts = [0], [], []
+    for document in documents:
+        for term, n in document.items():
+            indices.append(term_ids.setdefault(term, len(term_ids)))
+            counts.append(n)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix((numpy.array(counts, dtype=numpy.float64), numpy.array(indices, dtype=numpy.int64),
+                                numpy.array(indptr, dtype=numpy.int64)), shape=(count, len(term_ids)))
+
+    frequency = numpy.bincount(matrix.indices, minlength=len(term_ids))
+    kept = numpy.flatnonzero(frequency <= max(2, MAX_DOCUMENT_FREQUENCY * count))
+    if not len(kept):
+        return {}, sparse.csr_matrix((count, 1), dtype=numpy.float32)
+    terms = list(term_ids)
+    vocabulary = {terms[term_id]: column for column, term_id in enumerate(kept)}
+    matrix = matrix[:, kept].tocsr()
+
+    idf = numpy.log((1 + count) / (1 + frequency[kept])) + 1
+    matrix.data = (1 + numpy.log(matrix.data)) * idf[matrix.indices]
+    norms = numpy.sqrt(numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix.data /= numpy.repeat(norms, numpy.diff(matrix.indptr))
+    return vocabulary, matrix.astype(numpy.float32)
+
+
+def _tfidf_dicts(documents):
+    """tfidf() with plain dicts, the same weights."""
+
+    count = len(documents)
+    frequency = Counter()
+    for counts in documents:
+        frequency.update(counts.keys())
+    limit = max(2, MAX_DOCUMENT_FREQUENCY * count)
+    vocabulary = {}
+    for term, df in sorted(frequency.items()):
+        if df <= limit:
+            vocabulary[term] = len(vocabulary)
+    idf = {term: math.log((1 + count) / (1 + frequency[term])) + 1 for term in vocabulary}
+
+    vectors = []
+    for counts in documents:
+        vector = {vocabulary[term]: (1 + math.log(n)) * idf[term] for term, n in counts.items() if term in vocabulary}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({column: weight / norm for column, weight in vector.items()})
+    return vocabulary, vectors
+
+
+def neighbours(vectors, rows, k):
+    """{row: [(score, other row)]} top k cosine neighbours of the given rows, best first.
+
+    With scipy the similarities of a batch of rows to all posts are one sparse matrix
+    product, batches are as big as BATCH_CELLS allows."""
+
+    result = {}
+    if sparse is None:
+        for row in rows:
+            vector = vectors[row]
+            scores = ((sum(weight * other.get(column, 0.0) for column, weight in vector.items()), other_row)
+                      for other_row, other in enumerate(vectors) if other_row != row)
+            result[row] = [(score, other_row) for score, other_row in heapq.nlargest(k, scores) if score > 0]
+        return result
+
+    count = vectors.shape[0]
+    transposed = vectors.T.tocsr()
+    batch = max(1, BATCH_CELLS // max(1, count))
+    rows = list(rows)
+    for start in range(0, len(rows), batch):
+        batch_rows = rows[start:start + batch]
+        scores = (vectors[batch_rows] @ transposed).toarray()
+        scores[numpy.arange(len(batch_rows)), batch_rows] = -1.0  # not related to itself
+        top = min(k, count - 1)
+        if top <= 0:
+            for row in batch_rows:
+                result[row] = []
+            continue
+        best = numpy.argpartition(-scores, top - 1, axis=1)[:, :top]
+        for i, row in enumerate(batch_rows):
+            columns = sorted(best[i], key=lambda column: -scores[i, column])
+            result[row] = [(float(scores[i, column]), int(column)) for column in columns if scores[i, column] > 0]
+    return result
+
+
+def create_related_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS {} (kind VARCHAR(20) NOT NULL, post_id INTEGER NOT NULL, rank INTEGER NOT NULL, "
+        "related_kind VARCHAR(20) NOT NULL, related_id INTEGER NOT NULL, title VARCHAR(40) NOT NULL, "
+        "score REAL NOT NULL, PRIMARY KEY (kind, post_id, rank))".format(RELATED_TABLE)))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_{0}_related ON {0} (related_kind, related_id)"
+                            .format(RELATED_TABLE)))
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS {} (kind VARCHAR(20) NOT NULL, post_id INTEGER NOT NULL, "
+        "changed_at DATETIME NOT NULL, PRIMARY KEY (kind, post_id))".format(VERSIONS_TABLE)))
+
+
+def _write(connection, keys, titles, result):
+    """Replaces the related rows of the posts in result."""
+
+    if not result:
+        return
+    posts = [{"kind": keys[row][0], "post_id": keys[row][1], "changed_at": str(datetime.utcnow())} for row in result]
+    connection.execute(text("DELETE FROM {} WHERE kind = :kind AND post_id = :post_id".format(RELATED_TABLE)),
+                       posts)
+    connection.execute(text("INSERT OR REPLACE INTO {} (kind, post_id, changed_at) "
+                            "VALUES (:kind, :post_id, :changed_at)".format(VERSIONS_TABLE)), posts)
+    values = [{"kind": keys[row][0], "post_id": keys[row][1], "rank": rank, "related_kind": keys[other][0],
+               "related_id": keys[other][1], "title": titles[other], "score": score}
+              for row, pairs in result.items() for rank, (score, other) in enumerate(pairs)]
+    if values:
+        connection.execute(text(
+            "INSERT INTO {} (kind, post_id, rank, related_kind, related_id, title, score) "
+            "VALUES (:kind, :post_id, :rank, :related_kind, :related_id, :title, :score)".format(RELATED_TABLE)),
+            values)
+
+
+def rebuild_related(connection, corpus, tables, k):
+    """Related posts of every post. Returns how many posts."""
+
+    keys, titles, documents = corpus.load(connection, tables)
+    connection.execute(text("DELETE FROM {}".format(RELATED_TABLE)))
+    connection.execute(text("DELETE FROM {}".format(VERSIONS_TABLE)))
+    if not keys:
+        return 0
+    vocabulary, vectors = tfidf(documents)
+    _write(connection, keys, titles, neighbours(vectors, range(len(keys)), k))
+    return len(keys)
+
+
+def update_related(connection, corpus, tables, kind, id, k):
+    """After a post is added, edited or deleted: its own related posts and those of the
+    posts whose list it joins or leaves, nothing else is written. Returns the changed
+    (kind, id) keys.
+
+    A post is affected when it lists the changed post now or when the changed post is more
+    similar to it than its last listed post."""
+
+    keys, titles, documents = corpus.load(connection, tables)
+    index = {key: row for row, key in enumerate(keys)}
+    listed = connection.execute(text(
+        "SELECT kind, post_id FROM {} WHERE related_kind = :kind AND related_id = :id".format(RELATED_TABLE)),
+        {"kind": kind, "id": id}).fetchall()
+    affected = {index[(row_kind, post_id)] for row_kind, post_id in listed if (row_kind, post_id) in index}
+
+    changed = index.get((kind, id))
+    if changed is None:  # deleted
+        connection.execute(text("DELETE FROM {} WHERE (kind = :kind AND post_id = :id) "
+                                "OR (related_kind = :kind AND related_id = :id)".format(RELATED_TABLE)),
+                           {"kind": kind, "id": id})
+        connection.execute(text("DELETE FROM {} WHERE kind = :kind AND post_id = :id".format(VERSIONS_TABLE)),
+                           {"kind": kind, "id": id})
+    if not keys:
+        return set()
+
+    vocabulary, vectors = tfidf(documents)
+    if changed is not None:
+        affected.add(changed)
+        # posts with fewer than k related or a lower last score than the changed post gives them
+        last_scores = dict(((row_kind, post_id), (count, score)) for row_kind, post_id, count, score in
+                           connection.execute(text("SELECT kind, post_id, count(*), min(score) FROM {} "
+                                                   "GROUP BY kind, post_id".format(RELATED_TABLE))))
+        own = neighbours(vectors, [changed], len(keys))[changed]
+        for score, other in own:
+            count, last_score = last_scores.get(keys[other], (0, 0.0))
+            if count < k or score > last_score:
+                affected.add(other)
+
+    result = neighbours(vectors, sorted(affected), k)
+    _write(connection, keys, titles, result)
+    return {keys[row] for row in result}
+
+
+def related_posts(connection, kind, id, limit):
+    rows = connection.execute(text(
+        "SELECT related_kind, related_id, title, score FROM {} WHERE kind = :kind AND post_id = :id "
+        "ORDER BY rank LIMIT :limit".format(RELATED_TABLE)), {"kind": kind, "id": id, "limit": limit})
+    return [Related(*row) for row in rows]
+
+
+def related_changed_at(connection, kind, id):
+    """When the related posts of a post were written last, None if never."""
+
+    value = connection.execute(text("SELECT changed_at FROM {} WHERE kind = :kind AND post_id = :id"
+                                    .format(VERSIONS_TABLE)), {"kind": kind, "id": id}).scalar()
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
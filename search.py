@@ -0,0 +1,151 @@
+import re
+from collections import namedtuple
+from html import escape, unescape
+
+from sqlalchemy import text
+
+
+# One FTS5 table indexes blogs, diaries and projects together. The rowid is built from
+# the post id and its kind, so a post can be updated/deleted without scanning the index.
+SEARCH_TABLE = "search_index"
+KIND_CODES = {"blog": 1, "diary": 2, "project": 3}
+KIND_NAMES = {code: kind for kind, code in KIND_CODES.items()}
+KIND_SLOTS = 4
+
+# bm25 weights of the indexed columns: a hit in title counts more than a hit in body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+MAX_QUERY_TERMS = 8
+
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_END = "\x03"
+
+SearchHit = namedtuple(
+    "SearchHit", "kind id title author publish_date title_html snippet_html score")
+
+SearchPage = namedtuple("SearchPage", "hits page has_next")
+
+_tag_re = re.compile(r"<[^>]*>")
+_space_re = re.compile(r"\s+")
+_term_re = re.compile(r"\w+", re.UNICODE)
+
+
+def html_to_text(html):
+    """Plain text of CKEditor html, used for indexing and snippets."""
+
+    return _space_re.sub(" ", unescape(_tag_re.sub(" ", html or ""))).strip()
+
+
+def search_rowid(kind, post_id):
+    return int(post_id) * KIND_SLOTS + KIND_CODES[kind]
+
+
+def create_search_index(connection):
+    """Creates the FTS5 table if it is missing. Returns True if it is created now."""
+
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": SEARCH_TABLE}).first()
+    if exists:
+        return False
+
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE {} USING fts5("
+        "title, body, kind UNINDEXED, post_id UNINDEXED, author UNINDEXED, publish_date UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')".format(SEARCH_TABLE)))
+    return True
+
+
+def index_post(connection, kind, post):
+    """Adds or replaces one post in the search index."""
+
+    connection.execute(text("INSERT OR REPLACE INTO {} "
+                            "(rowid, title, body, kind, post_id, author, publish_date) "
+                            "VALUES (:rowid, :title, :body, :kind, :post_id, :author, :publish_date)"
+                            .format(SEARCH_TABLE)),
+                       {"rowid": search_rowid(kind, post.id), "title": post.title,
+                        "body": html_to_text(getattr(post, "content_html", None) or post.content), "kind": kind, "post_id": post.id,
+                        "author": post.author, "publish_date": str(post.publish_date)})
+
+
+def remove_post(connection, kind, post_id):
+    connection.execute(text("DELETE FROM {} WHERE rowid = :rowid".format(SEARCH_TABLE)),
+                       {"rowid": search_rowid(kind, post_id)})
+
+
+def index_posts_after(connection, kind, table, after_id=0, until_id=None):
+    """Indexes posts of a table with after_id < id <= until_id in one INSERT ... SELECT, for
+    bulk imports. The html is turned into text by html_to_text as an SQL function.
+
+    Old databases being migrated have no content_html yet (migration 4 adds it), their
+    raw content is indexed and render-content indexes the rendered html later."""
+
+    dbapi_connection = connection.connection
+    dbapi_connection.create_function("html_to_text", 1, html_to_text, deterministic=True)
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info({})".format(table)))]
+    body = "coalesce(content_html, content)" if "content_html" in columns else "content"
+    connection.execute(text("INSERT OR REPLACE INTO {} "
+                            "(rowid, title, body, kind, post_id, author, publish_date) "
+                            "SELECT id * :slots + :code, title, html_to_text({}), :kind, id, author, "
+                            "publish_date FROM {} WHERE id > :after_id AND id <= :until_id"
+                            .format(SEARCH_TABLE, body, table)),
+                       {"slots": KIND_SLOTS, "code": KIND_CODES[kind], "kind": kind, "after_id": after_id,
+                        "until_id": until_id if until_id is not None else 2 ** 63 - 1})
+
+
+def rebuild_search_index(connection, tables):
+    """Fills the index again from content tables. `tables` is {kind: table name}."""
+
+    connection.execute(text("DELETE FROM {}".format(SEARCH_TABLE)))
+    for kind, table in tables.items():
+        index_posts_after(connection, kind, table)
+
+
+def fts_query(keyword):
+    """Turns user input into a safe FTS5 query, every word is a prefix term.
+
+    Returns None when there is nothing searchable in keyword."""
+
+    terms = _term_re.findall(keyword or "")[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return " ".join('"{}"*'.format(term) for term in terms)
+
+
+def _marked(value):
+    """Escapes FTS highlight output and turns the markers into <mark> tags."""
+
+    return escape(value or "").replace(_HIGHLIGHT_START, "<mark>").replace(_HIGHLIGHT_END, "</mark>")
+
+
+def search(connection, keyword, kinds=None, page=1, per_page=20):
+    """BM25 ranked search over titles and bodies.
+
+    Returns SearchPage, hits of it have highlighted title and body snippet html."""
+
+    query = fts_query(keyword)
+    if query is None:
+        return SearchPage([], page, False)
+
+    kind_filter = ""
+    params = {"query": query, "limit": per_page + 1, "offset": (page - 1) * per_page}
+    if kinds:
+        codes = [KIND_CODES[kind] for kind in kinds]
+        kind_filter = "AND (rowid % {}) IN ({})".format(KIND_SLOTS, ", ".join(str(code) for code in codes))
+
+    rows = connection.execute(text(
+        "SELECT kind, post_id, title, author, publish_date, "
+        "highlight({table}, 0, :start, :end) AS title_html, "
+        "snippet({table}, 1, :start, :end, '…', 24) AS snippet_html, "
+        "bm25({table}, {title_weight}, {body_weight}) AS score "
+        "FROM {table} WHERE {table} MATCH :query {kind_filter} "
+        "ORDER BY score LIMIT :limit OFFSET :offset".format(
+            table=SEARCH_TABLE, title_weight=TITLE_WEIGHT, body_weight=BODY_WEIGHT,
+            kind_filter=kind_filter)),
+        dict(params, start=_HIGHLIGHT_START, end=_HIGHLIGHT_END)).fetchall()
+
+    hits = [SearchHit(row.kind, row.post_id, row.title, row.author, row.publish_date,
+                      _marked(row.title_html), _marked(row.snippet_html), row.score)
+            for row in rows[:per_page]]
+    return SearchPage(hits, page, len(rows) > per_page)
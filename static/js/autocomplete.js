@@ -0,0 +1,100 @@
+// Title suggestions under search boxes with data-suggest, from /suggest as the user types.
+// Requests wait for a pause in typing and an older request is aborted by a newer one.
+(function () {
+    "use strict";
+
+    var DELAY = 150;
+    var MIN_LENGTH = 2;
+
+    function attach(input) {
+        var form = input.form;
+        var kindField = form.elements.kind;
+        var menu = document.createElement("div");
+        var timer = null;
+        var controller = null;
+        var active = -1;
+
+        menu.className = "dropdown-menu";
+        form.appendChild(menu);
+
+        function items() {
+            return menu.querySelectorAll(".dropdown-item");
+        }
+
+        function close() {
+            menu.classList.remove("show");
+            active = -1;
+        }
+
+        function show(suggestions) {
+            menu.textContent = "";
+            active = -1;
+            suggestions.forEach(function (suggestion) {
+                var link = document.createElement("a");
+                link.className = "dropdown-item";
+                link.href = suggestion.url;
+                link.textContent = suggestion.title;
+                menu.appendChild(link);
+            });
+            menu.classList.toggle("show", suggestions.length > 0);
+        }
+
+        function highlight(index) {
+            var links = items();
+            if (!links.length) {
+                return;
+            }
+            active = (index + links.length) % links.length;
+            Array.prototype.forEach.call(links, function (link, i) {
+                link.classList.toggle("active", i === active);
+            });
+        }
+
+        function fetchSuggestions() {
+            var query = input.value.trim();
+            if (controller) {
+                controller.abort();
+                controller = null;
+            }
+            if (query.length < MIN_LENGTH) {
+                close();
+                return;
+            }
+            var params = new URLSearchParams({q: query});
+            if (kindField && kindField.value) {
+                params.set("kind", kindField.value);
+            }
+            controller = window.AbortController ? new AbortController() : null;
+            fetch("/suggest?" + params.toString(), {signal: controller ? controller.signal : undefined})
+                .then(function (response) {
+                    return response.ok ? response.json() : [];
+                })
+                .then(show)
+                .catch(function () {});
+        }
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(fetchSuggestions, DELAY);
+        });
+
+        input.addEventListener("keydown", function (event) {
+            if (event.key === "ArrowDown" || event.key === "ArrowUp") {
+                event.preventDefault();
+                highlight(active + (event.key === "ArrowDown" ? 1 : -1));
+            } else if (event.key === "Enter" && active >= 0) {
+                event.preventDefault();
+                window.location.href = items()[active].href;
+            } else if (event.key === "Escape") {
+                close();
+            }
+        });
+
+        // a click on a suggestion lands before blur closes the menu
+        input.addEventListener("blur", function () {
+            setTimeout(close, 200);
+        });
+    }
+
+    Array.prototype.forEach.call(document.querySelectorAll("input[data-suggest]"), attach);
+})();
@@ -0,0 +1,11 @@
+// CKEditor on the content field of add/edit pages, loaded by the editor bundle.
+// allowedContent keeps classes like prettyprint/lang-*, content is sanitized when it is saved anyway.
+(function () {
+    "use strict";
+
+    if (window.CKEDITOR && document.getElementById("content")) {
+        CKEDITOR.replace("content", {
+            allowedContent: true
+        });
+    }
+})();
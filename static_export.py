@@ -0,0 +1,144 @@
+import importlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+MANIFEST_NAME = ".export-manifest.json"
+# resized images in srcsets of pages, /img/<width>/<format>/<file>?v=<hash of the source>;
+# they are written as files at their path, file servers don't look at the query
+_image_url_re = re.compile(r"(/img/\d+/\w+/[^\s\"'?,]+)\?v=(\w+)")
+IMAGE_PREFIX = "img:"  # manifest keys of images
+
+# Filled in each worker process by _init_worker
+_client = None
+
+
+def _init_worker(module_name):
+    """Worker process gets its own test client and its own database connections."""
+
+    global _client
+    module = importlib.import_module(module_name)
+    with module.app.app_context():
+        module.db.engine.dispose()  # connections copied from the parent process can't be shared
+    _client = module.app.test_client()
+
+
+def _render_page(path):
+    response = _client.get(path)
+    return path, response.status_code, response.get_data()
+
+
+def _get(app, path):
+    response = app.test_client().get(path)
+    return path, response.status_code, response.get_data()
+
+
+def page_file(out_dir, path):
+    """/ -> index.html, /blog/5 -> blog/5/index.html, so any file server can serve them."""
+
+    return os.path.join(out_dir, path.strip("/"), "index.html")
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def copy_static(static_dir, out_dir):
+    """Copies static files whose size or modification time changed. Returns copied count."""
+
+    copied = 0
+    for root, dirs, files in os.walk(static_dir):
+        target_root = os.path.join(out_dir, "static", os.path.relpath(root, static_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            source_stat = os.stat(source)
+            if os.path.exists(target):
+                target_stat = os.stat(target)
+                if (target_stat.st_size == source_stat.st_size
+                        and target_stat.st_mtime >= source_stat.st_mtime):
+                    continue
+            shutil.copy2(source, target)
+            copied += 1
+    return copied
+
+
+def export_site(pages, out_dir, static_dir, module_name="blog", workers=None, full=False, log=print):
+    """Writes public pages as static html into out_dir.
+
+    `pages` is {path: version}, version is any string which changes when the page
+    changes (e.g. last_modified of the post). Only the pages with a new version are
+    rendered, in a process pool. Pages which are not in `pages` anymore are deleted.
+    Resized images which rendered pages link to are written too.
+    Returns (rendered, deleted, failed) path lists."""
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if full else load_manifest(out_dir)
+    changed = sorted(path for path, version in pages.items() if manifest.get(path) != version)
+
+    rendered, failed, images = [], [], {}
+    if changed:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(module_name,)) as pool:
+            for path, status, body in pool.map(_render_page, changed, chunksize=16):
+                if status != 200:
+                    failed.append(path)
+                    log("{} returned {}, not exported".format(path, status))
+                    continue
+                target = page_file(out_dir, path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as f:
+                    f.write(body)
+                manifest[path] = pages[path]
+                rendered.append(path)
+                images.update(_image_url_re.findall(body.decode("utf-8", "replace")))
+
+    # in this process: the app makes resized images in its own process pool, which
+    # would keep a render worker from exiting
+    wanted = sorted(path for path, digest in images.items()
+                    if manifest.get(IMAGE_PREFIX + path) != digest
+                    or not os.path.exists(os.path.join(out_dir, path.strip("/"))))
+    if wanted:
+        app = importlib.import_module(module_name).app
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, status, body in pool.map(lambda path: _get(app, path), wanted):
+                if status != 200:
+                    log("{} returned {}, not exported".format(path, status))
+                    continue
+                target = os.path.join(out_dir, path.strip("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as f:
+                    f.write(body)
+                manifest[IMAGE_PREFIX + path] = images[path]
+
+    deleted = []
+    for path in sorted(set(manifest) - set(pages)):
+        if path.startswith(IMAGE_PREFIX):
+            continue  # other pages may still show it
+        try:
+            os.remove(page_file(out_dir, path))
+        except OSError:
+            pass
+        del manifest[path]
+        deleted.append(path)
+
+    copied = copy_static(static_dir, out_dir)
+    save_manifest(out_dir, manifest)
+    log("{} page(s) rendered, {} deleted, {} failed, {} static file(s) copied".format(
+        len(rendered), len(deleted), len(failed), copied))
+    return rendered, deleted, failed
@@ -0,0 +1,121 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+
+Suggestion = namedtuple("Suggestion", "kind id title")
+
+# dotless/dotted i of Turkish titles match both ways
+_folds = str.maketrans({"ı": "i", "İ": "i"})
+
+
+def normalize(value):
+    """Lower case without accents and with single spaces, "Çözüm  İçin" -> "cozum icin"."""
+
+    value = unicodedata.normalize("NFKD", (value or "").translate(_folds).casefold())
+    return " ".join("".join(c for c in value if not unicodedata.combining(c)).split())
+
+
+def title_keys(title):
+    """The normalized title from every word on, so a query matches the start of any word."""
+
+    words = normalize(title).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class TitleIndex:
+    """Titles of all posts in memory as sorted lists of (key, word position, kind, id), one for
+    whole titles and one for the titles from their second word on; a query is a bisect and a
+    walk over the keys starting with it in each, whole titles first; no SQLite on reads.
+
+    `load()` returns (kind, id, title) of every post, it is called by reload() and by
+    search() in a background thread when the index is older than `max_age` seconds,
+    that is how changes made by other processes arrive. Changes of this process are
+    applied at once with put() and remove()."""
+
+    def __init__(self, load, max_age=300, max_scan=500):
+        self.load = load
+        self.max_age = max_age
+        self.max_scan = max_scan  # keys looked at per list and query, at most
+        self.loaded_at = None
+        self._starts, self._words = [], []
+        self._titles = {}  # (kind, id) -> title
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+
+    def reload(self):
+        starts, words, titles = [], [], {}
+        for kind, id, title in self.load():
+            titles[(kind, id)] = title
+            for position, key in enumerate(title_keys(title)):
+                (words if position else starts).append((key, position, kind, id))
+        starts.sort()
+        words.sort()
+        with self._lock:
+            self._starts, self._words, self._titles = starts, words, titles
+            self.loaded_at = time.monotonic()
+        return len(titles)
+
+    def _reload_in_background(self):
+        if self._reloading.acquire(blocking=False):
+            def run():
+                try:
+                    self.reload()
+                finally:
+                    self._reloading.release()
+            threading.Thread(target=run, name="title-index", daemon=True).start()
+
+    def put(self, kind, id, title):
+        with self._lock:
+            self._remove(kind, id)
+            self._titles[(kind, id)] = title
+            for position, key in enumerate(title_keys(title)):
+                insort(self._words if position else self._starts, (key, position, kind, id))
+
+    def remove(self, kind, id):
+        with self._lock:
+            self._remove(kind, id)
+
+    def _remove(self, kind, id):
+        title = self._titles.pop((kind, id), None)
+        if title is None:
+            return
+        for position, key in enumerate(title_keys(title)):
+            entries = self._words if position else self._starts
+            i = bisect_left(entries, (key, position, kind, id))
+            if i < len(entries) and entries[i] == (key, position, kind, id):
+                del entries[i]
+
+    def search(self, query, kinds=None, limit=8):
+        """Posts whose title or a word of it starts with query. Titles starting with it come
+        first, then by the position of the word, shorter titles and newer posts first."""
+
+        if self.loaded_at is None:
+            self.reload()
+        elif time.monotonic() - self.loaded_at > self.max_age:
+            self._reload_in_background()
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = {}
+        with self._lock:
+            for entries in (self._starts, self._words):
+                if len(found) >= limit:
+                    break  # word matches rank after all of these
+                i = bisect_left(entries, (prefix,))
+                end = min(len(entries), i + self.max_scan)
+                while i < end and entries[i][0].startswith(prefix):
+                    key, position, kind, id = entries[i]
+                    if kinds is None or kind in kinds:
+                        title = self._titles[(kind, id)]
+                        rank = (position, len(title), -id)
+                        if found.get((kind, id), (rank,))[0] >= rank:
+                            found[(kind, id)] = (rank, title)
+                    i += 1
+        best = sorted(found.items(), key=lambda item: item[1][0])[:limit]
+        return [Suggestion(kind, id, title) for (kind, id), (rank, title) in best]
+
+    def __len__(self):
+        return len(self._titles)
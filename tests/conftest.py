@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# blog.py reads its settings when it is imported, the tests get their own files
+_tmp = tempfile.mkdtemp(prefix="ozy-blog-tests-")
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + os.path.join(_tmp, "import.db"),
+    "JOB_QUEUE_DATABASE": os.path.join(_tmp, "jobs.db"),
+    "JOB_WORKERS": "0",
+    "IMAGE_CACHE_DIR": os.path.join(_tmp, "images"),
+    "PASSWORD_HASH_ROUNDS": "1000",
+    "PASSWORD_HASH_WORKERS": "1",
+    "VIEW_FLUSH_SECONDS": "3600",
+})
+
+import blog as blog_module  # noqa: E402
+
+
+@pytest.fixture
+def blog(tmp_path):
+    """blog module on a new migrated database, with empty caches and job queue."""
+
+    app = blog_module.app
+    app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI="sqlite:///" + str(tmp_path / "blog.db"),
+                      SITE_URL=None, METRICS_TOKEN=None, STREAM_LISTINGS=False)
+    with app.app_context():
+        blog_module.db.create_all()
+        blog_module.migrate_database()
+        blog_module.page_cache.clear()
+        blog_module.related_corpus._terms.clear()
+        blog_module.title_index.loaded_at = None
+        blog_module.view_counter.popular = None
+        blog_module.view_counter._counts.clear()
+        blog_module.job_queue._connect().execute("DELETE FROM jobs")
+        blog_module.rate_limit_storage.__init__()
+        yield blog_module
+        blog_module.db.session.remove()
+        blog_module.db.get_engine().dispose()
+
+
+@pytest.fixture
+def client(blog):
+    return blog.app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    def login(username="ozy"):
+        with client.session_transaction() as session:
+            session["logged_in"] = True
+            session["username"] = username
+    return login
+
+
+@pytest.fixture
+def add_post(blog):
+    """add_post("blog", title=..., content=..., minutes=...) -> post, committed. Posts are
+    one minute apart by default, newer with every call."""
+
+    count = [0]
+
+    def add_post(kind="blog", title=None, content="<p>text</p>", author="ozy", publish_date=None, **fields):
+        count[0] += 1
+        post = blog.POST_MODELS[kind](
+            title=title or "{} {}".format(kind, count[0]), content=content, author=author,
+            publish_date=publish_date or datetime(2020, 1, 1) + timedelta(minutes=count[0]), **fields)
+        blog.db.session.add(post)
+        blog.db.session.commit()
+        return post
+    return add_post
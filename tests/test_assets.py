@@ -0,0 +1,68 @@
+import gzip
+import os
+import shutil
+
+from werkzeug.datastructures import Accept
+
+import assets
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_build_fingerprints_and_compresses(tmp_path):
+    static = str(tmp_path)
+    write(os.path.join(static, "css", "site.css"), b".used{color:red}")
+    write(os.path.join(static, "img", "logo.png"), b"png")
+
+    manifest = assets.build_assets(static, log=lambda message: None)
+    css = manifest.get("css/site.css")
+    assert css == "dist/css/site.{}.css".format(assets.fingerprint(b".used{color:red}"))
+    with gzip.open(os.path.join(static, css + ".gz")) as f:
+        assert f.read() == b".used{color:red}"
+    assert not os.path.exists(os.path.join(static, manifest.get("img/logo.png") + ".gz"))
+    assert assets.AssetManifest.load(static).files == manifest.files
+
+    # a new version replaces the old file, the manifest version changes with it
+    write(os.path.join(static, "css", "site.css"), b".used{color:blue}")
+    rebuilt = assets.build_assets(static, log=lambda message: None)
+    assert not os.path.exists(os.path.join(static, css))
+    assert not os.path.exists(os.path.join(static, css + ".gz"))
+    assert rebuilt.version != manifest.version
+
+
+def test_negotiate_prefers_the_accepted_variant(tmp_path):
+    path = str(tmp_path / "a.css")
+    write(path + ".gz", b"")
+    assert assets.negotiate(Accept([("gzip", 1)]), path) == ("gzip", path + ".gz")
+    assert assets.negotiate(Accept([("br", 1)]), path) == (None, path)
+
+
+def test_purge_css_keeps_used_rules():
+    css = "/*! license */ .used{a:b} .unused{c:d} @media (x){.unused{e:f} .used p{g:h}} .collapse{i:j}"
+    purged = assets.purge_css(css, {"used"})
+    assert ".used{a:b}" in purged and "/*! license */" in purged
+    assert ".unused" not in purged
+    assert "@media (x){.used p{g:h}}" in purged
+    assert ".collapse" in purged
+
+
+def test_fingerprinted_files_are_cached_forever(blog, client, tmp_path, monkeypatch):
+    static = str(tmp_path / "static")
+    shutil.copytree(blog.app.static_folder, static, ignore=shutil.ignore_patterns(assets.DIST_DIR))
+    monkeypatch.setattr(blog.app, "static_folder", static)
+    monkeypatch.setattr(blog, "asset_manifest", assets.build_assets(static, log=lambda message: None))
+
+    with blog.app.test_request_context():
+        url = blog.url_for("static", filename="css/styles.css")
+    assert "/static/dist/css/styles." in url
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert "immutable" not in client.get("/static/css/styles.css").headers.get("Cache-Control", "")
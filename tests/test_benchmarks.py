@@ -0,0 +1,65 @@
+from sqlalchemy import text
+
+from benchmarks import workload
+from benchmarks.corpus import BENCH_PASSWORD, BENCH_USER, corpus_info, seed_corpus
+
+COUNTS = {"blog": 30, "diary": 10, "project": 5}
+
+
+def scalar(blog, sql):
+    return blog.db.session.execute(text(sql)).scalar()
+
+
+def test_seed_corpus_fills_what_saved_posts_have(blog):
+    seed_corpus(blog, users=2, counts=COUNTS, log=lambda message: None)
+    assert scalar(blog, "SELECT count(*) FROM blogs") == 30
+    assert scalar(blog, "SELECT count(*) FROM blogs WHERE content_html IS NULL OR excerpt IS NULL "
+                        "OR reading_time IS NULL") == 0
+    assert scalar(blog, "SELECT count(*) FROM feed_entries") == sum(COUNTS.values())
+    assert scalar(blog, "SELECT count(*) FROM related_posts") > 0
+    assert scalar(blog, "SELECT count(*) FROM content_versions") == 3
+    assert len(blog.title_index) == sum(COUNTS.values())
+    assert blog.fts.search(blog.db.session, "python").hits
+
+
+def test_seed_is_repeatable(blog):
+    seed_corpus(blog, users=1, counts={"blog": 5}, seed=7, log=lambda message: None)
+    first = [row[0] for row in blog.db.session.execute(text("SELECT title FROM blogs ORDER BY id"))]
+    blog.db.session.execute(text("DELETE FROM blogs"))
+    blog.db.session.commit()
+    seed_corpus(blog, users=0, counts={"blog": 5}, seed=7, log=lambda message: None)
+    assert [row[0] for row in blog.db.session.execute(text("SELECT title FROM blogs ORDER BY id"))] == first
+
+
+def test_every_scenario_runs_on_the_corpus(blog, client, tmp_path):
+    seed_corpus(blog, users=2, counts=COUNTS, log=lambda message: None)
+    info = corpus_info(blog)
+    work = workload.Workload(info, str(tmp_path / "blog.db"))
+    response = client.post("/login", data={"useremail": "{}@benchmark.example.com".format(BENCH_USER),
+                                           "userpassword": BENCH_PASSWORD})
+    assert response.status_code == 302
+    for name in workload.SCENARIOS:
+        request = work.request(name)
+        if request is None:
+            continue
+        method, path, form = request
+        response = client.open(path, method=method, data=form)
+        assert response.status_code < 400, name
+
+
+def test_compare_finds_regressions():
+    baseline = {"routes": {"blog": {"p95_ms": 10, "throughput": 100, "queries_per_request": 2, "errors": 0}}}
+    assert workload.compare({"routes": {"blog": {"p95_ms": 11, "throughput": 95, "queries_per_request": 2}}},
+                            baseline) == []
+    regressions = workload.compare(
+        {"routes": {"blog": {"p95_ms": 20, "throughput": 50, "queries_per_request": 3, "errors": 1}}}, baseline)
+    assert len(regressions) == 4
+    assert workload.compare({"routes": {}}, baseline) == []
+
+
+def test_summarize():
+    summary = workload.summarize([0.001 * i for i in range(1, 101)], 2.0, queries=300)
+    assert summary["requests"] == 100
+    assert summary["p50_ms"] == 51.0
+    assert summary["throughput"] == 50.0
+    assert summary["queries_per_request"] == 3.0
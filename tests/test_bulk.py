@@ -0,0 +1,84 @@
+import io
+import json
+
+import bulk
+
+
+def run(blog, command, *args):
+    result = blog.app.test_cli_runner().invoke(command, list(args))
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def titles(blog, kind):
+    return [post.title for post in blog.POST_MODELS[kind].query.order_by("id")]
+
+
+def test_export_and_import_round_trip(blog, add_post, tmp_path):
+    blog.db.session.add(blog.Users(fullname="Ozy", username="ozy", email="ozy@example.com", password="hash"))
+    add_post("blog", title="First", content="<p>one</p>")
+    add_post("diary", title="Second", content="<p>two</p>", publish_date=None)
+    path = str(tmp_path / "export.jsonl")
+    run(blog, blog.export_data_command, path)
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record["kind"] for record in records] == ["blog", "diary", "user"]
+    assert "password" not in records[-1]
+
+    for model in blog.POST_MODELS.values():
+        model.query.delete()
+    blog.db.session.commit()
+    result = run(blog, blog.import_posts_command, path)
+    assert "skipped 1" in result.output  # the user
+    blog.db.session.expire_all()
+    assert titles(blog, "blog") == ["First"] and titles(blog, "diary") == ["Second"]
+    post = blog.Blogs.query.one()
+    assert post.publish_date.isoformat() == records[0]["publish_date"]
+    assert post.content_html == "<p>one</p>" and post.excerpt == "one"
+    assert blog.fts.search(blog.db.session, "two").hits
+    assert blog.db.session.execute("SELECT count(*) FROM feed_entries").scalar() == 2
+
+
+def test_markdown_files_and_bad_records(blog, tmp_path):
+    posts = tmp_path / "posts"
+    posts.mkdir()
+    (posts / "with-front-matter.md").write_text("---\ntitle: From front matter\nkind: project\n---\n# Heading\n\ntext\n")
+    (posts / "with_heading.md").write_text("# From heading\n\ntext\n")
+    (tmp_path / "records.jsonl").write_text(
+        '{"title": "Good", "content": "<p>x</p>"}\n'
+        'not json\n'
+        '{"title": "", "content": "<p>x</p>"}\n'
+        '{"title": "Kind", "content": "x", "kind": "poem"}\n'
+        '{"title": "Date", "content": "x", "publish_date": "yesterday"}\n')
+
+    result = run(blog, blog.import_posts_command, "--author", "ozy", "--batch-size", "1",
+                 str(posts), str(tmp_path / "records.jsonl"))
+    assert "skipped 4" in result.output
+    assert "records.jsonl:2: skipped, invalid JSON" in result.output
+    assert titles(blog, "project") == ["From front matter"]
+    assert set(titles(blog, "blog")) == {"From heading", "Good"}
+    assert blog.Blogs.query.filter_by(title="From heading").one().content_html == "<p>text</p>"
+
+
+def test_import_needs_an_author(blog):
+    counts, skipped = bulk.import_posts(blog.db.session.connection(), [("a", {"title": "T", "content": "x"})],
+                                        {"blog": blog.Blogs.__table__}, log=lambda message: None)
+    assert counts == {"blog": 0} and skipped == 1
+
+
+def test_export_is_json_lines_in_id_order(blog, add_post):
+    for title in ("a", "b", "c"):
+        add_post(title=title)
+    out = io.StringIO()
+    counts = bulk.export_jsonl(blog.db.session.connection(), out, {"blog": blog.Blogs.__table__},
+                               blog.Users.__table__, batch_size=2)
+    assert counts == {"blog": 3, "user": 0}
+    assert [json.loads(line)["title"] for line in out.getvalue().splitlines()] == ["a", "b", "c"]
+
+
+def test_import_enqueues_one_related_rebuild(blog, tmp_path):
+    (tmp_path / "records.jsonl").write_text('{"title": "A blog", "content": "x"}\n'
+                                            '{"title": "A diary", "content": "x", "kind": "diary"}\n')
+    run(blog, blog.import_posts_command, "--author", "ozy", str(tmp_path / "records.jsonl"))
+    assert blog.job_queue.claim().kind == "rebuild_related"
+    assert blog.job_queue.claim() is None
@@ -0,0 +1,106 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import bundles
+
+
+def write(static, filename, text):
+    path = os.path.join(static, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def static_url(filename):
+    return "/static/" + filename
+
+
+def test_missing_vendor_files_come_from_the_cdn_with_integrity(tmp_path):
+    tags = bundles.Bundles(str(tmp_path)).tags("base", "js", static_url)
+    url, integrity = bundles.VENDOR_FILES["vendor/jquery/jquery.slim.min.js"]
+    assert '<script defer src="{}" integrity="{}" crossorigin="anonymous">'.format(url, integrity) in tags
+
+
+def test_built_bundle_replaces_its_files(tmp_path):
+    static = str(tmp_path)
+    for source in bundles.BUNDLES["editor"]["js"]:
+        write(static, source, "// comment\n    var x = 1;\n")
+    built = bundles.build_bundles(static, log=lambda message: None)
+    assert built == ["bundles/editor.js"]  # the others miss vendor files
+    with open(os.path.join(static, "bundles", "editor.js")) as f:
+        text = f.read()
+    assert text.startswith('window.CKEDITOR_BASEPATH = "/static/vendor/ckeditor/";\n')
+    assert "// comment\n    var x = 1;" in text  # vendored files are not minified
+    assert text.endswith(";\nvar x = 1;\n")
+    assert bundles.Bundles(static).tags("editor", "js", static_url) == \
+        '<script defer src="/static/bundles/editor.js"></script>'
+
+
+def test_minify_css_keeps_descendant_pseudo_classes():
+    assert bundles.minify_css("/* x */ a :hover {\n  color: red;\n}\n/*! keep */") == "a :hover{color: red}/*! keep */"
+
+
+@pytest.fixture
+def archive(monkeypatch):
+    """A fake CKEditor release, served to download() instead of the network."""
+
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as f:
+        f.writestr("ckeditor/ckeditor.js", "var CKEDITOR;")
+        f.writestr("ckeditor/lang/en.js", "")
+        f.writestr("ckeditor/../../escape.js", "")
+        f.writestr("other/readme.txt", "")
+    data = data.getvalue()
+    downloads = []
+
+    def urlopen(url, timeout=None):
+        downloads.append(url)
+        return io.BytesIO(data)
+    monkeypatch.setattr(bundles, "VENDOR_FILES", {})
+    monkeypatch.setattr(bundles.urllib.request, "urlopen", urlopen)
+    return data, downloads
+
+
+def test_unpinned_archive_is_skipped(archive, tmp_path):
+    data, downloads = archive
+    logged = []
+    bundles.vendor_assets(str(tmp_path), log=logged.append)
+    assert downloads == []
+    assert not os.path.exists(tmp_path / "vendor" / "ckeditor")
+    assert logged[0].startswith("Warning: vendor/ckeditor is skipped")
+
+
+def test_vendor_assets_command_without_integrity_succeeds(blog, archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(blog.app, "static_folder", str(tmp_path))
+    result = blog.app.test_cli_runner().invoke(blog.vendor_assets_command)
+    assert result.exit_code == 0, result.output
+    assert "--ckeditor-integrity" in result.output
+
+
+def test_archive_is_unpacked_when_it_matches(archive, tmp_path):
+    data, downloads = archive
+    integrity = {"vendor/ckeditor": bundles.integrity_of(data)}
+    bundles.vendor_assets(str(tmp_path), archive_integrity=integrity, log=lambda message: None)
+    assert sorted(os.listdir(tmp_path / "vendor" / "ckeditor")) == ["ckeditor.js", "lang"]
+    assert not (tmp_path / "escape.js").exists()
+
+    with pytest.raises(bundles.IntegrityError):
+        bundles.vendor_assets(str(tmp_path / "other"), archive_integrity={"vendor/ckeditor": "sha384-wrong"},
+                              log=lambda message: None)
+
+
+def test_print_integrity_unpacks_nothing(archive, tmp_path):
+    data, downloads = archive
+    printed = []
+    bundles.vendor_assets(str(tmp_path), print_integrity=True, log=printed.append)
+    assert printed[0].endswith(bundles.integrity_of(data))
+    assert not os.path.exists(tmp_path / "vendor")
+
+
+def test_editor_scripts_are_only_on_editor_pages(client, login):
+    assert "ckeditor" not in client.get("/about").get_data(as_text=True)
+    login()
+    assert "ckeditor" in client.get("/addblog").get_data(as_text=True)
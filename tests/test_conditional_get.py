@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+
+def test_post_page_answers_304_to_its_etag(client, add_post):
+    post = add_post()
+    first = client.get("/blog/{}".format(post.id))
+    assert first.headers["ETag"]
+    assert first.last_modified is not None
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    again = client.get("/blog/{}".format(post.id), headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.data == b""
+    since = client.get("/blog/{}".format(post.id), headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert since.status_code == 304
+
+
+def test_changed_post_answers_200(blog, client, add_post):
+    post = add_post()
+    etag = client.get("/blog/{}".format(post.id)).headers["ETag"]
+    post.title = "Changed"
+    post.last_modified += timedelta(seconds=5)
+    blog.db.session.commit()
+    blog.post_changed("blog", post.id)
+    response = client.get("/blog/{}".format(post.id), headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"Changed" in response.data
+    assert response.headers["ETag"] != etag
+
+
+def test_listing_etag_changes_when_a_post_is_added(blog, client, add_post):
+    add_post()
+    etag = client.get("/blogs").headers["ETag"]
+    assert client.get("/blogs", headers={"If-None-Match": etag}).status_code == 304
+    blog.post_changed("blog", add_post(title="New one").id)
+    assert client.get("/blogs", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_logged_in_users_get_another_etag(client, login, add_post):
+    post = add_post()
+    etag = client.get("/blog/{}".format(post.id)).headers["ETag"]
+    login()
+    response = client.get("/blog/{}".format(post.id), headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_missing_post_has_no_validators(client):
+    assert "ETag" not in client.get("/blog/12345").headers
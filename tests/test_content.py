@@ -0,0 +1,58 @@
+from sqlalchemy import text
+
+from content import excerpt_of, render_content, sanitize_html
+
+
+def test_sanitizer_drops_scripts_and_unsafe_urls():
+    html = ('<p onclick="x()">Hi <script>alert(1)</script><a href="javascript:alert(1)">link</a>'
+            '<a href="https://example.com" target="_blank">out</a><img src=" jav&#x09;ascript:x" alt="a">')
+    assert sanitize_html(html) == ('<p>Hi <a>link</a><a href="https://example.com" target="_blank" '
+                                   'rel="noopener noreferrer">out</a><img alt="a"></p>')
+
+
+def test_sanitizer_closes_tags_and_escapes_text():
+    assert sanitize_html("<ul><li>a<li>b &lt;c&gt;<custom>d</custom>") == \
+        "<ul><li>a<li>b &lt;c&gt;d</li></li></ul>"
+
+
+def test_excerpt_cuts_at_a_word():
+    assert excerpt_of("short") == "short"
+    assert excerpt_of("one two three, four", length=14) == "one two three…"
+
+
+def test_rendered_content():
+    rendered = render_content("<h1>Title</h1><p>{}</p>".format("word " * 399))
+    assert rendered.word_count == 400
+    assert rendered.reading_time == 2
+    assert rendered.excerpt.startswith("Title word word") and rendered.excerpt.endswith("…")
+    assert render_content("<p></p>").reading_time == 1
+
+
+def test_markdown_posts_are_rendered(blog, add_post):
+    post = add_post(content="# Heading\n\nSome *text* & more\n", content_format="markdown")
+    assert "<h1>Heading</h1>" in post.content_html
+    assert "&amp; more" in post.content_html
+    assert post.excerpt.startswith("Heading Some")
+
+
+def test_posts_are_rendered_when_they_are_saved(blog, add_post):
+    post = add_post(content="<p>first <script>x</script></p>")
+    assert post.content_html == "<p>first </p>"
+    assert post.word_count == 1
+    post.content = "<p>second version</p>"
+    blog.db.session.commit()
+    assert post.content_html == "<p>second version</p>"
+    assert post.excerpt == "second version"
+
+
+def test_render_content_fills_posts_without_html(blog, add_post):
+    id = add_post(content="<p>older post body</p>").id
+    blog.db.session.execute(text("UPDATE blogs SET content_html = NULL, excerpt = NULL WHERE id = :id"),
+                            {"id": id})
+    blog.db.session.commit()
+    result = blog.app.test_cli_runner().invoke(blog.render_content_command)
+    assert result.exit_code == 0, result.output
+    assert "1 blog posts rendered" in result.output
+    post = blog.Blogs.query.get(id)
+    assert post.content_html == "<p>older post body</p>" and post.excerpt == "older post body"
+    assert blog.fts.search(blog.db.session, "older").hits
@@ -0,0 +1,84 @@
+from counters import ViewCounter
+
+
+def test_failed_flush_keeps_the_counts():
+    written, fail = [], [True]
+
+    def flush(counts):
+        if fail[0]:
+            raise OSError("database is locked")
+        written.append(counts)
+    counter = ViewCounter(flush, lambda: [], interval=3600)
+    counter._counts = {("blog", 1): 2}
+    assert counter.flush() == 0
+    counter._counts[("blog", 1)] += 1
+    fail[0] = False
+    assert counter.flush() == 1
+    assert written == [{("blog", 1): 3}]
+    assert counter.pending() == {}
+
+
+def test_unwritable_counts_are_dropped():
+    def flush(counts):
+        raise OverflowError("Python int too large to convert to SQLite INTEGER")
+    counter = ViewCounter(flush, lambda: [], interval=3600)
+    counter._counts = {("blog", 10 ** 23): 1}
+    assert counter.flush() == 0
+    assert counter.pending() == {}
+
+
+def test_missing_posts_are_not_counted(blog, client, add_post):
+    post = add_post()
+    client.get("/blog/99999999999999999999999")
+    client.get("/blog/{}".format(post.id + 1))
+    client.get("/blog/{}".format(post.id))
+    assert blog.view_counter.pending() == {("blog", post.id): 1}
+    assert blog.view_counter.flush() == 1
+    assert blog.Blogs.query.get(post.id).views == 1
+
+
+def test_views_are_counted_in_memory_then_written(blog, client, add_post):
+    post = add_post()
+    last_modified = post.last_modified
+    path = "/blog/{}".format(post.id)
+    etag = client.get(path).headers["ETag"]
+    client.get(path)  # from the page cache
+    client.get(path, headers={"If-None-Match": etag})
+    client.get("/blogs")
+    assert blog.view_counter.pending() == {("blog", post.id): 3}
+    assert blog.Blogs.query.get(post.id).views == 0
+
+    assert blog.view_counter.flush() == 1
+    blog.db.session.expire_all()
+    post = blog.Blogs.query.get(post.id)
+    assert post.views == 3
+    assert post.last_modified == last_modified  # views don't change the page
+
+
+def test_most_read_posts_on_the_index(blog, client, add_post):
+    posts = [add_post(title="Post {}".format(i)) for i in range(3)]
+    diary = add_post("diary", title="Read diary")
+    for post, views in ((posts[0], 1), (posts[2], 5), (diary, 3)):
+        for i in range(views):
+            client.get("/{}/{}".format("diary" if post is diary else "blog", post.id))
+    blog.view_counter.flush()
+    assert [(post.kind, post.id, post.views) for post in blog.popular_posts()] == [
+        ("blog", posts[2].id, 5), ("diary", diary.id, 3), ("blog", posts[0].id, 1)]
+    html = client.get("/").get_data(as_text=True)
+    most_read = html[html.index("Most Read"):]
+    assert most_read.index("Post 2") < most_read.index("Read diary") < most_read.index("Post 0")
+
+
+def test_popular_posts_follow_renames_and_deletes(blog, client, add_post):
+    id = add_post(title="Before").id
+    client.get("/blog/{}".format(id))
+    blog.view_counter.flush()  # in its own app context, the session of the test is a new one then
+    post = blog.Blogs.query.get(id)
+    post.title = "After"
+    blog.db.session.commit()
+    blog.view_counter.flush()
+    assert [popular.title for popular in blog.popular_posts()] == ["After"]
+    blog.db.session.delete(blog.Blogs.query.get(id))
+    blog.db.session.commit()
+    blog.view_counter.flush()
+    assert blog.popular_posts() == []
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from pagination import (CURSOR_DATE_FORMAT, LazyRows, decode_feed_cursor, encode_feed_cursor, feed_paginate,
+                        feed_query)
+
+
+def walk(blog, per_page, where=None):
+    keys, after = [], None
+    while True:
+        page = feed_paginate(blog.db.session, blog.POST_MODELS, blog.LIST_COLUMNS, where=where, after=after,
+                             per_page=per_page)
+        keys.extend((row.kind, row.id) for row in page.items)
+        if page.next_cursor is None:
+            return keys
+        after = page.next_cursor
+
+
+def test_feed_cursor_round_trip(blog, add_post):
+    post = add_post("diary")
+    row = blog.db.session.execute(feed_query(blog.POST_MODELS, blog.LIST_COLUMNS, limit=1)).first()
+    assert decode_feed_cursor(encode_feed_cursor(row)) == (post.publish_date, post.id, "diary")
+    assert decode_feed_cursor("broken") is None
+
+
+def test_feed_walks_every_post_of_every_kind_once(blog, add_post):
+    kinds = ["blog", "diary", "project", "blog", "diary"]
+    posts = [(kind, add_post(kind)) for kind in kinds]
+    # same date and id in different tables
+    posts += [(kind, add_post(kind, publish_date=datetime(2021, 5, 5))) for kind in ("blog", "diary", "project")]
+    expected = [(kind, id) for date, id, kind in
+                sorted(((post.publish_date, post.id, kind) for kind, post in posts), reverse=True)]
+    for per_page in (1, 2, 3, 20):
+        assert walk(blog, per_page) == expected
+
+
+def test_before_cursor_goes_back_to_the_same_page(blog, add_post):
+    for kind in ("blog", "diary", "project") * 3:
+        add_post(kind)
+    first = feed_paginate(blog.db.session, blog.POST_MODELS, blog.LIST_COLUMNS, per_page=4)
+    second = feed_paginate(blog.db.session, blog.POST_MODELS, blog.LIST_COLUMNS, after=first.next_cursor,
+                           per_page=4)
+    back = feed_paginate(blog.db.session, blog.POST_MODELS, blog.LIST_COLUMNS, before=second.prev_cursor,
+                         per_page=4)
+    assert [(row.kind, row.id) for row in back.items] == [(row.kind, row.id) for row in first.items]
+    assert back.prev_cursor is None
+
+
+def test_feed_of_an_author(blog, add_post):
+    mine = [add_post("blog"), add_post("project")]
+    add_post("diary", author="someone")
+    keys = walk(blog, 1, where=lambda model: model.author == "ozy")
+    assert keys == [("project", mine[1].id), ("blog", mine[0].id)]
+
+
+def test_index_shows_the_latest_posts_of_every_kind(client, add_post):
+    add_post("blog", title="A blog")
+    add_post("diary", title="A diary")
+    add_post("project", title="A project")
+    html = client.get("/?per_page=2").get_data(as_text=True)
+    assert "A project" in html and "A diary" in html and "A blog" not in html
+    assert "Error&amp;Bug Diary" in html
+    assert "after=" in html
+
+
+def test_streamed_feed_reads_rows_lazily(blog, add_post):
+    for kind in ("blog", "diary", "project"):
+        add_post(kind)
+    page = feed_paginate(blog.db.session, blog.POST_MODELS, blog.LIST_COLUMNS, per_page=2, stream=True)
+    assert isinstance(page.items, LazyRows)
+    assert page.items and page.next_cursor is None  # known after the rows are read
+    assert [row.kind for row in page.items] == ["project", "diary"]
+    rest = feed_paginate(blog.db.session, blog.POST_MODELS, blog.LIST_COLUMNS, after=page.next_cursor, per_page=2)
+    assert [row.kind for row in rest.items] == ["blog"]
+
+
+def test_streamed_dashboard_links_to_the_next_page(client, login, add_post):
+    posts = [add_post(kind) for kind in ("blog", "diary", "project")]
+    login()
+    response = client.get("/dashboard?per_page=2")
+    assert response.is_streamed
+    html = response.get_data(as_text=True)
+    assert "after={}-{}-diary".format(posts[1].publish_date.strftime(CURSOR_DATE_FORMAT), posts[1].id) in html
@@ -0,0 +1,72 @@
+from xml.etree import ElementTree
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+SITEMAP = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def parse(response):
+    assert response.status_code == 200, response.status_code
+    return ElementTree.fromstring(response.data)
+
+
+def test_atom_and_rss_feeds(blog, client, add_post):
+    blog.app.config["SITE_URL"] = "https://example.com/"
+    add_post("blog", title="Fish & <chips>", content="<p>body \x07text</p>")
+    add_post("diary", title="A diary")
+
+    atom = parse(client.get("/feed.atom"))
+    entries = atom.findall(ATOM + "entry")
+    assert [entry.find(ATOM + "title").text for entry in entries] == ["A diary", "Fish & <chips>"]
+    assert entries[1].find(ATOM + "content").text == "<p>body text</p>"
+    assert entries[1].find(ATOM + "link").get("href").startswith("https://example.com/blog/")
+
+    rss = parse(client.get("/blogs/feed.rss"))
+    assert [item.find("title").text for item in rss.iter("item")] == ["Fish & <chips>"]
+    assert rss.find("channel/link").text == "https://example.com/blogs"
+
+
+def test_feed_follows_edits_and_deletes(blog, client, add_post):
+    post = add_post(title="Old title")
+    post.title = "New title"
+    blog.db.session.commit()
+    other = add_post(title="Deleted")
+    blog.db.session.delete(other)
+    blog.db.session.commit()
+    titles = [entry.find(ATOM + "title").text for entry in parse(client.get("/feed.atom")).iter(ATOM + "entry")]
+    assert titles == ["New title"]
+
+
+def test_spoofed_host_does_not_reach_other_visitors(client, add_post):
+    add_post()
+    spoofed = client.get("/feed.rss", headers={"Host": 'evil.example"><x a="'})
+    assert ElementTree.fromstring(spoofed.data).find("channel/link").text.startswith('http://evil.example"><x')
+    response = client.get("/feed.rss", base_url="http://blog.example")
+    assert response.headers["X-Cache"] == "MISS"
+    assert b"evil" not in response.data
+    assert b"http://blog.example/blog/" in response.data
+
+
+def test_feed_answers_304_until_a_post_changes(blog, client, add_post):
+    add_post()
+    etag = client.get("/feed.atom").headers["ETag"]
+    assert client.get("/feed.atom", headers={"If-None-Match": etag}).status_code == 304
+    blog.post_changed("blog", add_post().id)
+    assert client.get("/feed.atom", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_sitemap(blog, client, add_post):
+    post = add_post()
+    urls = [loc.text for loc in parse(client.get("/sitemap.xml")).iter(SITEMAP + "loc")]
+    assert "http://localhost/about" in urls
+    assert "http://localhost/blog/{}".format(post.id) in urls
+
+
+def test_big_sitemap_is_split_into_parts(blog, client, add_post, monkeypatch):
+    monkeypatch.setitem(blog.app.config, "SITEMAP_MAX_URLS", 4)
+    posts = [add_post("blog") for i in range(5)]
+    index = [loc.text for loc in parse(client.get("/sitemap.xml")).iter(SITEMAP + "loc")]
+    assert index == ["http://localhost/sitemap-pages.xml", "http://localhost/sitemap-blog-0.xml",
+                     "http://localhost/sitemap-blog-1.xml"]
+    part = [loc.text for loc in parse(client.get("/sitemap-blog-1.xml")).iter(SITEMAP + "loc")]
+    assert part == ["http://localhost/blog/{}".format(post.id) for post in posts[3:]]
+    assert client.get("/sitemap-blog-9.xml").status_code == 404
@@ -0,0 +1,42 @@
+import highlight
+from content import render_content
+
+CODE = '<pre class="prettyprint lang-py">def foo(a, b):\n    return a + b</pre>'
+
+
+def test_code_blocks_are_highlighted_with_their_css_only():
+    html, css = highlight.highlight_code_blocks("<p>x</p>" + CODE)
+    assert '<pre class="highlight"><span class="k">def</span>' in html
+    assert ".highlight .k {" in css
+    assert ".highlight .nc {" not in css  # no class names in the block
+    assert highlight.highlight_code_blocks("<p>no code</p>") == ("<p>no code</p>", "")
+
+
+def test_plain_text_blocks_are_left_alone():
+    html = "<pre>just some words</pre>"
+    assert highlight.highlight_code_blocks(html) == (html, "")
+
+
+def test_html_in_code_is_escaped():
+    html, css = highlight.highlight_code_blocks('<pre class="lang-html">&lt;b&gt;bold&lt;/b&gt;</pre>')
+    assert "&lt;" in html and "<b>" not in html
+
+
+def test_word_count_is_of_the_code_not_its_tokens():
+    rendered = render_content(CODE)
+    assert rendered.word_count == len("def foo(a, b): return a + b".split())
+    assert rendered.excerpt == "def foo(a, b): return a + b"
+    assert 'class="highlight"' in rendered.html and rendered.css
+
+
+def test_blocks_are_highlighted_once(monkeypatch):
+    highlight.highlight_block("py", "x = 1")
+    monkeypatch.setattr(highlight, "pygments_highlight", None)  # a new block would fail now
+    assert highlight.highlight_block("py", "x = 1")[0] is not None
+
+
+def test_post_page_has_the_css_of_its_code(client, add_post):
+    post = add_post(content=CODE)
+    html = client.get("/blog/{}".format(post.id)).get_data(as_text=True)
+    assert "<style>" in html and ".highlight .k {" in html
+    assert "run_prettify" not in html
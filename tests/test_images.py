@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from PIL import Image
+
+import images
+
+PROFILE = "assets/img/profile.jpg"
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    static = tmp_path / "static"
+    static.mkdir()
+    Image.new("RGB", (1000, 500), "red").save(str(static / "photo.png"))
+    (static / "notes.txt").write_text("not an image")
+    Image.new("RGB", (1000, 500), "blue").save(str(tmp_path / "outside.png"))
+    pipeline = images.ImagePipeline(str(static), str(tmp_path / "cache"), workers=1)
+    yield pipeline
+    pipeline.shutdown()
+
+
+def test_widths_are_smaller_allowed_ones_and_the_image_width(pipeline):
+    info = pipeline.source_info("photo.png")
+    assert (info.width, info.height) == (1000, 500)
+    assert pipeline.widths(info) == [320, 640, 960, 1000]
+    assert pipeline.widths(info, (100, 480, 1280)) == [480, 1000]
+
+
+def test_derivative_is_resized_and_kept(pipeline):
+    path = pipeline.derivative("photo.png", 640, "jpeg")
+    with Image.open(path) as image:
+        assert image.size == (640, 320)
+    assert pipeline.derivative("photo.png", 640, "jpeg") == path
+    assert pipeline.derivative("photo.png", 1000, "jpeg") is not None
+
+
+def test_other_widths_and_files_are_refused(pipeline):
+    assert pipeline.derivative("photo.png", 17, "jpeg") is None
+    assert pipeline.derivative("photo.png", 1280, "jpeg") is None  # bigger than the image
+    assert pipeline.derivative("photo.png", 640, "gif") is None
+    assert pipeline.derivative("notes.txt", 640, "jpeg") is None
+    assert pipeline.derivative("../outside.png", 640, "jpeg") is None
+
+
+def test_broken_images_are_not_resized(pipeline, tmp_path):
+    (tmp_path / "static" / "broken.jpg").write_bytes(b"not a jpeg")
+    assert pipeline.source_info("broken.jpg") is None
+    assert pipeline.derivative("broken.jpg", 320, "jpeg") is None
+
+
+def test_slow_resize_fails(pipeline):
+    with pytest.raises(images.DerivativeFailed):
+        pipeline.derivative("photo.png", 640, "jpeg", timeout=0)
+
+
+def test_rewrite_img_tags_makes_pictures_of_static_images(pipeline):
+    html = '<p><img src="/static/photo.png" alt="A"><img src="https://example.com/x.png"></p>'
+    rewritten = images.rewrite_img_tags(html, "/static", pipeline,
+                                        lambda filename: lambda width, fmt: "/img/{}/{}".format(width, fmt))
+    assert rewritten.count("<picture>") == 1
+    assert "/img/640/jpeg 640w" in rewritten
+    assert 'alt="A"' in rewritten and 'loading="lazy"' in rewritten
+    assert '<img src="https://example.com/x.png">' in rewritten
+
+
+def test_image_route_serves_allowed_widths_only(blog, client):
+    digest = blog.image_pipeline.source_info(PROFILE).digest
+    response = client.get("/img/160/jpeg/{}?v={}".format(PROFILE, digest))
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert client.get("/img/17/jpeg/{}".format(PROFILE)).status_code == 404
+    assert client.get("/img/4000/jpeg/{}".format(PROFILE)).status_code == 404
+    assert client.get("/img/160/jpeg/assets/img/missing.jpg").status_code == 404
+
+
+def test_original_is_served_when_resizing_fails(blog, client, monkeypatch):
+    def fail(filename, width, fmt):
+        raise images.DerivativeFailed("{} took too long".format(filename))
+    monkeypatch.setattr(blog.image_pipeline, "derivative", fail)
+    response = client.get("/img/160/jpeg/{}".format(PROFILE))
+    assert response.status_code == 200
+    with open(os.path.join(blog.app.static_folder, PROFILE), "rb") as f:
+        assert response.data == f.read()
+    assert "immutable" not in response.headers.get("Cache-Control", "")
+
+
+def test_about_page_links_only_served_widths(blog, client):
+    html = client.get("/about").get_data(as_text=True)
+    for width in images.ALLOWED_WIDTHS:
+        if "/img/{}/".format(width) in html:
+            assert client.get("/img/{}/jpeg/{}".format(width, PROFILE)).status_code == 200
+    assert "/img/160/" in html
@@ -0,0 +1,131 @@
+import smtplib
+import time
+
+import pytest
+
+from jobs import DEAD, DONE, QUEUED, JobQueue, PermanentJobError, Workers
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), max_attempts=2, retry_delay=10)
+
+
+def test_job_runs_with_its_payload(queue):
+    seen = []
+    queue.handler("echo")(seen.append)
+    queue.enqueue("echo", {"n": 1})
+    assert queue.run_pending() == {DONE: 1}
+    assert seen == [{"n": 1}]
+    assert queue.run_pending() == {}
+
+
+def test_failed_job_is_retried_later_then_dead(queue):
+    @queue.handler("broken")
+    def broken(payload):
+        raise OSError("smtp is down")
+
+    queue.enqueue("broken")
+    assert queue.run_pending() == {QUEUED: 1}
+    assert queue.claim() is None  # waits for its backoff
+    job = queue.claim(now=time.time() + 60)
+    assert job.attempts == 2
+    assert queue.run(job) == DEAD
+    [(job_id, kind, attempts, finished, error)] = queue.dead_letters()
+    assert kind == "broken" and attempts == 2 and "smtp is down" in error
+
+    assert queue.retry_dead() == 1
+    assert queue.stats() == {QUEUED: 1}
+
+
+def test_permanent_errors_and_unknown_kinds_are_dead_at_once(queue):
+    @queue.handler("rejected")
+    def rejected(payload):
+        raise PermanentJobError("550 no such user")
+
+    queue.enqueue("rejected")
+    queue.enqueue("unknown")
+    assert queue.run_pending() == {DEAD: 2}
+
+
+def test_job_of_a_dead_worker_is_claimed_after_its_lease(queue):
+    queue.enqueue("echo")
+    job = queue.claim()
+    assert queue.claim() is None
+    assert queue.claim(now=time.time() + queue.lease_seconds + 1).id == job.id
+
+
+def test_backoff_grows_until_the_limit(queue):
+    assert 8 <= queue.backoff(1) <= 12
+    assert 32 <= queue.backoff(3) <= 48
+    assert queue.backoff(30) <= queue.max_retry_delay * 1.2
+
+
+def test_workers_run_enqueued_jobs(queue):
+    seen = []
+    queue.handler("echo")(seen.append)
+    workers = Workers(queue, threads=2, poll_seconds=0.05)
+    workers.start()
+    try:
+        queue.enqueue("echo", 1)
+        deadline = time.time() + 5
+        while not seen and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        workers.stop()
+    assert seen == [1]
+
+
+def fake_smtp(monkeypatch, send):
+    """smtplib.SMTP which gives the messages to send() instead of a server."""
+
+    class SMTP:
+        def __init__(self, host, port, timeout):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def send_message(self, message):
+            send(message)
+    monkeypatch.setattr(smtplib, "SMTP", SMTP)
+
+
+def test_contact_form_sends_mail_in_a_job(blog, client, monkeypatch):
+    sent = []
+    fake_smtp(monkeypatch, sent.append)
+
+    response = client.post("/contact", data={"name": "Visitor", "email": "visitor@example.com",
+                                             "subject": "Hello", "message": "Nice blog"})
+    assert response.status_code == 200
+    assert sent == []  # the response didn't wait for it
+    assert blog.job_queue.run_pending(blog.app.app_context) == {DONE: 1}
+    assert sent[0]["Subject"] == "ozyalhan.com: Hello"
+    assert sent[0]["Reply-To"] == "Visitor <visitor@example.com>"
+    assert "Nice blog" in sent[0].get_content()
+
+
+def test_refused_recipient_is_a_permanent_error(blog, monkeypatch):
+    def refuse(message):
+        raise smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")})
+    fake_smtp(monkeypatch, refuse)
+
+    blog.job_queue.enqueue("send_mail", {"recipients": ["a@example.com"], "subject": "s", "body": "b"})
+    assert blog.job_queue.run_pending(blog.app.app_context) == {DEAD: 1}
+
+
+def test_contact_form_refuses_line_breaks_in_headers(blog, client):
+    response = client.post("/contact", data={"name": "Visitor", "email": "visitor@example.com",
+                                             "subject": "Hello\r\nBcc: someone@example.com", "message": "Hi"})
+    assert b"Please use a single line." in response.data
+    assert blog.job_queue.stats() == {}
+
+
+def test_malformed_header_is_a_permanent_error(blog, monkeypatch):
+    fake_smtp(monkeypatch, lambda message: None)
+    blog.job_queue.enqueue("send_mail", {"recipients": ["a@example.com"], "subject": "s\nBcc: b@example.com",
+                                         "body": "b"})
+    assert blog.job_queue.run_pending(blog.app.app_context) == {DEAD: 1}
@@ -0,0 +1,34 @@
+from sqlalchemy import event, inspect
+
+
+def statements_of(blog, f):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = blog.db.get_engine()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        f()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_list_query_leaves_bodies_unloaded(blog, add_post):
+    add_post(content="<p>{}</p>".format("long body " * 1000))
+    blog.db.session.expunge_all()
+    post = blog.list_query(blog.Blogs).one()
+    unloaded = inspect(post).unloaded
+    assert {"content", "content_html"} <= unloaded
+    assert not set(blog.LIST_COLUMNS) & unloaded
+
+
+def test_listing_pages_do_not_select_bodies(blog, client, add_post):
+    for kind, path in (("blog", "/blogs"), ("diary", "/diaries"), ("project", "/projects")):
+        table = blog.POST_TABLES[kind]
+        add_post(kind)
+        statements = statements_of(blog, lambda: client.get(path))
+        selects = [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM " + table in s]
+        assert selects, path
+        assert not any(".content," in s or ".content " in s or "content_html" in s for s in selects), path
@@ -0,0 +1,81 @@
+import re
+
+import pytest
+
+from metrics import Histogram, RequestMetrics, RequestTimer, slow_request_report
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+    assert list(histogram.cumulative()) == [(1, 2), (2, 3), (float("inf"), 4)]
+    assert histogram.sum == 6.0
+
+
+def test_prometheus_text():
+    request_metrics = RequestMetrics()
+    timer = RequestTimer(0, keep_statements=False)
+    timer.query("SELECT 1", 0.001)
+    timer.query("SELECT 2", 0.001)
+    timer.status = 200
+    request_metrics.observe('we"ird', "GET", timer, 0.02)
+    text = request_metrics.prometheus()
+    assert 'http_request_duration_seconds_bucket{endpoint="we\\"ird",method="GET",le="0.025"} 1' in text
+    assert 'db_queries_per_request_bucket{endpoint="we\\"ird",method="GET",le="2"} 1' in text
+    assert 'http_requests_total{endpoint="we\\"ird",method="GET",status="200"} 1' in text
+
+
+def test_slow_request_report_lists_slowest_statements_first():
+    timer = RequestTimer(0, keep_statements=True)
+    timer.query("SELECT fast", 0.001)
+    timer.query("SELECT\n  slow", 0.5)
+    lines = slow_request_report("GET", "/blogs", "blogs", 0.6, timer).splitlines()
+    assert "2 queries" in lines[0]
+    assert lines[1].endswith("SELECT slow") and lines[2].endswith("SELECT fast")
+
+
+@pytest.fixture
+def metrics_token(blog):
+    blog.app.config["METRICS_TOKEN"] = "secret"
+    blog.request_metrics.reset()
+    return "secret"
+
+
+def test_metrics_is_hidden_without_a_token(blog, client):
+    assert client.get("/metrics").status_code == 404
+    blog.app.debug = True
+    try:
+        assert client.get("/metrics").status_code == 200
+    finally:
+        blog.app.debug = False
+
+
+def test_metrics_needs_the_token(client, metrics_token):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer \u00e9"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer " + metrics_token})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-store"
+
+
+def test_metrics_token_is_compared_in_constant_time(blog, client, metrics_token, monkeypatch):
+    compared = []
+
+    def compare_digest(a, b):
+        compared.append((a, b))
+        return a == b
+    monkeypatch.setattr(blog.hmac, "compare_digest", compare_digest)
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert compared == [(b"Bearer wrong", ("Bearer " + metrics_token).encode())]
+
+
+def test_requests_are_counted_with_their_queries(client, add_post, metrics_token):
+    post = add_post()
+    client.get("/blog/{}".format(post.id))
+    client.get("/blog/{}".format(post.id))
+    text = client.get("/metrics", headers={"Authorization": "Bearer " + metrics_token}).get_data(as_text=True)
+    assert 'http_requests_total{endpoint="blog",method="GET",status="200"} 2' in text
+    queries = re.search(r'db_queries_per_request_sum\{endpoint="blog",method="GET"\} (\d+)', text)
+    assert int(queries.group(1)) > 0
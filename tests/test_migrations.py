@@ -0,0 +1,46 @@
+import os
+import shutil
+
+from sqlalchemy import create_engine, text
+
+import migrations
+import search as fts
+from conftest import ROOT
+
+
+def old_database(tmp_path):
+    """Copy of the shipped database, which is at schema version 0."""
+
+    path = tmp_path / "old.db"
+    shutil.copy(os.path.join(ROOT, "ozy_blog.db"), path)
+    return create_engine("sqlite:///" + str(path))
+
+
+def test_old_database_migrates_to_the_latest_version(tmp_path):
+    engine = old_database(tmp_path)
+    with engine.connect() as connection:
+        assert migrations.current_version(connection) == 0
+        posts = connection.execute(text("SELECT count(*) FROM blogs")).scalar()
+
+    applied = migrations.migrate(engine, log=lambda message: None)
+    assert applied == list(range(1, migrations.latest_version() + 1))
+    with engine.connect() as connection:
+        assert migrations.current_version(connection) == migrations.latest_version()
+        assert migrations.column_exists(connection, "blogs", "content_html")
+        indexed = connection.execute(text("SELECT count(*) FROM {} WHERE kind = 'blog'"
+                                          .format(fts.SEARCH_TABLE))).scalar()
+    assert indexed == posts
+    assert migrations.migrate(engine, log=lambda message: None) == []
+
+
+def test_hot_queries_use_indexes(blog):
+    result = blog.app.test_cli_runner().invoke(blog.check_indexes_command)
+    assert result.exit_code == 0, result.output
+    assert "FAIL" not in result.output
+
+
+def test_plan_problems():
+    assert migrations.plan_problems(["SCAN blogs"]) == ["SCAN blogs"]
+    assert migrations.plan_problems(["SCAN blogs USING INDEX ix_blogs_publish_date"]) == []
+    assert migrations.plan_problems(["SCAN blogs USING INDEX ix_blogs_publish_date"], must_search=True)
+    assert migrations.plan_problems(["USE TEMP B-TREE FOR ORDER BY"])
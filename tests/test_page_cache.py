@@ -0,0 +1,72 @@
+from cache import PageCache
+
+
+def test_lru_and_size_limits():
+    cache = PageCache(max_entries=2, max_bytes=10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    cache.get("a")
+    cache.set("c", b"1234")  # b is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    cache.set("d", b"123456789")
+    assert len(cache) == 1
+    cache.set("e", b"12345678901")  # bigger than the cache, not saved
+    assert cache.get("e") is None
+
+
+def test_invalidate_drops_pages_of_the_tags_only():
+    cache = PageCache()
+    cache.set("/blog/1", b"x", tags=["blog:1"])
+    cache.set("/blogs", b"x", tags=["blogs"])
+    cache.set("/about", b"x", tags=["about"])
+    cache.invalidate("blog:1", "blogs")
+    assert cache.get("/blog/1") is None
+    assert cache.get("/blogs") is None
+    assert cache.get("/about") is not None
+
+
+def test_expired_page_is_a_miss():
+    cache = PageCache(ttl=-1)
+    cache.set("/about", b"x")
+    assert cache.get("/about") is None
+
+
+def test_public_pages_are_cached(client, add_post):
+    post = add_post(title="Cached")
+    first = client.get("/blog/{}".format(post.id))
+    second = client.get("/blog/{}".format(post.id))
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_edit_invalidates_the_pages_of_the_post(blog, client, login, add_post):
+    post = add_post(title="Before edit")
+    visitor = blog.app.test_client()
+    visitor.get("/blog/{}".format(post.id))
+    visitor.get("/blogs")
+    login()
+    client.post("/edit-blog/{}".format(post.id), data={"title": "After edit", "content": "<p>new</p>"})
+
+    page = visitor.get("/blog/{}".format(post.id))
+    assert page.headers["X-Cache"] == "MISS"
+    assert b"After edit" in page.data
+    listing = visitor.get("/blogs")
+    assert listing.headers["X-Cache"] == "MISS"
+    assert b"After edit" in listing.data
+
+
+def test_logged_in_users_bypass_the_cache(client, login, add_post):
+    post = add_post()
+    client.get("/blog/{}".format(post.id))
+    login()
+    assert "X-Cache" not in client.get("/blog/{}".format(post.id)).headers
+
+
+def test_pages_are_cached_per_host(client, add_post):
+    add_post()
+    assert client.get("/blogs", base_url="http://one.example").headers["X-Cache"] == "MISS"
+    assert client.get("/blogs", base_url="http://two.example").headers["X-Cache"] == "MISS"
+    assert client.get("/blogs", base_url="http://one.example").headers["X-Cache"] == "HIT"
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+
+
+def test_cursor_round_trip(blog, add_post):
+    post = add_post()
+    assert decode_cursor(encode_cursor(post)) == (post.publish_date, post.id)
+    assert decode_cursor("garbage") is None
+    assert decode_cursor("") is None
+
+
+def test_pages_walk_every_post_once(blog, add_post):
+    same_time = datetime(2021, 1, 1)
+    ids = [add_post().id for _ in range(7)] + [add_post(publish_date=same_time).id for _ in range(5)]
+
+    seen, after = [], None
+    while True:
+        page = keyset_paginate(blog.list_query(blog.Blogs), blog.Blogs, after=after, per_page=3)
+        seen += [post.id for post in page]
+        if page.next_cursor is None:
+            break
+        after = page.next_cursor
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+
+
+def test_before_cursor_goes_back_to_the_same_page(blog, add_post):
+    for _ in range(9):
+        add_post()
+    first = keyset_paginate(blog.list_query(blog.Blogs), blog.Blogs, per_page=4)
+    second = keyset_paginate(blog.list_query(blog.Blogs), blog.Blogs, after=first.next_cursor, per_page=4)
+    back = keyset_paginate(blog.list_query(blog.Blogs), blog.Blogs, before=second.prev_cursor, per_page=4)
+    assert [post.id for post in back] == [post.id for post in first]
+    assert first.prev_cursor is None
+
+
+def test_listing_links_to_the_next_page(client, add_post):
+    posts = [add_post(title="post {}".format(i)) for i in range(5)]
+    html = client.get("/blogs?per_page=2").get_data(as_text=True)
+    assert "post 4" in html and "post 2" not in html
+    assert "after=" + encode_cursor(posts[3]) in html
@@ -0,0 +1,62 @@
+import pytest
+
+import passwords
+from passwords import HasherBusy, PasswordHasher
+
+
+def test_verify_password():
+    hashed = passwords.hash_password("secret", 1000)
+    assert passwords.verify_password("secret", hashed, 1000) == (True, None)
+    assert passwords.verify_password("wrong", hashed, 1000) == (False, None)
+    assert passwords.verify_password("secret", "not a hash", 1000) == (False, None)
+
+
+def test_verify_gives_a_new_hash_for_other_rounds():
+    matched, new_hash = passwords.verify_password("secret", passwords.hash_password("secret", 2000), 1000)
+    assert matched
+    assert passwords.hash_rounds(new_hash) == 1000
+    assert passwords.verify_password("secret", new_hash, 1000) == (True, None)
+
+
+def test_hasher_rejects_work_when_it_is_full():
+    hasher = PasswordHasher(rounds=1000, workers=1, max_waiting=0, wait_timeout=0)
+    try:
+        assert hasher.verify("secret", hasher.hash("secret")) == (True, None)
+        hasher._slots.acquire()
+        with pytest.raises(HasherBusy):
+            hasher.hash("secret")
+    finally:
+        hasher.shutdown()
+
+
+@pytest.fixture
+def user(blog):
+    user = blog.Users(fullname="Ozy", username="ozy", email="ozy@example.com",
+                      password=passwords.hash_password("secret", 2000))
+    blog.db.session.add(user)
+    blog.db.session.commit()
+    return user
+
+
+def test_login_upgrades_the_hash(blog, client, user):
+    response = client.post("/login", data={"useremail": "ozy@example.com", "userpassword": "secret"})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session["logged_in"] and session["username"] == "ozy"
+    blog.db.session.expire_all()
+    assert passwords.hash_rounds(blog.Users.query.get(user.id).password) == blog.password_hasher.rounds
+
+
+def test_wrong_password_does_not_log_in(blog, client, user):
+    client.post("/login", data={"useremail": "ozy@example.com", "userpassword": "wrong"})
+    with client.session_transaction() as session:
+        assert "logged_in" not in session
+    blog.db.session.expire_all()
+    assert passwords.hash_rounds(blog.Users.query.get(user.id).password) == 2000
+
+
+def test_register_stores_a_hash(blog, client):
+    client.post("/register", data={"fullname": "New user", "username": "newuser", "email": "new.user@example.com",
+                                   "password": "secret1", "confirm": "secret1"})
+    user = blog.Users.query.filter_by(username="newuser").one()
+    assert passwords.verify_password("secret1", user.password, blog.password_hasher.rounds) == (True, None)
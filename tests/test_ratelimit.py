@@ -0,0 +1,65 @@
+import pytest
+
+from ratelimit import MemoryBuckets, RateLimiter, SQLiteBuckets
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets()
+    return SQLiteBuckets(str(tmp_path / "buckets.db"))
+
+
+def test_bucket_allows_a_burst_then_refills(storage):
+    assert [storage.take("k", 2, 1.0, 100)[0] for i in range(3)] == [True, True, False]
+    assert storage.take("other", 2, 1.0, 100)[0]
+    assert storage.take("k", 2, 1.0, 101)[0]
+    assert not storage.take("k", 2, 1.0, 101)[0]
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    first = SQLiteBuckets(str(tmp_path / "buckets.db"))
+    second = SQLiteBuckets(str(tmp_path / "buckets.db"))
+    assert first.take("k", 1, 0.0, 100)[0]
+    assert not second.take("k", 1, 0.0, 100)[0]
+
+
+def test_memory_buckets_drop_the_least_recently_used():
+    buckets = MemoryBuckets(max_keys=2)
+    buckets.take("a", 1, 0.0, 100)
+    buckets.take("b", 1, 0.0, 100)
+    buckets.take("c", 1, 0.0, 100)
+    assert buckets.take("a", 1, 0.0, 100)[0]  # forgotten, full again
+    assert not buckets.take("c", 1, 0.0, 100)[0]
+
+
+def test_limiter_tells_when_to_retry():
+    limiter = RateLimiter(MemoryBuckets(), burst=1, per_minute=6)
+    assert limiter.take("k") == (True, 0)
+    allowed, retry_after = limiter.take("k")
+    assert not allowed and 1 <= retry_after <= 11
+    assert RateLimiter(MemoryBuckets(), burst=0, per_minute=0).take("k") == (False, 60)
+
+
+def test_login_is_throttled_per_account_before_hashing(blog, client, monkeypatch):
+    def verify(secret, hashed):
+        raise AssertionError("password hashed for a throttled login")
+
+    data = {"useremail": "Someone@example.com", "userpassword": "guess"}
+    burst = blog.app.config["LOGIN_EMAIL_BURST"]
+    for i in range(burst):
+        assert client.post("/login", data=data).status_code == 302  # no such user
+    monkeypatch.setattr(blog.password_hasher, "verify", verify)
+    response = client.post("/login", data=dict(data, useremail=" someone@example.com"))
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert client.post("/login", data=dict(data, useremail="other@example.com")).status_code == 302
+
+
+def test_login_is_throttled_per_address(blog, client):
+    burst = blog.app.config["LOGIN_IP_BURST"]
+    statuses = [client.post("/login", data={"useremail": "user{}@example.com".format(i), "userpassword": "x"},
+                            environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code for i in range(burst + 1)]
+    assert statuses[-1] == 429 and 429 not in statuses[:-1]
+    assert client.post("/login", data={"useremail": "a@example.com", "userpassword": "x"},
+                       environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 302
@@ -0,0 +1,130 @@
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+
+import migrations
+import related
+from jobs import DONE
+
+TOPICS = {
+    "wal": ("Sqlite WAL", "<p>sqlite wal journal checkpoint</p>"),
+    "locks": ("Sqlite locks", "<p>sqlite wal locking busy</p>"),
+    "jinja": ("Jinja templates", "<p>flask jinja template render</p>"),
+    "blueprints": ("Blueprints", "<p>flask jinja blueprint routes</p>"),
+    "avif": ("Avif images", "<p>pillow avif webp resize</p>"),
+    "thumbnails": ("Thumbnails", "<p>pillow avif thumbnail crop</p>"),
+}
+
+
+def add_topics(add_post):
+    return {name: add_post("diary" if name == "locks" else "blog", title=title, content=content).id
+            for name, (title, content) in TOPICS.items()}
+
+
+def run_jobs(blog):
+    return blog.job_queue.run_pending(blog.app.app_context)
+
+
+def related_ids(blog, kind, id):
+    with blog.db.engine.connect() as connection:
+        return [(other.kind, other.id) for other in related.related_posts(connection, kind, id, 5)]
+
+
+def stored(blog):
+    return blog.db.session.execute(text(
+        "SELECT kind, post_id, rank, related_kind, related_id FROM related_posts ORDER BY kind, post_id, rank"
+    )).fetchall()
+
+
+def test_terms_of():
+    assert related.terms_of("Flask caching", "<p>The flask cache of 2020 is ok</p>") == Counter(
+        {"flask": 4, "caching": 3, "cache": 1})
+
+
+def test_tfidf_matrix_has_the_weights_of_the_dicts():
+    pytest.importorskip("scipy")
+    documents = [related.terms_of(title, content) for title, content in TOPICS.values()] + [Counter()]
+    vocabulary, matrix = related.tfidf(documents)
+    dict_vocabulary, vectors = related._tfidf_dicts(documents)
+    assert set(vocabulary) == set(dict_vocabulary)
+    for row, vector in enumerate(vectors):
+        weights = dict(zip(matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]],
+                           matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]]))
+        assert weights == pytest.approx({vocabulary[term]: vector[column] for term, column in dict_vocabulary.items()
+                                         if column in vector})
+
+
+def test_posts_are_related_by_their_words(blog, add_post):
+    ids = add_topics(add_post)
+    blog.job_queue.enqueue("rebuild_related")
+    run_jobs(blog)
+    assert related_ids(blog, "blog", ids["wal"]) == [("diary", ids["locks"])]
+    assert related_ids(blog, "blog", ids["jinja"]) == [("blog", ids["blueprints"])]
+    assert related_ids(blog, "blog", ids["thumbnails"]) == [("blog", ids["avif"])]
+
+
+def test_updates_give_the_same_lists_as_a_rebuild(blog, add_post):
+    ids = add_topics(add_post)
+    blog.job_queue.enqueue("rebuild_related")
+    run_jobs(blog)
+    new = add_post(title="Sqlite vacuum", content="<p>sqlite wal vacuum pillow</p>").id
+    blog.post_changed("blog", new)
+    blog.db.session.delete(blog.Blogs.query.get(ids["blueprints"]))
+    blog.db.session.commit()
+    blog.post_changed("blog", ids["blueprints"])
+    run_jobs(blog)
+    assert ("blog", new) in related_ids(blog, "blog", ids["wal"])
+    updated = stored(blog)
+    assert not [row for row in updated if ("blog", ids["blueprints"]) in ((row.kind, row.post_id),
+                                                                         (row.related_kind, row.related_id))]
+
+    with blog.db.engine.begin() as connection:
+        related.rebuild_related(connection, related.Corpus(), blog.POST_TABLES, 5)
+    assert stored(blog) == updated
+
+
+def test_migration_leaves_the_lists_to_a_job(blog, add_post):
+    ids = add_topics(add_post)
+    with blog.db.engine.begin() as connection:
+        connection.execute(text("DROP TABLE {}".format(related.RELATED_TABLE)))
+        connection.execute(text("DROP TABLE {}".format(related.VERSIONS_TABLE)))
+        connection.execute(text("PRAGMA user_version = {:d}".format(migrations.RELATED_POSTS_VERSION - 1)))
+    blog.migrate_database()
+    assert stored(blog) == []
+    assert run_jobs(blog) == {DONE: 1}
+    assert related_ids(blog, "blog", ids["wal"]) == [("diary", ids["locks"])]
+
+
+def test_corpus_reads_changed_posts_only(blog, add_post, monkeypatch):
+    ids = add_topics(add_post)
+    corpus = related.Corpus()
+    with blog.db.engine.connect() as connection:
+        corpus.load(connection, blog.POST_TABLES)
+        tokenized = []
+        monkeypatch.setattr(related, "terms_of", lambda title, html: tokenized.append(title) or Counter())
+        blog.db.session.execute(text("UPDATE blogs SET last_modified = '2030-01-01 00:00:00.000000' WHERE id = :id"),
+                                {"id": ids["wal"]})
+        blog.db.session.commit()
+        keys, titles, documents = corpus.load(connection, blog.POST_TABLES)
+    assert tokenized == ["Sqlite WAL"]
+    assert len(keys) == len(TOPICS)
+
+
+def test_post_page_shows_related_and_changes_its_etag(blog, client, add_post):
+    ids = add_topics(add_post)
+    blog.job_queue.enqueue("rebuild_related")
+    run_jobs(blog)
+    path = "/blog/{}".format(ids["wal"])
+    first = client.get(path)
+    assert "Sqlite locks" in first.get_data(as_text=True)
+    etag = first.headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    new = add_post(title="Sqlite vacuum", content="<p>sqlite wal vacuum</p>").id
+    blog.post_changed("blog", new)
+    run_jobs(blog)
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "MISS"
+    assert "Sqlite vacuum" in response.get_data(as_text=True)
@@ -0,0 +1,41 @@
+import search as fts
+
+
+def test_fts_query_makes_safe_prefix_terms():
+    assert fts.fts_query('flask" OR title:*') == '"flask"* "OR"* "title"*'
+    assert fts.fts_query("  ") is None
+
+
+def test_search_finds_posts_by_word_prefix_and_kind(blog, add_post):
+    blog_post = add_post("blog", title="Caching pages", content="<p>flask sqlite</p>")
+    diary_post = add_post("diary", title="Locks", content="<p>sqlite busy timeout</p>")
+    add_post("project", title="Other", content="<p>nothing here</p>")
+
+    hits = fts.search(blog.db.session, "sqlit").hits
+    assert {(hit.kind, hit.id) for hit in hits} == {("blog", blog_post.id), ("diary", diary_post.id)}
+    hits = fts.search(blog.db.session, "sqlite", kinds=["diary"]).hits
+    assert [(hit.kind, hit.id) for hit in hits] == [("diary", diary_post.id)]
+
+
+def test_title_hits_rank_first(blog, add_post):
+    in_body = add_post(title="Notes", content="<p>pagination pagination</p>")
+    in_title = add_post(title="Pagination", content="<p>notes</p>")
+    hits = fts.search(blog.db.session, "pagination").hits
+    assert [hit.id for hit in hits] == [in_title.id, in_body.id]
+
+
+def test_index_follows_edits_and_deletes(blog, add_post):
+    post = add_post(content="<p>before</p>")
+    post.content = "<p>after</p>"
+    blog.db.session.commit()
+    assert not fts.search(blog.db.session, "before").hits
+    assert fts.search(blog.db.session, "after").hits
+    blog.db.session.delete(post)
+    blog.db.session.commit()
+    assert not fts.search(blog.db.session, "after").hits
+
+
+def test_search_page(client, add_post):
+    add_post(title="Unique needle")
+    html = client.get("/search?q=needle").get_data(as_text=True)
+    assert "<mark>needle</mark>" in html
@@ -0,0 +1,57 @@
+import threading
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+import config
+
+
+def test_engine_options_of_a_sqlite_file():
+    options = config.engine_options("sqlite:///blog.db")
+    assert options["poolclass"] is QueuePool
+    assert options["connect_args"]["check_same_thread"] is False
+    assert config.engine_options("sqlite://") == {}
+    assert "poolclass" not in config.engine_options("postgresql://localhost/blog")
+
+
+def test_pragmas_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "FULL")
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "250")
+    pragmas = config.sqlite_pragmas()
+    assert pragmas["synchronous"] == "FULL"
+    assert pragmas["busy_timeout"] == 250
+    assert pragmas["journal_mode"] == "WAL"
+
+
+def test_connections_get_the_pragmas(blog):
+    engine = blog.db.get_engine()
+    assert isinstance(engine.pool, QueuePool)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert connection.execute(text("PRAGMA foreign_keys")).scalar() == 0
+
+
+def test_other_engines_keep_sqlite_defaults(blog, tmp_path):
+    engine = create_engine("sqlite:///" + str(tmp_path / "other.db"))
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 2  # FULL
+    engine.dispose()
+
+
+def test_pooled_connections_work_from_other_threads(blog, add_post):
+    add_post()
+    engine = blog.db.get_engine()
+    counts = []
+
+    def count():
+        with engine.connect() as connection:
+            counts.append(connection.execute(text("SELECT count(*) FROM blogs")).scalar())
+    threads = [threading.Thread(target=count) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counts == [1, 1, 1, 1]
@@ -0,0 +1,52 @@
+import os
+
+import static_export
+
+
+def export(blog, out_dir, **options):
+    return static_export.export_site(blog.public_pages(), str(out_dir), blog.app.static_folder,
+                                     workers=1, log=lambda message: None, **options)
+
+
+def test_page_file():
+    assert static_export.page_file("build", "/") == os.path.join("build", "index.html")
+    assert static_export.page_file("build", "/blog/5") == os.path.join("build", "blog", "5", "index.html")
+
+
+def test_export_writes_pages_images_and_static_files(blog, add_post, tmp_path):
+    post = add_post(title="Exported post")
+    rendered, deleted, failed = export(blog, tmp_path)
+    assert not failed and not deleted
+    assert {"/", "/about", "/blogs", "/blog/{}".format(post.id)} <= set(rendered)
+    with open(tmp_path / "blog" / str(post.id) / "index.html") as f:
+        assert "Exported post" in f.read()
+    # resized copies of the profile photo of the about page
+    assert os.listdir(tmp_path / "img" / "160")
+    assert (tmp_path / "static" / "assets" / "img" / "profile.jpg").exists()
+
+
+def test_second_export_renders_only_changed_pages(blog, add_post, tmp_path):
+    post = add_post()
+    other = add_post()
+    export(blog, tmp_path)
+    assert export(blog, tmp_path) == ([], [], [])
+
+    blog.db.session.delete(other)
+    blog.db.session.commit()
+    rendered, deleted, failed = export(blog, tmp_path)
+    assert deleted == ["/blog/{}".format(other.id)]
+    assert "/blogs" in rendered and "/blog/{}".format(post.id) not in rendered
+    assert not (tmp_path / "blog" / str(other.id) / "index.html").exists()
+
+
+def test_related_list_changes_export_the_post_again(blog, add_post, tmp_path):
+    id = add_post(title="Sqlite WAL", content="<p>sqlite wal journal checkpoint</p>").id
+    add_post(title="Sqlite locks", content="<p>sqlite wal locking busy</p>")
+    add_post(title="Jinja", content="<p>flask jinja template render</p>")
+    export(blog, tmp_path)
+    blog.job_queue.enqueue("rebuild_related")
+    blog.job_queue.run_pending(blog.app.app_context)
+    rendered, deleted, failed = export(blog, tmp_path)
+    assert "/blog/{}".format(id) in rendered
+    with open(tmp_path / "blog" / str(id) / "index.html") as f:
+        assert "Sqlite locks" in f.read()
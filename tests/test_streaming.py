@@ -0,0 +1,42 @@
+from pagination import LazyRows
+
+
+def test_dashboard_is_streamed_with_the_posts_of_the_user(client, login, add_post):
+    add_post("blog", title="Mine")
+    add_post("diary", title="Theirs", author="someone")
+    login()
+    response = client.get("/dashboard")
+    assert response.is_streamed
+    html = response.get_data(as_text=True)
+    assert "Mine" in html and "Theirs" not in html
+
+
+def test_flash_is_shown_once_after_a_streamed_page(client, login, add_post):
+    post = add_post()
+    login()
+    client.post("/edit-blog/{}".format(post.id), data={"title": "Edited", "content": "<p>x</p>"})
+    message = "Your Blog Post has been updated successfuly."
+    assert message in client.get("/dashboard").get_data(as_text=True)
+    assert message not in client.get("/dashboard").get_data(as_text=True)
+
+
+def test_streamed_listings_are_not_cached(blog, client, add_post):
+    blog.app.config["STREAM_LISTINGS"] = True
+    add_post(title="Streamed")
+    for i in range(2):
+        response = client.get("/blogs")
+        assert response.is_streamed
+        assert "X-Cache" not in response.headers
+        assert "Streamed" in response.get_data(as_text=True)
+    assert len(blog.page_cache) == 0
+
+
+def test_streamed_listing_reads_rows_lazily(blog, add_post):
+    for i in range(3):
+        add_post()
+    with blog.app.test_request_context("/blogs?per_page=2"):
+        page = blog.paginate_posts(blog.Blogs, stream=True)
+        assert isinstance(page.items, LazyRows)
+        assert page.items and page.next_cursor is None  # known after the rows are read
+        assert len(list(page.items)) == 2
+        assert page.next_cursor is not None
@@ -0,0 +1,85 @@
+import time
+
+from suggest import TitleIndex, normalize, title_keys
+
+
+def test_normalize():
+    assert normalize("Çözüm  İçin ılık") == "cozum icin ilik"
+    assert normalize(None) == ""
+
+
+def test_title_keys_start_at_every_word():
+    assert title_keys("Flask  Page cache") == ["flask page cache", "page cache", "cache"]
+
+
+def index_of(titles, **options):
+    return TitleIndex(lambda: [(kind, id, title) for (kind, id), title in titles.items()], **options)
+
+
+def test_search_ranks_title_starts_then_words():
+    index = index_of({("blog", 1): "Caching pages", ("blog", 2): "Page cache", ("diary", 3): "Cache",
+                      ("project", 4): "Other"})
+    assert [(s.kind, s.id) for s in index.search("cach")] == [("diary", 3), ("blog", 1), ("blog", 2)]
+    assert [s.id for s in index.search("cache", kinds=["blog"])] == [2]
+    assert [s.id for s in index.search("CACH", limit=1)] == [3]
+    assert index.search("  ") == []
+    assert index.search("page cache")[0].id == 2
+
+
+def test_title_starts_are_not_crowded_out_by_words():
+    titles = {("blog", id): "Notes on python {}".format(id) for id in range(1, 21)}
+    titles[("blog", 21)] = "Python tips"
+    index = index_of(titles, max_scan=5)
+    assert index.search("python")[0].id == 21
+    index.put("blog", 22, "Python")
+    assert [s.id for s in index.search("python", limit=2)] == [22, 21]
+    index.remove("blog", 22)
+    assert [s.id for s in index.search("python", limit=2)][0] == 21
+
+
+def test_put_and_remove():
+    index = index_of({("blog", 1): "Old title"})
+    index.search("x")  # loads it
+    index.put("blog", 1, "New title")
+    index.put("blog", 2, "Another title")
+    assert [s.id for s in index.search("title")] == [1, 2]  # shorter title first
+    assert index.search("old") == []
+    index.remove("blog", 1)
+    assert [s.id for s in index.search("title")] == [2]
+    assert len(index) == 1
+
+
+def test_stale_index_reloads_in_the_background():
+    titles = {("blog", 1): "First"}
+    index = index_of(titles, max_age=0)
+    assert [s.id for s in index.search("first")] == [1]
+    titles[("blog", 2)] = "First again"
+    index.search("first")  # answered from the old index, reload starts
+    deadline = time.time() + 5
+    while len(index) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert [s.id for s in index.search("first")] == [1, 2]
+
+
+def test_suggest_route_follows_post_changes(blog, client, add_post):
+    post = add_post(title="Keyset pagination")
+    response = client.get("/suggest?q=pag")
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.get_json() == [{"title": "Keyset pagination", "kind": "blog",
+                                    "url": "/blog/{}".format(post.id)}]
+
+    diary = add_post("diary", title="Paging bugs")
+    blog.post_changed("diary", diary.id)
+    assert [s["kind"] for s in client.get("/suggest?q=pag").get_json()] == ["diary", "blog"]
+    assert [s["kind"] for s in client.get("/suggest?q=pag&kind=blog").get_json()] == ["blog"]
+
+    blog.db.session.delete(diary)
+    blog.db.session.commit()
+    blog.post_changed("diary", diary.id)
+    assert [s["kind"] for s in client.get("/suggest?q=pag").get_json()] == ["blog"]
+
+
+def test_search_pages_ask_for_suggestions(client, add_post):
+    add_post()
+    html = client.get("/blogs").get_data(as_text=True)
+    assert "data-suggest" in html and "/static/js/autocomplete.js" in html